@@ -0,0 +1,78 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from wmda_match.modules.allele_dictionary import normalize_allele, truncate_allele, encode_person_data
+
+
+class TestAlleleDictionary(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "sample_data.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            CREATE TABLE person_data (
+                DONN_NUMERO INTEGER PRIMARY KEY,
+                Ax TEXT, Ay TEXT, Bx TEXT, By TEXT, Cx TEXT, Cy TEXT,
+                DRB1x TEXT, DRB1y TEXT, DQB1x TEXT, DQB1y TEXT
+            )
+        ''')
+        conn.executemany("INSERT INTO person_data VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+            (2255001, '01:01:01:01', '24:07:01:01', '15:02:01', '15:17:01', '07:01:02', '08:01:01',
+             '13:02:01', '15:01:01', '05:02:01', '06:04:01'),
+            (7381341, '01:01:01', '02:01:01', '08:01:01', '35:01:01', '04:01:01', '07:01:01',
+             '01:01:01', '03:01:01', '02:01:01', '05:01:01'),
+            (1408174, 'A*01:01:01', '31:01:02:01', '07:02:01', '44:02:01', '05:01:01', '07:02:01',
+             '04:01:01', '04:01:01', '03:01:01:01', None),
+        ])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_normalize_allele(self):
+        self.assertEqual(normalize_allele(" A*1:01:01 "), "01:01:01")
+        self.assertEqual(normalize_allele("HLA-DRB1*15:01"), "15:01")
+        self.assertEqual(normalize_allele("01:01:01:02N"), "01:01:01:02N")
+        self.assertIsNone(normalize_allele(""))
+        # Values that are not allele fields are passed through unchanged
+        self.assertEqual(normalize_allele("A1"), "A1")
+        self.assertEqual(normalize_allele("DRB1_1"), "DRB1_1")
+
+    def test_truncate_allele(self):
+        self.assertEqual(truncate_allele("01:01:01:01", 2), "01:01")
+        # The expression suffix is dropped with the fields it belongs to
+        self.assertEqual(truncate_allele("01:01:01:02N", 2), "01:01")
+        self.assertEqual(truncate_allele("A*01:01:01:01N", 1), "01")
+        self.assertEqual(truncate_allele("01:01:01:02N", 4), "01:01:01:02N")
+        self.assertIsNone(truncate_allele("01:01:01", 4))
+        self.assertIsNone(truncate_allele("A1", 1))
+
+    def test_encode_person_data(self):
+        self.assertEqual(encode_person_data(self.db_path), 3)
+
+        conn = sqlite3.connect(self.db_path)
+        codes = dict(conn.execute("SELECT DONN_NUMERO, Ax_code FROM person_data"))
+        # The same A allele typed with and without the locus prefix shares one ID
+        self.assertEqual(codes[7381341], codes[1408174])
+        self.assertNotEqual(codes[2255001], codes[7381341])
+
+        # Equality join at 2-field resolution across 3-field and 4-field typings
+        matched = conn.execute('''
+            SELECT COUNT(*) FROM person_data p JOIN hla_alleles h ON h.id = p.Ax_code WHERE h.field2 = '01:01'
+        ''').fetchone()[0]
+        self.assertEqual(matched, 3)
+
+        dqb1 = conn.execute("SELECT DQB1y, DQB1y_code FROM person_data WHERE DONN_NUMERO = 1408174").fetchone()
+        self.assertEqual(dqb1, (None, None))
+        conn.close()
+
+        # Already encoded rows are skipped on the next run
+        self.assertEqual(encode_person_data(self.db_path), 0)
+        self.assertEqual(encode_person_data(self.db_path, reencode=True), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+import os
+import asyncio
+import unittest
+from unittest.mock import MagicMock, patch
+import httpx
+from wmda_match.modules.async_client import AsyncWMDAClient, fetch_search_summaries
+from wmda_match.modules.rate_limiter import RateLimiter
+
+
+def make_provider(token='async_token', cached=None):
+    provider = MagicMock()
+    provider.get_token.return_value = token
+    provider.cached_token.return_value = cached
+    return provider
+
+
+class TestAsyncWMDAClient(unittest.TestCase):
+
+    def setUp(self):
+        env = patch.dict(os.environ, {'WMDA_API_BASE_URL': 'https://wmda.test/api/v2'})
+        env.start()
+        self.addCleanup(env.stop)
+        self.limiter = RateLimiter(rate=None, initial_concurrency=32, max_concurrency=32)
+
+    def client(self, handler, **kwargs):
+        kwargs.setdefault('token_provider', make_provider())
+        kwargs.setdefault('rate_limiter', self.limiter)
+        return AsyncWMDAClient(transport=httpx.MockTransport(handler), backoff_base=0, **kwargs)
+
+    def test_operations_hit_expected_endpoints(self):
+        seen = []
+
+        def handler(request):
+            seen.append((request.method, request.url.path, request.headers['Authorization']))
+            return httpx.Response(200, json={'ok': True})
+
+        async def run():
+            async with self.client(handler) as client:
+                await client.create_patient({'patientId': '1'})
+                await client.update_patient({'patientId': '1'})
+                await client.list_patients(limit=10, offset=20)
+                await client.create_search({'wmdaId': 5})
+                await client.get_patient_searches(5)
+                return await client.get_search_summary(26774)
+
+        response = asyncio.run(run())
+
+        self.assertEqual(response.json(), {'ok': True})
+        self.assertEqual([(method, path) for method, path, _ in seen], [
+            ('POST', '/api/v2/patients'),
+            ('PUT', '/api/v2/patients'),
+            ('GET', '/api/v2/patients'),
+            ('POST', '/api/v2/searches'),
+            ('GET', '/api/v2/searches/patientSearches/5'),
+            ('GET', '/api/v2/searches/26774'),
+        ])
+        self.assertTrue(all(auth == 'Bearer async_token' for _, _, auth in seen))
+
+    def test_semaphore_and_shared_limiter_cap_requests_in_flight(self):
+        state = {'in_flight': 0, 'peak': 0}
+
+        async def handler(request):
+            state['in_flight'] += 1
+            state['peak'] = max(state['peak'], state['in_flight'])
+            await asyncio.sleep(0.01)
+            state['in_flight'] -= 1
+            return httpx.Response(200, json={'searchId': request.url.path.rsplit('/', 1)[-1]})
+
+        async def run(client):
+            async with client:
+                return await asyncio.gather(*(client.get_search_summary(i) for i in range(20)))
+
+        self.assertEqual(len(asyncio.run(run(self.client(handler, max_concurrency=3)))), 20)
+        self.assertLessEqual(state['peak'], 3)
+
+        # The shared limiter applies on top of the client's own semaphore
+        state['peak'] = 0
+        self.limiter = RateLimiter(rate=None, initial_concurrency=2, max_concurrency=2)
+        asyncio.run(run(self.client(handler, max_concurrency=10)))
+        self.assertLessEqual(state['peak'], 2)
+        self.assertEqual(self.limiter._in_flight, 0)
+
+    def test_throttled_requests_are_retried_and_pause_the_limiter(self):
+        statuses = [429, 503, 200]
+
+        def handler(request):
+            return httpx.Response(statuses.pop(0), headers={'Retry-After': '0'}, json={'ok': True})
+
+        async def run():
+            async with self.client(handler) as client:
+                return await client.get_search_summary(1)
+
+        with patch.object(self.limiter, 'pause', wraps=self.limiter.pause) as mock_pause:
+            response = asyncio.run(run())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_pause.call_count, 2)
+
+    def test_posts_are_not_retried_after_a_server_error(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request.method)
+            return httpx.Response(503)
+
+        async def run():
+            async with self.client(handler) as client:
+                return await client.create_patient({'patientId': '1'})
+
+        self.assertEqual(asyncio.run(run()).status_code, 503)
+        self.assertEqual(calls, ['POST'])
+
+    def test_cached_token_is_used_without_a_thread(self):
+        provider = make_provider(token=None, cached='cached_token')
+        seen = []
+
+        def handler(request):
+            seen.append(request.headers['Authorization'])
+            return httpx.Response(200)
+
+        async def run():
+            async with self.client(handler, token_provider=provider) as client:
+                await client.get_search_summary(1)
+
+        asyncio.run(run())
+
+        self.assertEqual(seen, ['Bearer cached_token'])
+        provider.get_token.assert_not_called()
+
+    def test_missing_token_raises(self):
+        async def run():
+            async with self.client(lambda request: httpx.Response(200), token_provider=make_provider(None)) as client:
+                await client.get_search_summary(1)
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(run())
+
+    def test_fetch_search_summaries_keeps_successful_responses(self):
+        def handler(request):
+            search_id = request.url.path.rsplit('/', 1)[-1]
+            if search_id == '3':
+                return httpx.Response(404)
+            return httpx.Response(200, json={'searchId': search_id})
+
+        with patch('builtins.print'):
+            summaries = fetch_search_summaries(['1', '2', '3'], token_provider=make_provider(),
+                                               rate_limiter=self.limiter, transport=httpx.MockTransport(handler))
+
+        self.assertEqual(summaries, {'1': {'searchId': '1'}, '2': {'searchId': '2'}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import json
+import stat
+import time
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+from wmda_match.modules.auth import TokenProvider, parse_expiry
+
+
+def make_token_response(token, **expiry):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = dict({'access_token': token}, **expiry)
+    return mock_response
+
+
+class TestTokenProvider(unittest.TestCase):
+
+    @patch('wmda_match.modules.auth.requests.post')
+    def test_token_is_cached_until_refresh_margin(self, mock_post):
+        mock_post.return_value = make_token_response('token1', expires_in='3600')
+        provider = TokenProvider(refresh_margin=300)
+
+        self.assertEqual(provider.get_token(), 'token1')
+        self.assertEqual(provider.get_token(), 'token1')
+        mock_post.assert_called_once()  # Second call is served from memory
+        self.assertEqual(provider.cached_token(), 'token1')
+        self.assertIsNone(TokenProvider().cached_token())
+
+    @patch('wmda_match.modules.auth.requests.post')
+    def test_token_is_refreshed_before_expiry(self, mock_post):
+        # The first token expires inside the refresh margin, so the next call refreshes
+        mock_post.side_effect = [
+            make_token_response('token1', expires_in='100'),
+            make_token_response('token2', expires_in='3600'),
+        ]
+        provider = TokenProvider(refresh_margin=300)
+
+        self.assertEqual(provider.get_token(), 'token1')
+        self.assertEqual(provider.get_token(), 'token2')
+        self.assertEqual(mock_post.call_count, 2)
+
+    @patch('wmda_match.modules.auth.requests.post')
+    def test_failed_request_returns_none(self, mock_post):
+        mock_response = MagicMock()
+        mock_response.status_code = 401
+        mock_response.text = "Unauthorized"
+        mock_post.return_value = mock_response
+
+        with patch('builtins.print'):
+            self.assertIsNone(TokenProvider().get_token())
+
+    @patch('wmda_match.modules.auth.requests.post')
+    def test_concurrent_callers_share_one_refresh(self, mock_post):
+        def slow_response(*args, **kwargs):
+            time.sleep(0.1)
+            return make_token_response('shared_token', expires_in='3600')
+        mock_post.side_effect = slow_response
+        provider = TokenProvider()
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(provider.get_token())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ['shared_token'] * 8)
+        mock_post.assert_called_once()
+
+    @patch('wmda_match.modules.auth.requests.post')
+    def test_disk_cache_is_private_and_reused(self, mock_post):
+        mock_post.return_value = make_token_response('disk_token', expires_in='3600')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_file = os.path.join(tmp_dir, 'token.json')
+
+            self.assertEqual(TokenProvider(cache_file=cache_file).get_token(), 'disk_token')
+            self.assertEqual(stat.S_IMODE(os.stat(cache_file).st_mode), 0o600)
+
+            # A new provider (e.g. the next script run) loads the token from disk
+            self.assertEqual(TokenProvider(cache_file=cache_file).get_token(), 'disk_token')
+            mock_post.assert_called_once()
+
+            with open(cache_file) as f:
+                self.assertEqual(json.load(f)['access_token'], 'disk_token')
+
+    def test_parse_expiry(self):
+        self.assertEqual(parse_expiry({'expires_on': '2000'}, now=1000), 2000.0)
+        self.assertEqual(parse_expiry({'expires_in': '3599'}, now=1000), 4599.0)
+        self.assertEqual(parse_expiry({}, now=1000), 4600.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
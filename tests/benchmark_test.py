@@ -0,0 +1,104 @@
+import os
+import json
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+from wmda_match.modules import wmda_client
+from wmda_match.modules.wmda_client import configure_client
+from wmda_match.modules.auth import clear_token_cache
+from wmda_match.modules.fake_wmda import FakeWMDAServer
+from wmda_match.modules.migrations import migrate
+from wmda_match.modules.db_writer import _writers
+from wmda_match.modules.benchmark import run_benchmark, compare_results, percentile, make_cohort, main, FLOWS
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3], 99), 3)
+        self.assertIsNone(percentile([], 50))
+
+    def test_compare_results(self):
+        baseline = {"flows": {"create": {"requests_per_second": 100, "p95_ms": 20},
+                              "summary": {"requests_per_second": 100, "p95_ms": 20}}}
+        current = {"flows": {"create": {"requests_per_second": 95, "p95_ms": 21},
+                             "summary": {"requests_per_second": 80, "p95_ms": 30}}}
+
+        regressions = compare_results(baseline, current, threshold=0.10)
+
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(all(message.startswith("summary") for message in regressions))
+        self.assertEqual(compare_results(baseline, baseline), [])
+
+    def test_make_cohort_fills_a_migrated_database(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        db_path = os.path.join(tmp_dir.name, "benchmark.db")
+        migrate(db_path)
+
+        donors = make_cohort(db_path, 3)
+
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute("SELECT DONN_NUMERO, Ax, Ax_code FROM person_data ORDER BY DONN_NUMERO").fetchall()
+        conn.close()
+        self.assertEqual(rows, [(1000000, "01:01:01:01", None), (1000001, "01:01:01:01", None),
+                                (1000002, "01:01:01:01", None)])
+        self.assertEqual(donors[1].Gender, "F")
+
+    def test_run_benchmark_against_fake_server(self):
+        server = FakeWMDAServer(search_duration=0).start()
+        self.addCleanup(server.stop)
+        env = patch.dict(os.environ, {"WMDA_API_BASE_URL": server.base_url, "WMDA_TOKEN_URL": server.token_url})
+        env.start()
+        self.addCleanup(env.stop)
+        shared = patch.object(wmda_client, "_client", None)
+        shared.start()
+        self.addCleanup(shared.stop)
+        configure_client()
+        clear_token_cache()
+        self.addCleanup(clear_token_cache)
+
+        results = run_benchmark(cohort_size=12, concurrency=4, page_size=5)
+
+        self.assertEqual(list(results), FLOWS)
+        self.assertEqual(results["create"]["operations"], 12)
+        self.assertEqual(results["list"]["operations"], 3)
+        self.assertTrue(all(r["errors"] == 0 for r in results.values()))
+        self.assertGreater(results["update"]["db_write_seconds"], 0)
+        self.assertEqual(server.stats()["POST /patients 201"], 12)
+        self.assertEqual(server.stats()["POST /searches 201"], 12)
+        # The writer thread of the temporary database is stopped again
+        self.assertFalse(any(path.endswith("benchmark.db") for path in _writers))
+
+    def test_main_runs_without_the_rate_limiter_by_default(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        output = os.path.join(tmp_dir.name, "results.json")
+        # main() points the environment and the shared client at its own fake server
+        env = patch.dict(os.environ, {})
+        env.start()
+        self.addCleanup(env.stop)
+        shared = patch.object(wmda_client, "_client", None)
+        shared.start()
+        self.addCleanup(shared.stop)
+        self.addCleanup(clear_token_cache)
+
+        with patch("builtins.print"):
+            self.assertEqual(main(["--cohort", "2", "--concurrency", "3", "--flows", "list", "--output", output]), 0)
+
+        self.assertIsNone(wmda_client._client.rate_limiter)
+        with open(output) as f:
+            config = json.load(f)["config"]
+        self.assertEqual(config["concurrency"], 3)
+        self.assertEqual(config["pool_size"], 10)
+        self.assertFalse(config["rate_limited"])
+        self.assertIsNone(config["rate_limiter"])
+
+
+if __name__ == "__main__":
+    unittest.main()
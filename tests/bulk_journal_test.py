@@ -0,0 +1,85 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from wmda_match.modules.bulk_journal import BulkJournal, run_in_pool, PENDING, SENDING, DONE, FAILED, SKIPPED
+
+
+class TestBulkJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "sample_data.db")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def journal(self, operation="create"):
+        journal = BulkJournal(operation, self.db_path)
+        self.addCleanup(journal.close)
+        return journal
+
+    def test_unfinished_run_is_resumed_in_order(self):
+        journal = self.journal()
+        run_id = journal.start([3, 1, 2], {"force": True})
+        journal.record(3, DONE, wmda_id=215508)
+        journal.record(1, SENDING)
+        journal.record(2, FAILED, "500: Server error")
+        self.assertEqual(journal.finish(), 2)
+
+        resumed = self.journal()
+        progress = resumed.resume()
+
+        self.assertEqual(resumed.run_id, run_id)
+        self.assertEqual(resumed.options, {"force": True})
+        self.assertEqual(list(progress), ["3", "1", "2"])
+        self.assertEqual(progress["3"], (DONE, "", 215508, None))
+        self.assertEqual(progress["1"][0], SENDING)
+        self.assertEqual(progress["2"][:2], (FAILED, "500: Server error"))
+
+    def test_finished_run_is_not_resumed(self):
+        journal = self.journal()
+        journal.start(["1", "2"])
+        journal.record("1", DONE, payload={"patientId": "1"})
+        journal.record("2", SKIPPED, "Unchanged")
+
+        self.assertEqual(journal.finish(), 0)
+        self.assertIsNone(self.journal().resume())
+
+    def test_unfinished_run_can_be_inspected_without_reopening_it(self):
+        journal = self.journal()
+        run_id = journal.start(["1", "2"])
+        journal.record("1", SENDING)
+
+        other = self.journal()
+        self.assertEqual(other.unfinished(), (run_id, {"1": (SENDING, "", None, None), "2": (PENDING, "", None, None)}))
+        self.assertIsNone(other.run_id)
+
+    def test_runs_are_kept_per_operation(self):
+        self.journal("create").start(["1"])
+
+        self.assertIsNone(self.journal("update").resume())
+        self.assertEqual(self.journal("create").resume(), {"1": (PENDING, "", None, None)})
+
+    def test_interrupted_pool_cancels_rows_not_started(self):
+        started = []
+        lock = threading.Lock()
+
+        def work(item):
+            with lock:
+                started.append(item)
+            if item == 2:
+                raise KeyboardInterrupt()
+            # Each item stands in for a request that takes a while
+            time.sleep(0.05)
+            return item
+
+        with self.assertRaises(KeyboardInterrupt):
+            run_in_pool(work, range(100), max_workers=1)
+        self.assertEqual(started[:3], [0, 1, 2])
+        self.assertLess(len(started), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,19 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
 import sqlite3
 import requests
 from wmda_match.modules.create_patient_search import get_bearer_token, get_wmdaid_from_db, update_search_id_in_db, create_patient_search
+from wmda_match.modules.auth import clear_token_cache
+from wmda_match.modules.person_repository import Donor
 
 class TestWMDAFunctions(unittest.TestCase):
 
+    def setUp(self):
+        # The token is cached between calls, so start every test without one
+        clear_token_cache()
+
     @patch('requests.post')
     def test_get_bearer_token(self, mock_post):
         # Mock the response of the POST request to get the bearer token
@@ -17,43 +25,42 @@ class TestWMDAFunctions(unittest.TestCase):
         token = get_bearer_token()
         self.assertEqual(token, 'mock_token')  # Check that the token is correctly returned
 
-    @patch('sqlite3.connect')
-    def test_get_wmdaid_from_db(self, mock_connect):
-        # Mock the SQLite database connection and cursor
-        mock_conn = MagicMock()
-        mock_cursor = MagicMock()
-        mock_conn.cursor.return_value = mock_cursor
-        mock_connect.return_value = mock_conn
-        
+    @patch('wmda_match.modules.create_patient_search.get_person_repository')
+    def test_get_wmdaid_from_db(self, mock_repository):
+        # Mock the row returned by the person_data repository
         donor_id = '12345'
-        mock_cursor.fetchone.return_value = ['mock_wmda_id']
+        mock_repository.return_value.get.return_value = Donor._make(
+            (donor_id, "1990-01-01", 34, "HICA", "M") + ("01:01",) * 10 + ('mock_wmda_id', None))
 
         wmda_id = get_wmdaid_from_db(donor_id)
         self.assertEqual(wmda_id, 'mock_wmda_id')  # Check if wmdaId is correctly retrieved from the DB
+        mock_repository.return_value.get.assert_called_once_with(donor_id)
+
+    def test_update_search_id_in_db(self):
+        # The write goes through the shared writer thread, so use a real database
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        db_path = os.path.join(tmp_dir.name, 'sample_data.db')
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE person_data (DONN_NUMERO INTEGER PRIMARY KEY, wmdaID INTEGER, SearchID INTEGER)")
+        conn.execute("INSERT INTO person_data VALUES (12345, 215508, '')")
+        conn.commit()
 
-    @patch('sqlite3.connect')
-    def test_update_search_id_in_db(self, mock_connect):
-        # Mock the SQLite database connection and cursor
-        mock_conn = MagicMock()
-        mock_cursor = MagicMock()
-        mock_conn.cursor.return_value = mock_cursor
-        mock_connect.return_value = mock_conn
-        
         donor_id = '12345'
         search_id = '67890'
 
-        # Test if the search ID is correctly updated
-        update_search_id_in_db(donor_id, search_id)
-        mock_cursor.execute.assert_called_with(
-            "UPDATE person_data SET SearchID = ? WHERE DONN_NUMERO = ?",
-            (search_id, donor_id)
-        )  # Check that the SQL query is correctly executed
+        # Test if the search ID is correctly updated, and visible as soon as the call returns
+        update_search_id_in_db(donor_id, search_id, db_path=db_path)
+        self.assertEqual(conn.execute("SELECT SearchID FROM person_data").fetchone(), (67890,))
+        conn.close()
 
-    @patch('requests.post')
+    @patch('wmda_match.modules.create_patient_search.invalidate_cached')
+    @patch('wmda_match.modules.create_patient_search.get_client')
     @patch('wmda_match.modules.create_patient_search.get_bearer_token')
     @patch('wmda_match.modules.create_patient_search.get_wmdaid_from_db')
     @patch('wmda_match.modules.create_patient_search.update_search_id_in_db')
-    def test_create_patient_search(self, mock_update, mock_get_wmdaid, mock_get_token, mock_post):
+    def test_create_patient_search(self, mock_update, mock_get_wmdaid, mock_get_token, mock_get_client, mock_invalidate):
+        mock_post = mock_get_client.return_value.post
         # Mock the helper functions
         mock_get_wmdaid.return_value = 'mock_wmda_id'
         mock_get_token.return_value = 'mock_token'
@@ -70,7 +77,9 @@ class TestWMDAFunctions(unittest.TestCase):
         create_patient_search(donor_id)
         
         # Check if update_search_id_in_db was called with the correct arguments
-        mock_update.assert_called_with(donor_id, 'mock_search_id')
+        mock_update.assert_called_with(donor_id, 'mock_search_id', 'sample_data.db')
+        # The cached search list of the patient is dropped so the new search shows up
+        mock_invalidate.assert_called_once_with('patient_searches', ['mock_wmda_id'])
         
         # Correct the User-Agent to match the actual one in the request
         mock_post.assert_called_with(
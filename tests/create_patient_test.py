@@ -1,50 +1,59 @@
+import os
 import unittest
+import tempfile
 from unittest.mock import patch, MagicMock
 import sqlite3
 import json
-from wmda_match.modules.create_patient import get_donor_data, create_patient
+from wmda_match.modules.create_patient import get_donor_data, create_patient, create_patients_bulk, extract_wmda_id
+from wmda_match.modules.person_repository import Donor
 
 class TestCreatePatient(unittest.TestCase):
+
+    def setUp(self):
+        # Bulk runs write their progress journal here
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.db_path = os.path.join(self.tmp_dir.name, "sample_data.db")
     
-    @patch("wmda_match.modules.create_patient.sqlite3.connect")
-    def test_get_donor_data(self, mock_connect):
+    @patch("wmda_match.modules.create_patient.get_person_repository")
+    def test_get_donor_data(self, mock_repository):
         """Test fetching donor data from the database."""
-        # Mock database connection and cursor
-        mock_conn = MagicMock()
-        mock_cursor = MagicMock()
-        mock_connect.return_value = mock_conn
-        mock_conn.cursor.return_value = mock_cursor
-
         # Sample donor data (matching expected schema)
-        mock_cursor.fetchone.return_value = (
+        mock_repository.return_value.get.return_value = Donor(
             "MypId-01", "1983-04-24", None, "HICA", "F", 
             "01:01", "24:02", "08:01", "07:02", "07:01", "07:02",
-            "03:01", "15:01", "02:01", "06:02"
+            "03:01", "15:01", "02:01", "06:02", None, None
         )
 
         donor = get_donor_data("MypId-01")
         self.assertIsNotNone(donor)
         self.assertEqual(donor[0], "MypId-01")
-        self.assertEqual(donor[1], "1983-04-24")
+        self.assertEqual(donor.DOB, "1983-04-24")
+        mock_repository.return_value.get.assert_called_once_with("MypId-01", False)
 
+    @patch("wmda_match.modules.create_patient.save_wmda_ids")
     @patch("wmda_match.modules.create_patient.get_bearer_token", return_value="mocked_token")
-    @patch("wmda_match.modules.create_patient.requests.post")
-    def test_create_patient(self, mock_post, mock_token):
+    @patch("wmda_match.modules.create_patient.get_client")
+    def test_create_patient(self, mock_get_client, mock_token, mock_save):
         """Test patient creation with mocked API response."""
+        mock_post = mock_get_client.return_value.post
         # Mock donor data
-        donor = (
-            "MypId-01", "1983-04-24", None, "HICA", "F", 
+        donor = Donor(
+            "MypId-01", "1983-04-24", None, "HICA", "F",
             "01:01", "24:02", "08:01", "07:02", "07:01", "07:02",
-            "03:01", "15:01", "02:01", "06:02"
+            "03:01", "15:01", "02:01", "06:02", None, None
         )
 
         # Mock API response
         mock_response = MagicMock()
         mock_response.status_code = 201
-        mock_response.json.return_value = {"message": "Patient created successfully"}
+        mock_response.json.return_value = {"wmdaId": 215508}
         mock_post.return_value = mock_response
 
-        create_patient(donor)
+        self.assertTrue(create_patient(donor))
+
+        # The wmdaId from the response is stored without listing all patients
+        mock_save.assert_called_once_with([("MypId-01", 215508)], "sample_data.db")
 
         # Verify request details
         mock_post.assert_called_once()
@@ -59,5 +68,228 @@ class TestCreatePatient(unittest.TestCase):
         self.assertEqual(patient_data["hla"]["a"]["field1"], "01:01")
         self.assertEqual(patient_data["hla"]["b"]["field2"], "07:02")
 
+    @patch("wmda_match.modules.create_patient.save_wmda_ids")
+    @patch("wmda_match.modules.create_patient.get_bearer_token", return_value="mocked_token")
+    @patch("wmda_match.modules.create_patient.get_client")
+    @patch("wmda_match.modules.create_patient.get_donors")
+    def test_create_patients_bulk(self, mock_get_donors, mock_get_client, mock_token, mock_save):
+        """Test bulk creation reports created, failed and skipped rows."""
+        new_donor = Donor("111", "1983-04-24", None, "HICA", "F", "01:01", "24:02", "08:01", "07:02",
+                          "07:01", "07:02", "03:01", "15:01", "02:01", "06:02", "", "")
+        bad_donor = new_donor._replace(DONN_NUMERO="222")
+        existing_donor = new_donor._replace(DONN_NUMERO="333", wmdaID=215508)
+        mock_get_donors.return_value = {"111": new_donor, "222": bad_donor, "333": existing_donor}
+
+        def fake_post(url, headers, json):
+            response = MagicMock()
+            response.status_code = 201 if json["patientId"] == "111" else 400
+            response.text = "Bad Request"
+            response.json.return_value = {"wmdaId": 215600}
+            return response
+        mock_get_client.return_value.post.side_effect = fake_post
+
+        with patch("builtins.print"):
+            results = create_patients_bulk(["111", "222", "333", "444"], max_workers=2, db_path=self.db_path)
+
+        statuses = {r["donor_id"]: r["status"] for r in results}
+        self.assertEqual(statuses, {"111": "created", "222": "failed", "333": "skipped", "444": "skipped"})
+        self.assertEqual(mock_get_client.return_value.post.call_count, 2)
+        # Once up front, then once per request so an expiring token is refreshed mid-run
+        self.assertEqual(mock_token.call_count, 3)
+        mock_save.assert_called_once_with([("111", 215600)], self.db_path)
+
+    @patch("wmda_match.modules.create_patient.save_wmda_ids")
+    @patch("wmda_match.modules.create_patient.get_bearer_token", side_effect=["token-1", "token-1", "token-2"])
+    @patch("wmda_match.modules.create_patient.get_client")
+    @patch("wmda_match.modules.create_patient.get_donors")
+    def test_create_patients_bulk_uses_refreshed_token(self, mock_get_donors, mock_get_client, mock_token, mock_save):
+        """Test a token refreshed during a bulk run is used by the requests that follow."""
+        donor = Donor._make(("111", "1983-04-24", None, "HICA", "F") + ("01:01",) * 10 + ("", ""))
+        mock_get_donors.return_value = {"111": donor, "222": donor._replace(DONN_NUMERO="222")}
+        response = MagicMock(status_code=201)
+        response.json.return_value = {"wmdaId": 215600}
+        mock_post = mock_get_client.return_value.post
+        mock_post.return_value = response
+
+        with patch("builtins.print"):
+            create_patients_bulk(["111", "222"], max_workers=1, db_path=self.db_path)
+
+        tokens = [c[1]["headers"]["Authorization"] for c in mock_post.call_args_list]
+        self.assertEqual(tokens, ["Bearer token-1", "Bearer token-2"])
+
+    @patch("wmda_match.modules.create_patient.get_donors", return_value={})
+    @patch("wmda_match.modules.create_patient.get_pending_donor_ids", return_value=["555"])
+    def test_create_patients_bulk_defaults_to_pending(self, mock_pending, mock_get_donors):
+        """Test bulk creation selects donors without a wmdaID when no IDs are given."""
+        with patch("builtins.print"):
+            results = create_patients_bulk(db_path=self.db_path)
+
+        # The donors are read from the same database as the journal
+        mock_pending.assert_called_once_with(self.db_path)
+        mock_get_donors.assert_called_once_with(["555"], self.db_path)
+        self.assertEqual(results[0]["status"], "skipped")
+
+    def test_extract_wmda_id(self):
+        """Test the wmdaId is read from the body or the Location header."""
+        from_body = MagicMock()
+        from_body.json.return_value = {"wmdaId": "215508"}
+        self.assertEqual(extract_wmda_id(from_body), 215508)
+
+        from_location = MagicMock()
+        from_location.json.side_effect = ValueError("No JSON")
+        from_location.headers = {"Location": "/api/v2/patients/215509"}
+        self.assertEqual(extract_wmda_id(from_location), 215509)
+
+        empty = MagicMock()
+        empty.json.side_effect = ValueError("No JSON")
+        empty.headers = {}
+        self.assertIsNone(extract_wmda_id(empty))
+
+        # A wmdaId that is not a number is ignored, so the lookup fallback runs
+        for bad_id in ("pending", ["215510"]):
+            malformed = MagicMock()
+            malformed.json.return_value = {"wmdaId": bad_id}
+            self.assertIsNone(extract_wmda_id(malformed))
+
+    @patch("wmda_match.modules.create_patient.save_wmda_ids")
+    @patch("wmda_match.modules.create_patient.lookup_wmda_ids", return_value={"MypId-01": 215510})
+    @patch("wmda_match.modules.create_patient.get_bearer_token", return_value="mocked_token")
+    @patch("wmda_match.modules.create_patient.get_client")
+    def test_create_patient_falls_back_to_lookup(self, mock_get_client, mock_token, mock_lookup, mock_save):
+        """Test the wmdaId is looked up when the response does not contain it."""
+        mock_response = MagicMock()
+        mock_response.status_code = 201
+        mock_response.json.side_effect = ValueError("No JSON")
+        mock_response.headers = {}
+        mock_get_client.return_value.post.return_value = mock_response
+        donor = Donor._make(("MypId-01", "1983-04-24", None, "HICA", "F") + ("01:01",) * 10 + (None, None))
+
+        with patch("builtins.print"):
+            create_patient(donor)
+
+        mock_lookup.assert_called_once_with(["MypId-01"], "mocked_token")
+        mock_save.assert_called_once_with([("MypId-01", 215510)], "sample_data.db")
+
+
+@patch("builtins.print")
+@patch("wmda_match.modules.create_patient.save_wmda_ids")
+@patch("wmda_match.modules.create_patient.get_bearer_token", return_value="mocked_token")
+@patch("wmda_match.modules.create_patient.get_client")
+@patch("wmda_match.modules.create_patient.get_donors")
+class TestCreatePatientsResume(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.db_path = os.path.join(self.tmp_dir.name, "sample_data.db")
+        donor = Donor._make(("111", "1983-04-24", None, "HICA", "F") + ("01:01",) * 10 + ("", ""))
+        self.donors = {donor_id: donor._replace(DONN_NUMERO=donor_id) for donor_id in ("111", "222", "333")}
+
+    def created(self, wmda_id):
+        response = MagicMock(status_code=201)
+        response.json.return_value = {"wmdaId": wmda_id}
+        return response
+
+    def interrupt_after_first_create(self, mock_get_donors, mock_get_client):
+        # 111 is created, then the run is stopped while the request for 222 is in flight
+        mock_get_donors.side_effect = lambda ids, db_path: {i: self.donors[i] for i in map(str, ids)}
+        mock_post = mock_get_client.return_value.post
+        # 333 may still start before the pool is cancelled; it is refused, so either way it is sent again
+        mock_post.side_effect = [self.created(215600), KeyboardInterrupt(), MagicMock(status_code=400, text="Invalid")]
+        with self.assertRaises(KeyboardInterrupt):
+            create_patients_bulk(["111", "222", "333"], max_workers=1, db_path=self.db_path)
+        mock_post.reset_mock(side_effect=True)
+        mock_post.return_value = self.created(215700)
+        return mock_post
+
+    @patch("wmda_match.modules.create_patient.lookup_wmda_ids", return_value={})
+    def test_resume_sends_only_unfinished_donors(self, mock_lookup, mock_get_donors, mock_get_client, mock_token,
+                                                 mock_save, _):
+        mock_post = self.interrupt_after_first_create(mock_get_donors, mock_get_client)
+
+        results = create_patients_bulk(resume=True, db_path=self.db_path)
+
+        sent = [c[1]["json"]["patientId"] for c in mock_post.call_args_list]
+        self.assertEqual(sent, ["222", "333"])
+        self.assertEqual({r["donor_id"]: r["status"] for r in results}, {"222": "created", "333": "created"})
+        # The in-flight donor was checked on the WMDA before being sent again
+        mock_lookup.assert_called_once_with(["222"], "mocked_token")
+        # The wmdaId of 111 is stored even though the first run stopped before saving it
+        mock_save.assert_any_call([("111", 215600)], self.db_path)
+        self.assertEqual(create_patients_bulk(resume=True, db_path=self.db_path), [])
+
+    @patch("wmda_match.modules.create_patient.lookup_wmda_ids", return_value={"222": 215650})
+    def test_in_flight_create_found_on_wmda_is_not_sent_again(self, mock_lookup, mock_get_donors, mock_get_client,
+                                                              mock_token, mock_save, _):
+        mock_post = self.interrupt_after_first_create(mock_get_donors, mock_get_client)
+
+        create_patients_bulk(resume=True, db_path=self.db_path)
+
+        sent = [c[1]["json"]["patientId"] for c in mock_post.call_args_list]
+        self.assertEqual(sent, ["333"])
+        mock_save.assert_any_call([("222", 215650)], self.db_path)
+
+    @patch("wmda_match.modules.create_patient.get_pending_donor_ids", return_value=["222", "333"])
+    def test_interrupted_run_saves_created_ids_and_blocks_new_runs(self, mock_pending, mock_get_donors,
+                                                                  mock_get_client, mock_token, mock_save, _):
+        mock_post = self.interrupt_after_first_create(mock_get_donors, mock_get_client)
+
+        # The wmdaId of 111 was stored before the interrupt was raised
+        mock_save.assert_called_once_with([("111", 215600)], self.db_path)
+
+        # 222 may exist on the WMDA already, so a fresh run must not post it again
+        self.assertEqual(create_patients_bulk(db_path=self.db_path), [])
+        mock_pending.assert_not_called()
+        mock_post.assert_not_called()
+
+    @patch("wmda_match.modules.create_patient.lookup_wmda_ids", return_value={})
+    def test_create_with_unknown_outcome_is_looked_up_before_sending_again(self, mock_lookup, mock_get_donors,
+                                                                           mock_get_client, mock_token, mock_save, _):
+        mock_get_donors.side_effect = lambda ids, db_path: {i: self.donors[i] for i in map(str, ids)}
+        mock_post = mock_get_client.return_value.post
+        # 111 times out and 222 gets a 502: either may have been created. 333 is refused.
+        mock_post.side_effect = [TimeoutError("Read timed out"), MagicMock(status_code=502, text="Bad gateway"),
+                                 MagicMock(status_code=400, text="Invalid")]
+
+        results = create_patients_bulk(["111", "222", "333"], max_workers=1, db_path=self.db_path)
+
+        self.assertEqual([r["status"] for r in results], ["failed"] * 3)
+        self.assertTrue(results[0]["detail"].startswith("Outcome unknown"))
+        # Only the creates that may have reached the WMDA are looked up
+        mock_lookup.assert_called_once_with(["111", "222"], "mocked_token")
+
+        # They are still unsettled, so a fresh run must not post them again
+        mock_post.reset_mock(side_effect=True)
+        self.assertEqual(create_patients_bulk(["111", "222", "333"], db_path=self.db_path), [])
+        mock_post.assert_not_called()
+
+        # Resuming looks them up again and only sends what the WMDA does not have
+        mock_lookup.reset_mock(return_value=True)
+        mock_lookup.return_value = {"111": 215800}
+        mock_post.return_value = self.created(215900)
+        create_patients_bulk(resume=True, db_path=self.db_path)
+
+        mock_lookup.assert_called_once_with(["111", "222"], "mocked_token")
+        sent = [c[1]["json"]["patientId"] for c in mock_post.call_args_list]
+        self.assertEqual(sent, ["222", "333"])
+        mock_save.assert_any_call([("111", 215800)], self.db_path)
+
+    @patch("wmda_match.modules.create_patient.lookup_wmda_ids", return_value={"111": 215800})
+    def test_create_with_unknown_outcome_found_on_wmda_is_done(self, mock_lookup, mock_get_donors, mock_get_client,
+                                                               mock_token, mock_save, _):
+        mock_get_donors.side_effect = lambda ids, db_path: {i: self.donors[i] for i in map(str, ids)}
+        mock_get_client.return_value.post.side_effect = [MagicMock(status_code=503, text="Unavailable")]
+
+        results = create_patients_bulk(["111"], db_path=self.db_path)
+
+        self.assertEqual(results, [{"donor_id": "111", "status": "created", "detail": "", "wmda_id": 215800}])
+        mock_save.assert_any_call([("111", 215800)], self.db_path)
+        self.assertEqual(create_patients_bulk(resume=True, db_path=self.db_path), [])
+
+    def test_resume_without_unfinished_run(self, mock_get_donors, mock_get_client, mock_token, mock_save, _):
+        self.assertEqual(create_patients_bulk(resume=True, db_path=self.db_path), [])
+        mock_get_client.return_value.post.assert_not_called()
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from wmda_match.modules.db_writer import DBWriter, get_db_writer, close_db_writers
+from wmda_match.modules.metrics import get_metrics
+
+
+class TestDBWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "sample_data.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE person_data (DONN_NUMERO INTEGER PRIMARY KEY, SearchID INTEGER)")
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def writer(self, **kwargs):
+        writer = DBWriter(self.db_path, **kwargs)
+        self.addCleanup(writer.close)
+        return writer
+
+    def rows(self):
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute("SELECT DONN_NUMERO, SearchID FROM person_data ORDER BY DONN_NUMERO").fetchall()
+        conn.close()
+        return rows
+
+    def wait_until(self, ticket, timeout=2.0):
+        # Poll instead of ticket.wait(), which would ask the writer to commit early
+        deadline = time.monotonic() + timeout
+        while not ticket.done() and time.monotonic() < deadline:
+            time.sleep(0.005)
+        return ticket.done()
+
+    def test_concurrent_writes_share_transactions(self):
+        writer = self.writer()
+        batches = get_metrics().value("wmda_db_writer_batches_total")
+
+        def insert(start):
+            for donor_id in range(start, start + 50):
+                writer.execute("INSERT INTO person_data VALUES (?, ?)", (donor_id, donor_id * 10)).wait()
+
+        threads = [threading.Thread(target=insert, args=(n * 1000,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.rows()), 400)
+        self.assertLess(get_metrics().value("wmda_db_writer_batches_total") - batches, 400)
+
+    def test_batch_is_committed_when_full(self):
+        writer = self.writer(batch_rows=5, batch_ms=60000)
+        tickets = [writer.execute("INSERT INTO person_data VALUES (?, NULL)", (n,)) for n in range(5)]
+
+        self.assertTrue(self.wait_until(tickets[-1]))
+        self.assertEqual(len(self.rows()), 5)
+
+    def test_batch_is_committed_when_its_time_is_up(self):
+        writer = self.writer(batch_ms=20)
+        ticket = writer.executemany("INSERT INTO person_data VALUES (?, NULL)", [(1,), (2,)])
+
+        self.assertTrue(self.wait_until(ticket))
+        self.assertEqual(ticket.rowcount, 2)
+
+    def test_flush_commits_without_waiting_for_the_batch(self):
+        writer = self.writer(batch_ms=60000)
+        ticket = writer.execute("INSERT INTO person_data VALUES (1, 26774)")
+
+        self.assertTrue(writer.flush(timeout=2))
+        self.assertTrue(ticket.done())
+        self.assertEqual(self.rows(), [(1, 26774)])
+
+    def test_failed_write_does_not_lose_the_batch(self):
+        writer = self.writer(batch_ms=60000)
+        good = writer.execute("INSERT INTO person_data VALUES (1, NULL)")
+        bad = writer.execute("INSERT INTO person_data VALUES (1, NULL)")
+        also_good = writer.execute("UPDATE person_data SET SearchID = 5 WHERE DONN_NUMERO = 1")
+
+        with self.assertRaises(sqlite3.IntegrityError):
+            bad.wait(timeout=2)
+        self.assertTrue(good.wait(timeout=2))
+        self.assertTrue(also_good.wait(timeout=2))
+        self.assertEqual(also_good.rowcount, 1)
+        self.assertEqual(self.rows(), [(1, 5)])
+
+    def test_close_commits_queued_writes_in_wal_mode(self):
+        writer = DBWriter(self.db_path, batch_ms=60000)
+        writer.execute("INSERT INTO person_data VALUES (1, NULL)")
+        writer.close()
+
+        self.assertEqual(self.rows(), [(1, None)])
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        conn.close()
+        with self.assertRaises(RuntimeError):
+            writer.execute("INSERT INTO person_data VALUES (2, NULL)")
+
+    def test_shared_writer_per_database(self):
+        self.addCleanup(close_db_writers)
+        self.assertIs(get_db_writer(self.db_path), get_db_writer(os.path.join(self.tmp_dir.name, ".", "sample_data.db")))
+
+
+if __name__ == '__main__':
+    unittest.main()
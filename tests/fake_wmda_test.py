@@ -0,0 +1,86 @@
+import os
+import unittest
+from unittest.mock import patch
+from wmda_match.modules import wmda_client
+from wmda_match.modules.wmda_client import configure_client, get_client, api_url
+from wmda_match.modules.rate_limiter import RateLimiter
+from wmda_match.modules.auth import clear_token_cache, get_bearer_token
+from wmda_match.modules.fake_wmda import FakeWMDAServer
+from wmda_match.modules.create_patient import build_patient_data, post_patient, extract_wmda_id
+from wmda_match.modules.update_patient import build_update_data, send_update
+from wmda_match.modules.patient_pages import iter_patients
+from wmda_match.modules.person_repository import Donor
+
+DONOR = Donor(2255001, "1996-08-28", 29, "HICA", "M", "01:01:01:01", "24:07:01:01", "15:02:01", "15:17:01", "07:01:02",
+              "08:01:01", "13:02:01", "15:01:01", "05:02:01", "06:04:01", "", "")
+
+
+class TestFakeWMDAServer(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeWMDAServer(search_duration=0).start()
+        self.addCleanup(self.server.stop)
+
+        # Point every module at the fake server and use a client of our own
+        env = patch.dict(os.environ, {"WMDA_API_BASE_URL": self.server.base_url,
+                                      "WMDA_TOKEN_URL": self.server.token_url, "TENANT_ID": "tenant"})
+        env.start()
+        self.addCleanup(env.stop)
+        shared = patch.object(wmda_client, "_client", None)
+        shared.start()
+        self.addCleanup(shared.stop)
+        configure_client(rate_limiter=RateLimiter(rate=None), backoff_base=0)
+        clear_token_cache()
+        self.addCleanup(clear_token_cache)
+        self.token = get_bearer_token()
+
+    def test_token_endpoint(self):
+        self.assertTrue(self.token.startswith("fake-token-"))
+
+    def test_patient_and_search_flow(self):
+        # Create
+        response = post_patient(build_patient_data(DONOR), self.token)
+        self.assertEqual(response.status_code, 201)
+        wmda_id = extract_wmda_id(response)
+
+        # Update with a full PUT, then with a JSON Patch
+        donor = DONOR._replace(wmdaID=wmda_id)
+        response, method = send_update(build_update_data(donor), None, self.token)
+        self.assertEqual((response.status_code, method), (204, "PUT"))
+        changed = donor._replace(DRB1x="13:03:01")
+        response, method = send_update(build_update_data(changed), build_update_data(donor), self.token, use_patch=True)
+        self.assertEqual((response.status_code, method), (204, "PATCH"))
+
+        # List
+        patients = list(iter_patients(self.token, page_size=1))
+        self.assertEqual([(p["patientId"], p["wmdaId"]) for p in patients], [("2255001", wmda_id)])
+
+        # Search, summary and search list
+        headers = {"Authorization": f"Bearer {self.token}"}
+        response = get_client().post(api_url("/searches"), headers=headers, json={"wmdaId": wmda_id})
+        search_id = response.json()["searchId"]
+        summary = get_client().get(api_url(f"/searches/{search_id}"), headers=headers)
+        self.assertEqual(summary.json()["status"], "Completed")
+        searches = get_client().get(api_url(f"/searches/patientSearches/{wmda_id}"), headers=headers)
+        self.assertEqual([s["searchId"] for s in searches.json()], [search_id])
+
+        # ETag revalidation
+        etag = summary.headers["ETag"]
+        cached = get_client().get(api_url(f"/searches/{search_id}"), headers=dict(headers, **{"If-None-Match": etag}))
+        self.assertEqual(cached.status_code, 304)
+
+    def test_missing_token_is_rejected(self):
+        self.assertEqual(get_client().get(api_url("/patients")).status_code, 401)
+
+    def test_throttled_requests_are_retried(self):
+        self.server.throttle_rate = 1.0
+        self.server.retry_after = 0
+        response = get_client().get(api_url("/patients"), headers={"Authorization": f"Bearer {self.token}"})
+
+        self.assertEqual(response.status_code, 429)
+        stats = self.server.stats()
+        self.assertEqual(stats["GET /patients 429"], get_client().max_retries + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
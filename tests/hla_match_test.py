@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from wmda_match.modules.hla_match import HLAMatchEngine, split_allele, Candidate
+
+PATIENT = ("01:01", "24:02", "08:01", "07:02", "07:01", "07:02", "03:01", "15:01", "02:01", "06:02")
+
+
+class TestHLAMatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "sample_data.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            CREATE TABLE person_data (
+                DONN_NUMERO INTEGER PRIMARY KEY,
+                Ax TEXT, Ay TEXT, Bx TEXT, By TEXT, Cx TEXT, Cy TEXT,
+                DRB1x TEXT, DRB1y TEXT, DQB1x TEXT, DQB1y TEXT
+            )
+        ''')
+        conn.executemany("INSERT INTO person_data VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+            (1,) + PATIENT,
+            # Identical typing written the other way round at A
+            (2, "24:02", "01:01") + PATIENT[2:],
+            # One allele-level mismatch at B that still matches at antigen level
+            (3, "01:01", "24:02", "08:02", "07:02") + PATIENT[4:],
+            # One antigen-level mismatch at DRB1
+            (4,) + PATIENT[:6] + ("04:01", "15:01") + PATIENT[8:],
+            # Full resolution and a missing DQB1 typing
+            (5, "A*01:01:01:01", "A*24:02:01") + PATIENT[2:8] + ("02:01", None),
+        ])
+        conn.commit()
+        conn.close()
+        self.engine = HLAMatchEngine.from_db(self.db_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_split_allele(self):
+        self.assertEqual(split_allele("A*01:01:01:01"), ["01", "01", "01", "01"])
+        self.assertEqual(split_allele("24:02"), ["24", "02"])
+        self.assertEqual(split_allele(None), [])
+
+    def test_mismatch_counts(self):
+        allele_mm, antigen_mm = self.engine.mismatch_counts(self.engine.allele_codes[:, :, 0],
+                                                           self.engine.antigen_codes[:, :, 0])
+
+        self.assertEqual(allele_mm.tolist(), [0, 0, 1, 1, 0])
+        self.assertEqual(antigen_mm.tolist(), [0, 0, 0, 1, 0])
+
+    def test_screen_by_patient_id(self):
+        candidates = self.engine.screen(1, k=3)
+
+        self.assertEqual(candidates, [Candidate(2, 0, 0), Candidate(5, 0, 0), Candidate(3, 1, 0)])
+
+    def test_screen_by_typing(self):
+        candidates = self.engine.screen(PATIENT, k=10)
+
+        self.assertEqual([c.donor_id for c in candidates], [1, 2, 5, 3, 4])
+
+    def test_unknown_patient(self):
+        with self.assertRaises(KeyError):
+            self.engine.screen("999")
+
+
+if __name__ == "__main__":
+    unittest.main()
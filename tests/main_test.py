@@ -0,0 +1,71 @@
+import os
+import sys
+import subprocess
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+from wmda_match import __main__ as cli
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(code, cwd):
+    env = {key: value for key, value in os.environ.items() if key != "USER_AGENT"}
+    env["PYTHONPATH"] = PACKAGE_ROOT
+    return subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env, capture_output=True, text=True, timeout=60)
+
+
+class TestCommandLine(unittest.TestCase):
+
+    def test_help_lists_commands(self):
+        with patch("builtins.print") as mock_print:
+            self.assertEqual(cli.main([]), 0)
+        text = mock_print.call_args[0][0]
+        for command in ("create", "update", "sync-ids", "list", "search", "search-list", "summary"):
+            self.assertIn(f"  {command} ", text)
+
+    def test_unknown_command(self):
+        with patch("builtins.print"):
+            self.assertEqual(cli.main(["frobnicate"]), 2)
+
+    @patch.object(cli, "load_config")
+    @patch.object(cli, "importlib")
+    def test_dispatches_to_module_main(self, mock_importlib, mock_load_config):
+        module = MagicMock()
+        module.main.return_value = None
+        mock_import = mock_importlib.import_module
+        mock_import.return_value = module
+
+        self.assertEqual(cli.main(["summary", "2255001", "--no-cache"]), 0)
+
+        mock_load_config.assert_called_once()
+        mock_import.assert_called_once_with("wmda_match.modules.patientsummary")
+        module.main.assert_called_once_with(["2255001", "--no-cache"])
+
+    def test_imports_have_no_side_effects(self):
+        # A .env in the working directory must not be read, and no database created, just by importing
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, ".env"), "w") as f:
+                f.write("USER_AGENT=from-dotenv\n")
+            modules = [name[:-3] for name in os.listdir(os.path.join(PACKAGE_ROOT, "wmda_match", "modules"))
+                       if name.endswith(".py") and name != "__init__.py"]
+            code = ("import os, importlib\n"
+                    f"for name in {modules!r}:\n"
+                    "    importlib.import_module('wmda_match.modules.' + name)\n"
+                    "print(os.getenv('USER_AGENT'))\n")
+            result = run_python(code, tmp)
+
+            self.assertEqual(result.returncode, 0, result.stderr)
+            self.assertEqual(result.stdout.strip(), "None")
+            self.assertEqual(sorted(os.listdir(tmp)), [".env"])
+
+    def test_help_does_not_import_heavy_modules(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            result = run_python("import sys\nfrom wmda_match.__main__ import main\nmain(['--help'])\n"
+                                "print(sorted({'requests', 'numpy', 'dotenv'} & set(sys.modules)))", tmp)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip().splitlines()[-1], "[]")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import os
+import json
+import tempfile
+import unittest
+import urllib.request
+from unittest.mock import patch, MagicMock
+from wmda_match.modules.metrics import (MetricsRegistry, endpoint_label, timed_db, write_textfile,
+                                        write_snapshot, start_http_server, get_metrics)
+from wmda_match.modules.wmda_client import WMDAClient
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def test_endpoint_label_replaces_ids(self):
+        self.assertEqual(endpoint_label("https://sandbox-search-api.wmda.info/api/v2/searches/26774"), "/searches/{id}")
+        self.assertEqual(endpoint_label("http://127.0.0.1:8080/api/v2/patients?page=2"), "/patients")
+        self.assertEqual(endpoint_label("http://localhost/api/v2/searches/patientSearches/123"),
+                         "/searches/patientSearches/{id}")
+
+    def test_track_request_counts_status_and_in_flight(self):
+        registry = MetricsRegistry()
+        with registry.track_request("post", "http://localhost/api/v2/patients") as outcome:
+            self.assertEqual(registry.value("wmda_http_requests_in_flight",
+                                            {"endpoint": "/patients", "method": "POST"}), 1)
+            outcome["status"] = 201
+
+        labels = {"endpoint": "/patients", "method": "POST", "status": "201"}
+        self.assertEqual(registry.value("wmda_http_requests_total", labels), 1)
+        self.assertEqual(registry.value("wmda_http_requests_in_flight", {"endpoint": "/patients", "method": "POST"}), 0)
+
+    def test_track_request_records_errors(self):
+        registry = MetricsRegistry()
+        with self.assertRaises(ConnectionError):
+            with registry.track_request("GET", "http://localhost/api/v2/patients"):
+                raise ConnectionError()
+        labels = {"endpoint": "/patients", "method": "GET", "status": "error"}
+        self.assertEqual(registry.value("wmda_http_requests_total", labels), 1)
+
+    def test_prometheus_text_has_cumulative_buckets(self):
+        registry = MetricsRegistry(buckets=(0.1, 1.0))
+        registry.observe("wmda_db_operation_duration_seconds", {"operation": "save"}, 0.05)
+        registry.observe("wmda_db_operation_duration_seconds", {"operation": "save"}, 0.5)
+        registry.inc("wmda_db_operations_total", {"operation": "save", "outcome": "ok"}, 2)
+
+        text = registry.prometheus_text()
+        self.assertIn("# TYPE wmda_db_operation_duration_seconds histogram", text)
+        self.assertIn('wmda_db_operation_duration_seconds_bucket{operation="save",le="0.1"} 1', text)
+        self.assertIn('wmda_db_operation_duration_seconds_bucket{operation="save",le="1.0"} 2', text)
+        self.assertIn('wmda_db_operation_duration_seconds_bucket{operation="save",le="+Inf"} 2', text)
+        self.assertIn('wmda_db_operation_duration_seconds_count{operation="save"} 2', text)
+        self.assertIn('wmda_db_operations_total{operation="save",outcome="ok"} 2', text)
+
+    def test_label_values_are_escaped(self):
+        registry = MetricsRegistry()
+        registry.inc("wmda_db_operations_total", {"operation": 'a"b\\c'})
+        self.assertIn('operation="a\\"b\\\\c"', registry.prometheus_text())
+
+    def test_snapshot_and_textfile(self):
+        registry = MetricsRegistry()
+        registry.observe("wmda_token_fetch_duration_seconds", {"status": "200"}, 0.2)
+        registry.inc("wmda_token_fetches_total", {"status": "200"})
+
+        with tempfile.TemporaryDirectory() as tmp:
+            json_path = os.path.join(tmp, "metrics.json")
+            prom_path = os.path.join(tmp, "metrics.prom")
+            write_snapshot(json_path, registry)
+            write_textfile(prom_path, registry)
+
+            with open(json_path) as f:
+                snapshot = json.load(f)
+            with open(prom_path) as f:
+                text = f.read()
+
+        self.assertEqual(snapshot["counters"][0]["value"], 1)
+        self.assertEqual(snapshot["histograms"][0]["count"], 1)
+        self.assertAlmostEqual(snapshot["histograms"][0]["mean"], 0.2)
+        self.assertIn('wmda_token_fetches_total{status="200"} 1', text)
+
+    def test_http_endpoint_serves_prometheus_text(self):
+        registry = MetricsRegistry()
+        registry.inc("wmda_token_fetches_total", {"status": "200"})
+        server = start_http_server(0, registry=registry)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            with urllib.request.urlopen(url) as response:
+                body = response.read().decode()
+                self.assertTrue(response.headers["Content-Type"].startswith("text/plain"))
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertIn('wmda_token_fetches_total{status="200"} 1', body)
+
+    def test_metrics_port_in_use_keeps_the_registry(self):
+        taken = start_http_server(0, registry=MetricsRegistry())
+        self.addCleanup(taken.server_close)
+        self.addCleanup(taken.shutdown)
+        port = str(taken.server_address[1])
+
+        with patch.dict(os.environ, {"WMDA_METRICS_PORT": port}), \
+                patch("wmda_match.modules.metrics._registry", None), patch("builtins.print") as mock_print:
+            registry = get_metrics()
+            self.assertIsInstance(registry, MetricsRegistry)
+            self.assertIs(get_metrics(), registry)
+
+        mock_print.assert_called_once()
+        self.assertIn(port, mock_print.call_args[0][0])
+
+    def test_timed_db_records_outcome(self):
+        @timed_db("test_operation")
+        def failing():
+            raise ValueError()
+
+        registry = get_metrics()
+        before = registry.value("wmda_db_operations_total", {"operation": "test_operation", "outcome": "error"})
+        with self.assertRaises(ValueError):
+            failing()
+        after = registry.value("wmda_db_operations_total", {"operation": "test_operation", "outcome": "error"})
+        self.assertEqual(after, before + 1)
+
+
+class TestClientMetrics(unittest.TestCase):
+
+    def test_client_records_each_request(self):
+        client = WMDAClient(rate_limiter=None, max_retries=0)
+        client.session = MagicMock()
+        client.session.request.return_value = MagicMock(status_code=404)
+
+        labels = {"endpoint": "/patients/{id}", "method": "PUT", "status": "404"}
+        before = get_metrics().value("wmda_http_requests_total", labels)
+        client.put("http://localhost/api/v2/patients/42", json={})
+        self.assertEqual(get_metrics().value("wmda_http_requests_total", labels), before + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+from wmda_match.modules import migrations
+from wmda_match.modules.migrations import migrate, get_schema_version, LATEST_VERSION
+from wmda_match.modules.create_patient import PENDING_DONORS_SQL
+from wmda_match.modules.search_poller import OUTSTANDING_SEARCHES_SQL, get_outstanding_searches
+
+
+class TestMigrations(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "sample_data.db")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path)
+        self.addCleanup(conn.close)
+        return conn
+
+    def test_fresh_database_is_created_at_latest_version(self):
+        self.assertEqual(migrate(self.db_path), [version for version, _, _ in migrations.MIGRATIONS])
+
+        conn = self.connect()
+        self.assertEqual(get_schema_version(conn), LATEST_VERSION)
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertTrue({"person_data", "hla_alleles", "payload_hashes", "sync_state", "wmda_patients",
+                         "search_results", "api_cache", "jobs", "bulk_runs", "bulk_progress",
+                         "schema_version"} <= tables)
+        # Running again has nothing left to do
+        self.assertEqual(migrate(self.db_path), [])
+
+    def test_existing_database_is_upgraded_in_place(self):
+        conn = self.connect()
+        conn.execute("CREATE TABLE person_data (DONN_NUMERO INTEGER PRIMARY KEY, Ax TEXT, wmdaID INTEGER, SearchID INTEGER)")
+        conn.execute("INSERT INTO person_data VALUES (1, '01:01', '', 77)")
+        conn.commit()
+
+        migrate(self.db_path)
+
+        self.assertEqual(conn.execute("SELECT DONN_NUMERO, Ax, wmdaID, SearchID FROM person_data").fetchall(),
+                         [(1, "01:01", "", 77)])
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(person_data)")}
+        self.assertIn("Ax_code", columns)
+
+    def plan(self, conn, sql):
+        return " ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql))
+
+    def fill_person_data(self, conn, rows=20000):
+        # Mostly created donors, some still pending and a few with a search, then analysed
+        # so the planner works from real statistics
+        conn.executemany("INSERT INTO person_data (DONN_NUMERO, wmdaID, SearchID) VALUES (?, ?, ?)", [
+            (n, "" if n % 100 == 0 else None if n % 101 == 0 else 100000 + n,
+             n if n % 50 == 0 else "" if n % 2 else None)
+            for n in range(1, rows + 1)
+        ])
+        conn.commit()
+        conn.execute("ANALYZE")
+
+    def test_pending_work_queries_use_indexes(self):
+        migrate(self.db_path)
+        conn = self.connect()
+        self.fill_person_data(conn)
+
+        self.assertIn("idx_person_data_searchid", self.plan(conn, "SELECT * FROM person_data WHERE SearchID = 5"))
+        self.assertIn("idx_person_data_pending_create", self.plan(conn, PENDING_DONORS_SQL))
+        plan = self.plan(conn, OUTSTANDING_SEARCHES_SQL)
+        self.assertIn("idx_person_data_open_searches", plan)
+        self.assertNotIn("TEMP B-TREE FOR ORDER BY", plan)
+
+    def test_old_partial_indexes_are_replaced(self):
+        migrate(self.db_path, target=9)
+        conn = self.connect()
+        self.fill_person_data(conn, rows=2000)
+
+        self.assertEqual(migrate(self.db_path, target=10), [10])
+        # A new connection, as the scripts open after migrating, loads the new statistics
+        conn = self.connect()
+        self.assertIn("idx_person_data_pending_create", self.plan(conn, PENDING_DONORS_SQL))
+        self.assertIn("idx_person_data_open_searches", self.plan(conn, OUTSTANDING_SEARCHES_SQL))
+        conn.execute("INSERT INTO search_results (search_id) VALUES ('50')")
+        conn.commit()
+        searches = get_outstanding_searches(self.db_path)
+        self.assertNotIn("50", searches)
+        self.assertEqual(searches["100"], ["100"])
+
+    def test_suffixed_allele_truncations_are_rewritten(self):
+        migrate(self.db_path, target=10)
+        conn = self.connect()
+        conn.executemany("INSERT INTO hla_alleles (locus, allele, field1, field2, field3, field4) VALUES (?, ?, ?, ?, ?, ?)",
+                         [("A", "01:01:01:02N", "01N", "01:01N", "01:01:01N", "01:01:01:02N"),
+                          ("B", "08:01N", "08N", "08:01N", None, None),
+                          ("C", "A1", None, None, None, None)])
+        conn.commit()
+
+        self.assertEqual(migrate(self.db_path), [11])
+
+        self.assertEqual(conn.execute("SELECT field1, field2, field3, field4 FROM hla_alleles ORDER BY id").fetchall(),
+                         [("01", "01:01", "01:01:01", "01:01:01:02N"), ("08", "08:01N", None, None),
+                          (None, None, None, None)])
+
+    def test_target_stops_early(self):
+        self.assertEqual(migrate(self.db_path, target=2), [1, 2])
+        self.assertEqual(get_schema_version(self.connect()), 2)
+        self.assertEqual(migrate(self.db_path), list(range(3, LATEST_VERSION + 1)))
+
+    def test_failed_step_is_rolled_back(self):
+        def broken(conn):
+            conn.execute("CREATE TABLE half_done (id INTEGER)")
+            conn.execute("SELECT * FROM no_such_table")
+
+        steps = migrations.MIGRATIONS[:1] + [(2, "Broken", broken)]
+        with patch.object(migrations, "MIGRATIONS", steps), patch.object(migrations, "LATEST_VERSION", 2):
+            with self.assertRaises(sqlite3.OperationalError):
+                migrate(self.db_path)
+
+        conn = self.connect()
+        self.assertEqual(get_schema_version(conn), 1)
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertNotIn("half_done", tables)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,13 +4,18 @@ import json
 import os
 from dotenv import load_dotenv
 from wmda_match.modules.patient_list import get_bearer_token, get_patient_data  # Import the functions from your module
+from wmda_match.modules.auth import clear_token_cache
 
 # Load environment variables from the .env file
 load_dotenv()
 
 class TestPatientListAPI(unittest.TestCase):
 
-    @patch('wmda_match.modules.patient_list.requests.post')
+    def setUp(self):
+        # The token is cached between calls, so start every test without one
+        clear_token_cache()
+
+    @patch('wmda_match.modules.auth.requests.post')
     def test_get_bearer_token_success(self, mock_post):
         # Mock the response of the POST request to get the bearer token
         mock_response = MagicMock()
@@ -39,8 +44,9 @@ class TestPatientListAPI(unittest.TestCase):
             }
         )
 
-    @patch('wmda_match.modules.patient_list.requests.get')
-    def test_get_patient_data_success(self, mock_get):
+    @patch('wmda_match.modules.patient_pages.get_client')
+    def test_get_patient_data_success(self, mock_get_client):
+        mock_get = mock_get_client.return_value.get
         # Mock the response of the GET request to retrieve patient data
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -73,7 +79,7 @@ class TestPatientListAPI(unittest.TestCase):
             }
         )
 
-    @patch('wmda_match.modules.patient_list.requests.post')
+    @patch('wmda_match.modules.auth.requests.post')
     def test_get_bearer_token_failure(self, mock_post):
         # Mock a failure response when trying to retrieve the bearer token
         mock_response = MagicMock()
@@ -88,8 +94,9 @@ class TestPatientListAPI(unittest.TestCase):
         self.assertIsNone(token)
         mock_post.assert_called_once()
 
-    @patch('wmda_match.modules.patient_list.requests.get')
-    def test_get_patient_data_failure(self, mock_get):
+    @patch('wmda_match.modules.patient_pages.get_client')
+    def test_get_patient_data_failure(self, mock_get_client):
+        mock_get = mock_get_client.return_value.get
         # Mock a failure response when trying to retrieve patient data
         mock_response = MagicMock()
         mock_response.status_code = 500
@@ -0,0 +1,68 @@
+import unittest
+from unittest.mock import patch, MagicMock
+from wmda_match.modules.patient_pages import iter_patients, iter_patient_pages
+
+
+def make_registry(total_count):
+    """Return a fake GET handler serving total_count patients in pages."""
+    def fake_get(url, headers, params):
+        offset, limit = params["Offset"], params["Limit"]
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = {
+            "paging": {"totalCount": total_count},
+            "patients": [{"patientId": str(i)} for i in range(offset, min(offset + limit, total_count))],
+        }
+        return response
+    return fake_get
+
+
+class TestPatientPages(unittest.TestCase):
+
+    @patch("wmda_match.modules.patient_pages.get_client")
+    def test_iter_patients_follows_total_count(self, mock_get_client):
+        mock_get_client.return_value.get.side_effect = make_registry(250)
+
+        patients = list(iter_patients("token", page_size=100, max_workers=2))
+
+        # Every patient is returned once and in order, across three pages
+        self.assertEqual([p["patientId"] for p in patients], [str(i) for i in range(250)])
+        offsets = sorted(c[1]["params"]["Offset"] for c in mock_get_client.return_value.get.call_args_list)
+        self.assertEqual(offsets, [0, 100, 200])
+
+    @patch("wmda_match.modules.patient_pages.get_client")
+    def test_single_page_makes_one_request(self, mock_get_client):
+        mock_get_client.return_value.get.side_effect = make_registry(40)
+
+        self.assertEqual(len(list(iter_patients("token"))), 40)
+        mock_get_client.return_value.get.assert_called_once()
+
+    @patch("wmda_match.modules.patient_pages.get_client")
+    def test_first_page_failure_yields_nothing(self, mock_get_client):
+        mock_response = MagicMock()
+        mock_response.status_code = 500
+        mock_response.text = "Internal Server Error"
+        mock_get_client.return_value.get.return_value = mock_response
+
+        with patch("builtins.print"):
+            self.assertEqual(list(iter_patient_pages("token")), [])
+
+    @patch("wmda_match.modules.patient_pages.get_client")
+    def test_later_page_failure_raises(self, mock_get_client):
+        registry = make_registry(300)
+
+        def flaky_get(url, headers, params):
+            if params["Offset"] == 200:
+                response = MagicMock()
+                response.status_code = 503
+                response.text = "Service Unavailable"
+                return response
+            return registry(url, headers, params)
+        mock_get_client.return_value.get.side_effect = flaky_get
+
+        with patch("builtins.print"), self.assertRaises(RuntimeError):
+            list(iter_patients("token", page_size=100))
+
+
+if __name__ == "__main__":
+    unittest.main()
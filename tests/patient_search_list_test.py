@@ -8,23 +8,29 @@ import wmda_match.modules.patient_search_list
 
 class TestWMDAFunctions(unittest.TestCase):
 
-    @patch('wmda_match.modules.patient_search_list.sqlite3.connect')
-    def test_get_wmda_id(self, mock_connect):
-        # Setup mock for sqlite3 connection
-        mock_cursor = MagicMock()
-        mock_connect.return_value.cursor.return_value = mock_cursor
-        mock_cursor.fetchone.return_value = ('215508',)  # Simulate the returned wmdaId
+    def setUp(self):
+        # Keep these tests away from the on-disk response cache
+        cache_patcher = patch('wmda_match.modules.patient_search_list.get_response_cache', return_value=None)
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+
+    @patch('wmda_match.modules.patient_search_list.get_person_repository')
+    def test_get_wmda_id(self, mock_repository):
+        # Setup mock for the person_data repository
+        mock_repository.return_value.get_wmda_id.return_value = '215508'  # Simulate the returned wmdaId
 
         donor_id = '2255001'
         wmda_id =  wmda_match.modules.patient_search_list.get_wmda_id(donor_id)
 
         # Assert that the wmdaId is correctly fetched from the database
-        mock_cursor.execute.assert_called_once_with("SELECT wmdaId FROM person_data WHERE DONN_NUMERO = ?", (donor_id,))
+        mock_repository.assert_called_once_with('sample_data.db')
+        mock_repository.return_value.get_wmda_id.assert_called_once_with(donor_id)
         self.assertEqual(wmda_id, '215508')
 
     @patch('wmda_match.modules.patient_search_list.get_bearer_token')
-    @patch('wmda_match.modules.patient_search_list.requests.get')
-    def test_get_patient_searches(self, mock_get, mock_get_bearer_token):
+    @patch('wmda_match.modules.patient_search_list.get_client')
+    def test_get_patient_searches(self, mock_get_client, mock_get_bearer_token):
+        mock_get = mock_get_client.return_value.get
         # Setup mock for the Bearer Token and API request
         mock_get_bearer_token.return_value = 'dummy_token'
 
@@ -48,8 +54,8 @@ class TestWMDAFunctions(unittest.TestCase):
             mock_print.assert_any_call(json.dumps({"search_results": "dummy_data"}, indent=4))
 
     @patch('wmda_match.modules.patient_search_list.get_bearer_token')
-    @patch('wmda_match.modules.patient_search_list.requests.get')
-    def test_get_patient_searches_error(self, mock_get, mock_get_bearer_token):
+    @patch('wmda_match.modules.patient_search_list.get_client')
+    def test_get_patient_searches_error(self, mock_get_client, mock_get_bearer_token):
         # Setup mock for Bearer Token failure
         mock_get_bearer_token.return_value = None
 
@@ -61,8 +67,9 @@ class TestWMDAFunctions(unittest.TestCase):
             mock_print.assert_called_with("Unable to get bearer token. Aborting.")
 
     @patch('wmda_match.modules.patient_search_list.get_bearer_token')
-    @patch('wmda_match.modules.patient_search_list.requests.get')
-    def test_get_patient_searches_api_error(self, mock_get, mock_get_bearer_token):
+    @patch('wmda_match.modules.patient_search_list.get_client')
+    def test_get_patient_searches_api_error(self, mock_get_client, mock_get_bearer_token):
+        mock_get = mock_get_client.return_value.get
         # Setup mock for successful bearer token and API error response
         mock_get_bearer_token.return_value = 'dummy_token'
 
@@ -0,0 +1,118 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+from wmda_match.modules.patient_sync import sync_patients, get_high_water_mark
+from wmda_match.modules.db_writer import close_db_writers
+
+PATIENTS = [
+    {"patientId": "2255001", "wmdaId": 215508, "status": "Active", "lastUpdated": "2025-02-21T09:00:00"},
+    {"patientId": "6215667", "wmdaId": 215447, "status": "Active", "lastUpdated": "2025-02-20T09:00:00"},
+    {"patientId": "3606062", "wmdaId": 215451, "status": "Active", "lastUpdated": "2025-02-19T09:00:00"},
+]
+
+
+def make_get(patients):
+    """Return a fake GET handler serving the given patients page by page."""
+    def fake_get(url, headers, params):
+        offset = params["Offset"]
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = {
+            "paging": {"totalCount": len(patients)},
+            "patients": patients[offset:offset + params["Limit"]],
+        }
+        return response
+    return fake_get
+
+
+class TestPatientSync(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "sample_data.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE person_data (DONN_NUMERO INTEGER PRIMARY KEY, wmdaID INTEGER, SearchID INTEGER)")
+        conn.executemany("INSERT INTO person_data VALUES (?, ?, ?)", [(2255001, "", ""), (6215667, 1, "")])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        close_db_writers(self.db_path)
+        self.tmp_dir.cleanup()
+
+    def query(self, sql):
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute(sql).fetchall()
+        conn.close()
+        return rows
+
+    @patch("wmda_match.modules.patient_pages.get_client")
+    def test_first_sync_mirrors_everything(self, mock_get_client):
+        mock_get_client.return_value.get.side_effect = make_get(PATIENTS)
+
+        result = sync_patients("token", db_path=self.db_path)
+
+        self.assertEqual(result, {"changed": 3, "high_water_mark": "2025-02-21T09:00:00"})
+        self.assertEqual(len(self.query("SELECT * FROM wmda_patients")), 3)
+        # Empty wmdaIds in person_data are filled, populated ones are kept
+        self.assertEqual(dict(self.query("SELECT DONN_NUMERO, wmdaID FROM person_data")), {2255001: 215508, 6215667: 1})
+
+    @patch("wmda_match.modules.patient_pages.get_client")
+    def test_second_sync_only_upserts_changes(self, mock_get_client):
+        mock_get_client.return_value.get.side_effect = make_get(PATIENTS)
+        sync_patients("token", db_path=self.db_path)
+
+        changed = dict(PATIENTS[2], status="Closed", lastUpdated="2025-02-22T10:00:00")
+        mock_get_client.return_value.get.side_effect = make_get([changed] + PATIENTS[:2])
+        result = sync_patients("token", db_path=self.db_path)
+
+        # The record at the old high-water mark is re-read, the older one is not
+        self.assertEqual(result, {"changed": 2, "high_water_mark": "2025-02-22T10:00:00"})
+        self.assertEqual(self.query("SELECT status FROM wmda_patients WHERE patientId = '3606062'"), [("Closed",)])
+
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(get_high_water_mark(conn), "2025-02-22T10:00:00")
+        conn.close()
+
+    @patch("wmda_match.modules.patient_pages.get_client")
+    def test_sorted_listing_stops_early(self, mock_get_client):
+        mock_get_client.return_value.get.side_effect = make_get(PATIENTS)
+        sync_patients("token", db_path=self.db_path)
+
+        newer = [dict(PATIENTS[0], patientId=str(i), lastUpdated="2025-03-01T00:00:00") for i in range(3)]
+        registry = newer + PATIENTS[:1] + PATIENTS[1:] * 100
+        mock_get_client.return_value.get.reset_mock()
+        mock_get_client.return_value.get.side_effect = make_get(registry)
+
+        result = sync_patients("token", db_path=self.db_path, sort_params={"SortBy": "lastUpdated"})
+
+        self.assertEqual(result["changed"], 4)  # Three new records and the one at the high-water mark
+        # Only the first page and the single prefetched page were requested
+        self.assertLessEqual(mock_get_client.return_value.get.call_count, 2)
+
+    @patch("wmda_match.modules.patient_sync.UPSERT_BATCH_SIZE", 50)
+    @patch("wmda_match.modules.patient_pages.get_client")
+    def test_interrupted_sync_keeps_batches_but_not_the_mark(self, mock_get_client):
+        registry = [dict(PATIENTS[0], patientId=str(i)) for i in range(150)]
+        fake_get = make_get(registry)
+
+        def failing_get(url, headers, params):
+            if params["Offset"] >= 100:
+                return MagicMock(status_code=500, text="Server error")
+            return fake_get(url, headers, params)
+        mock_get_client.return_value.get.side_effect = failing_get
+
+        with patch("builtins.print"), self.assertRaises(RuntimeError):
+            sync_patients("token", db_path=self.db_path)
+
+        # The batches of the first page were committed, but the next sync still starts from scratch
+        self.assertEqual(self.query("SELECT COUNT(*) FROM wmda_patients"), [(100,)])
+        conn = sqlite3.connect(self.db_path)
+        self.assertIsNone(get_high_water_mark(conn))
+        conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,10 +2,21 @@ import unittest
 import json
 from unittest.mock import patch, MagicMock
 from wmda_match.modules import patientsummary
+from wmda_match.modules.auth import clear_token_cache
+from wmda_match.modules.person_repository import Donor
 
 class TestPatientSummary(unittest.TestCase):
+
+    def setUp(self):
+        # The token is cached between calls, so start every test without one
+        clear_token_cache()
+
+        # Keep these tests away from the on-disk response cache
+        cache_patcher = patch('wmda_match.modules.patientsummary.get_response_cache', return_value=None)
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
     
-    @patch('wmda_match.modules.patientsummary.requests.post')
+    @patch('wmda_match.modules.auth.requests.post')
     def test_get_bearer_token_success(self, mock_post):
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -15,7 +26,7 @@ class TestPatientSummary(unittest.TestCase):
         token = patientsummary.get_bearer_token()
         self.assertEqual(token, 'test_token')
 
-    @patch('wmda_match.modules.patientsummary.requests.post')
+    @patch('wmda_match.modules.auth.requests.post')
     def test_get_bearer_token_failure(self, mock_post):
         mock_response = MagicMock()
         mock_response.status_code = 400
@@ -25,25 +36,25 @@ class TestPatientSummary(unittest.TestCase):
         token = patientsummary.get_bearer_token()
         self.assertIsNone(token)
 
-    @patch('wmda_match.modules.patientsummary.sqlite3.connect')
-    def test_get_search_id_found(self, mock_connect):
-        mock_cursor = mock_connect.return_value.cursor.return_value
-        mock_cursor.fetchone.return_value = ('26774',)
+    @patch('wmda_match.modules.patientsummary.get_person_repository')
+    def test_get_search_id_found(self, mock_repository):
+        mock_repository.return_value.get.return_value = Donor._make(
+            ('5800816', '1990-01-01', 34, 'HICA', 'M') + ('01:01',) * 10 + ('215508', '26774'))
         
         search_id = patientsummary.get_search_id('5800816')
         self.assertEqual(search_id, '26774')
 
-    @patch('wmda_match.modules.patientsummary.sqlite3.connect')
-    def test_get_search_id_not_found(self, mock_connect):
-        mock_cursor = mock_connect.return_value.cursor.return_value
-        mock_cursor.fetchone.return_value = None
+    @patch('wmda_match.modules.patientsummary.get_person_repository')
+    def test_get_search_id_not_found(self, mock_repository):
+        mock_repository.return_value.get.return_value = None
         
         search_id = patientsummary.get_search_id('invalid_patient')
         self.assertIsNone(search_id)
 
-    @patch('wmda_match.modules.patientsummary.requests.get')
+    @patch('wmda_match.modules.patientsummary.get_client')
     @patch('wmda_match.modules.patientsummary.get_bearer_token', return_value='test_token')
-    def test_get_search_summary_success(self, mock_get_token, mock_get):
+    def test_get_search_summary_success(self, mock_get_token, mock_get_client):
+        mock_get = mock_get_client.return_value.get
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.json.return_value = {'summary': 'Test Data'}
@@ -54,9 +65,10 @@ class TestPatientSummary(unittest.TestCase):
             mock_print.assert_any_call(json.dumps({"summary": "Test Data"}, indent=4))
 
 
-    @patch('wmda_match.modules.patientsummary.requests.get')
+    @patch('wmda_match.modules.patientsummary.get_client')
     @patch('wmda_match.modules.patientsummary.get_bearer_token', return_value='test_token')
-    def test_get_search_summary_failure(self, mock_get_token, mock_get):
+    def test_get_search_summary_failure(self, mock_get_token, mock_get_client):
+        mock_get = mock_get_client.return_value.get
         mock_response = MagicMock()
         mock_response.status_code = 404
         mock_response.text = "Not Found"
@@ -66,5 +78,18 @@ class TestPatientSummary(unittest.TestCase):
             patientsummary.get_search_summary('invalid_search_id')
             mock_print.assert_any_call('Error retrieving search summary: 404, Response: Not Found')
 
+    @patch('wmda_match.modules.patientsummary.fetch_search_summaries')
+    @patch('wmda_match.modules.patientsummary.get_person_repository')
+    def test_main_fetches_several_patients_concurrently(self, mock_repository, mock_fetch):
+        mock_repository.return_value.get.side_effect = lambda patient_id: Donor._make(
+            (patient_id, '1990-01-01', 34, 'HICA', 'M') + ('01:01',) * 10 + ('215508', {'1': 26774, '2': None}[patient_id]))
+        mock_fetch.return_value = {'26774': {'summary': 'Test Data'}}
+
+        with patch('builtins.print'):
+            patientsummary.main(['1', '2'])
+
+        # Only the patient with a search is requested, in one batch
+        mock_fetch.assert_called_once_with({'26774': '1'})
+
 if __name__ == '__main__':
     unittest.main()
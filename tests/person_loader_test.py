@@ -0,0 +1,99 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from wmda_match.modules import person_loader
+from wmda_match.modules.person_loader import load_person_data, clean_record, upsert_sql
+
+HEADER = "DONN_NUMERO,DOB,Age,Ethnic,Gender,Ax,Ay,Bx,By,Cx,Cy,DRB1x,DRB1y,DQB1x,DQB1y\n"
+
+
+class TestPersonLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "sample_data.db")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def query(self, sql):
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute(sql).fetchall()
+        conn.close()
+        return rows
+
+    def test_clean_record_normalizes_values(self):
+        cleaned = clean_record({"DONN_NUMERO": " 42 ", "DOB": "28/08/1996", "Age": "29", "Ax": "A*1:01:01",
+                                "Ay": "", "Ethnic": " HICA "})
+        self.assertEqual(cleaned, {"DONN_NUMERO": 42, "DOB": "1996-08-28", "Age": 29, "Ax": "01:01:01",
+                                   "Ay": None, "Ethnic": "HICA"})
+
+    def test_clean_record_rejects_bad_values(self):
+        for record in ({"DONN_NUMERO": ""}, {"DONN_NUMERO": "x1"}, {"DONN_NUMERO": "1", "Bx": "B7"},
+                       {"DONN_NUMERO": "1", "DOB": "not a date"}, {"DONN_NUMERO": "1", "Age": "old"}):
+            with self.assertRaises(ValueError):
+                clean_record(record)
+
+    def test_load_csv_inserts_and_rejects(self):
+        path = self.write("donors.csv", HEADER +
+                          "1,1996-08-28,29,HICA,M,A*01:01,24:07,15:02,15:17,07:01,08:01,13:02,15:01,05:02,06:04\n"
+                          "2,2001-06-14,23,HICA,F,02:01,25:01,18:01,44:02,05:01,12:03,04:01,15:01,03:01,06:02\n"
+                          ",2001-06-14,23,HICA,F,02:01,25:01,18:01,44:02,05:01,12:03,04:01,15:01,03:01,06:02\n")
+
+        counts = load_person_data(path, db_path=self.db_path, chunk_size=1)
+
+        self.assertEqual(counts, {"loaded": 2, "rejected": 1})
+        self.assertEqual(self.query("SELECT DONN_NUMERO, Ax, wmdaID FROM person_data ORDER BY DONN_NUMERO"),
+                         [(1, "01:01", None), (2, "02:01", None)])
+        # The journal mode is put back after the load
+        self.assertEqual(self.query("PRAGMA journal_mode"), [("delete",)])
+
+    def test_load_tsv_upserts_existing_rows(self):
+        conn = sqlite3.connect(self.db_path)
+        person_loader.ensure_person_data_table(conn)
+        conn.execute("INSERT INTO person_data (DONN_NUMERO, Age, Ax, wmdaID, SearchID) VALUES (1, 20, '01:01', 555, 77)")
+        conn.commit()
+        conn.close()
+
+        path = self.write("donors.tsv", "donn_numero\tage\tax\n1\t21\t03:01\n2\t30\t02:01\n")
+        counts = load_person_data(path, db_path=self.db_path)
+
+        self.assertEqual(counts, {"loaded": 2, "rejected": 0})
+        # Columns that are not in the file, such as wmdaID, keep their values
+        self.assertEqual(self.query("SELECT DONN_NUMERO, Age, Ax, wmdaID, SearchID FROM person_data ORDER BY 1"),
+                         [(1, 21, "03:01", 555, 77), (2, 30, "02:01", None, None)])
+
+    def test_upsert_clears_allele_codes(self):
+        sql = upsert_sql(("DONN_NUMERO", "Ax"), ["Ax_code"])
+        self.assertIn("ON CONFLICT(DONN_NUMERO) DO UPDATE SET Ax = excluded.Ax, Ax_code = NULL", sql)
+
+    def test_missing_key_column_is_an_error(self):
+        path = self.write("donors.csv", "id,Ax\n1,01:01\n")
+        with self.assertRaises(ValueError):
+            load_person_data(path, db_path=self.db_path)
+
+    def test_unknown_extension_needs_delimiter(self):
+        path = self.write("donors.dat", "DONN_NUMERO|Ax\n1|01:01\n")
+        with self.assertRaises(ValueError):
+            load_person_data(path, db_path=self.db_path)
+        self.assertEqual(load_person_data(path, db_path=self.db_path, delimiter="|"), {"loaded": 1, "rejected": 0})
+
+    @unittest.skipIf(person_loader.pq is None, "pyarrow is not installed")
+    def test_load_parquet(self):
+        import pyarrow as pa
+        path = os.path.join(self.tmp_dir.name, "donors.parquet")
+        person_loader.pq.write_table(pa.table({"DONN_NUMERO": [1, 2], "Ax": ["A*1:01", None]}), path)
+
+        self.assertEqual(load_person_data(path, db_path=self.db_path), {"loaded": 2, "rejected": 0})
+        self.assertEqual(self.query("SELECT DONN_NUMERO, Ax FROM person_data ORDER BY 1"), [(1, "01:01"), (2, None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from wmda_match.modules.person_columns import PERSON_COLUMNS
+from wmda_match.modules.person_repository import (PersonRepository, Donor, get_person_repository,
+                                                  invalidate_person_cache, close_person_repositories)
+from wmda_match.modules.db_writer import close_db_writers
+from wmda_match.modules.metrics import get_metrics
+
+
+class TestPersonRepository(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "sample_data.db")
+        conn = sqlite3.connect(self.db_path)
+        # DONN_NUMERO is an INTEGER as in create_table.py, so donor IDs passed as strings still match
+        conn.execute(f"CREATE TABLE person_data (DONN_NUMERO INTEGER PRIMARY KEY, {', '.join(PERSON_COLUMNS[1:])})")
+        conn.executemany(
+            f"INSERT INTO person_data VALUES ({', '.join('?' for _ in PERSON_COLUMNS)})",
+            [(2255001, "1996-08-28", 29, "HICA", "M") + ("01:01",) * 10 + (215508, 26774),
+             (6215667, "1983-04-24", 42, "HICA", "F") + ("02:01",) * 10 + (None, None)]
+        )
+        conn.commit()
+        conn.close()
+        # Writes go through the shared writer thread, which must let go of the file first
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.addCleanup(close_db_writers)
+        self.addCleanup(close_person_repositories)
+
+    def repository(self, **kwargs):
+        repository = PersonRepository(self.db_path, **kwargs)
+        self.addCleanup(repository.close)
+        return repository
+
+    def set_in_db(self, column, value, donor_id):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(f"UPDATE person_data SET {column} = ? WHERE DONN_NUMERO = ?", (value, donor_id))
+        conn.commit()
+        conn.close()
+
+    def cache_count(self, result):
+        return get_metrics().value("wmda_person_cache_total", {"result": result})
+
+    def test_rows_are_named_records(self):
+        donor = self.repository().get("2255001")
+
+        self.assertIsInstance(donor, Donor)
+        self.assertEqual(donor.wmdaID, 215508)
+        self.assertEqual(donor[15], 215508)
+        self.assertEqual(donor.SearchID, 26774)
+        self.assertIsNone(self.repository().get("999"))
+
+    def test_repeated_lookups_are_served_from_the_cache(self):
+        repository = self.repository()
+        hits, misses = self.cache_count("hit"), self.cache_count("miss")
+
+        repository.get(2255001)
+        self.set_in_db("Ethnic", "CAU", 2255001)
+
+        self.assertEqual(repository.get("2255001").Ethnic, "HICA")
+        self.assertEqual(repository.get_wmda_id("2255001"), 215508)
+        self.assertEqual(self.cache_count("hit") - hits, 2)
+        self.assertEqual(self.cache_count("miss") - misses, 1)
+        # A fresh read skips the cache and keeps the row it finds
+        self.assertEqual(repository.get("2255001", fresh=True).Ethnic, "CAU")
+        self.assertEqual(repository.get("2255001").Ethnic, "CAU")
+
+    def test_least_recently_used_row_is_dropped(self):
+        repository = self.repository(cache_size=1)
+        repository.get("2255001")
+        repository.get("6215667")
+        self.set_in_db("Ethnic", "CAU", 2255001)
+
+        self.assertEqual(repository.get("2255001").Ethnic, "CAU")
+        self.assertEqual(len(repository._cache), 1)
+
+    def test_rows_older_than_the_ttl_are_read_again(self):
+        repository = self.repository(ttl=60)
+        with patch("wmda_match.modules.person_repository.time.monotonic", return_value=1000.0):
+            repository.get("2255001")
+        self.set_in_db("SearchID", 30001, 2255001)
+
+        with patch("wmda_match.modules.person_repository.time.monotonic", return_value=1030.0):
+            self.assertEqual(repository.get_search_id("2255001"), 26774)
+        with patch("wmda_match.modules.person_repository.time.monotonic", return_value=1061.0):
+            self.assertEqual(repository.get_search_id("2255001"), 30001)
+
+    def test_writes_invalidate_the_cached_rows(self):
+        repository = self.repository()
+        repository.get("2255001")
+        repository.get("6215667")
+
+        self.assertEqual(repository.set_search_id("2255001", 30001), 1)
+        self.assertEqual(repository.set_wmda_ids([("6215667", 215509)]), 1)
+
+        self.assertEqual(repository.get_search_id("2255001"), 30001)
+        self.assertEqual(repository.get_wmda_id("6215667"), 215509)
+
+    def test_only_empty_keeps_existing_wmda_ids(self):
+        repository = self.repository()
+
+        changed = repository.set_wmda_ids([("2255001", 999), ("6215667", 215509)], only_empty=True)
+
+        self.assertEqual(changed, 1)
+        self.assertEqual(repository.get_wmda_id("2255001"), 215508)
+        self.assertEqual(repository.get_wmda_id("6215667"), 215509)
+        self.assertEqual([donor.DONN_NUMERO for donor in repository.registered_donors()], [2255001, 6215667])
+
+    def test_full_scan_does_not_hold_the_lock(self):
+        repository = self.repository()
+        found = []
+
+        # A lookup in another thread holds the lock for as long as the scan runs
+        with repository._lock:
+            scan = threading.Thread(target=lambda: found.extend(repository.registered_donors()))
+            scan.start()
+            scan.join(5)
+
+        self.assertFalse(scan.is_alive())
+        self.assertEqual([donor.wmdaID for donor in found], [215508])
+
+    def test_shared_repository_per_database(self):
+        repository = get_person_repository(self.db_path)
+        self.assertIs(repository, get_person_repository(os.path.join(self.tmp_dir.name, ".", "sample_data.db")))
+
+        repository.get("2255001")
+        self.set_in_db("Ethnic", "CAU", 2255001)
+        invalidate_person_cache(self.db_path, ["2255001"])
+
+        self.assertEqual(repository.get("2255001").Ethnic, "CAU")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import time
+import threading
+import unittest
+from unittest.mock import MagicMock
+from wmda_match.modules.rate_limiter import RateLimiter, retry_after_seconds, backoff_delay
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_token_bucket_limits_rate(self):
+        limiter = RateLimiter(rate=50, burst=1, max_concurrency=10)
+
+        start = time.monotonic()
+        for _ in range(6):
+            limiter.acquire()
+            limiter.release(200, 0.01)
+        # The first request uses the burst token, the other five wait 1/50 s each
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_token_bucket_is_off_by_default(self):
+        limiter = RateLimiter()
+
+        # Far more than the bucket's burst go through without waiting for tokens
+        for _ in range(100):
+            self.assertEqual(limiter.try_acquire(), 0)
+            limiter.release(200, 0.01)
+
+    def test_concurrency_limit_blocks_until_release(self):
+        limiter = RateLimiter(rate=None, initial_concurrency=1)
+        limiter.acquire()
+
+        acquired = threading.Event()
+        worker = threading.Thread(target=lambda: (limiter.acquire(), acquired.set()))
+        worker.start()
+        self.assertFalse(acquired.wait(0.05))
+
+        limiter.release(200, 0.01)
+        self.assertTrue(acquired.wait(1))
+        worker.join()
+
+    def test_aimd_adjusts_concurrency(self):
+        limiter = RateLimiter(rate=None, initial_concurrency=4, max_concurrency=8)
+
+        # Four successes at a limit of 4 add one slot
+        for _ in range(4):
+            limiter.acquire()
+            limiter.release(200, 0.01)
+        self.assertAlmostEqual(limiter.limit, 5, delta=0.1)
+
+        # A burst of 429s halves the limit only once
+        for _ in range(3):
+            limiter.acquire()
+            limiter.release(429, 0.01)
+        self.assertAlmostEqual(limiter.limit, 2.5, delta=0.1)
+
+    def test_try_acquire_does_not_block(self):
+        limiter = RateLimiter(rate=None, initial_concurrency=1)
+
+        self.assertEqual(limiter.try_acquire(), 0)
+        # The only slot is taken, so the caller has to wait for a release
+        self.assertIsNone(limiter.try_acquire())
+        limiter.release(200, 0.01)
+        self.assertEqual(limiter.try_acquire(), 0)
+
+        limiter.pause(30)
+        self.assertGreater(limiter.try_acquire(), 29)
+
+    def test_concurrency_starts_at_the_worker_count(self):
+        limiter = RateLimiter(rate=None, initial_concurrency=4, max_concurrency=32)
+
+        limiter.start_concurrency(8)
+        self.assertEqual(limiter.limit, 8)
+        limiter.start_concurrency(64)
+        self.assertEqual(limiter.limit, 32)
+
+        # After a 429 the AIMD value is kept
+        limiter.acquire()
+        limiter.release(429, 0.01)
+        limiter.start_concurrency(32)
+        self.assertEqual(limiter.limit, 16)
+
+    def test_pause_holds_back_requests(self):
+        limiter = RateLimiter(rate=None)
+        limiter.pause(0.1)
+
+        start = time.monotonic()
+        limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_retry_after_seconds(self):
+        self.assertEqual(retry_after_seconds(MagicMock(headers={"Retry-After": "3"})), 3.0)
+        self.assertIsNone(retry_after_seconds(MagicMock(headers={})))
+        self.assertEqual(retry_after_seconds(MagicMock(headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})), 0.0)
+
+    def test_backoff_delay_is_capped(self):
+        for attempt in range(20):
+            self.assertLessEqual(backoff_delay(attempt, base_delay=1, max_delay=10), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+from wmda_match.modules import response_cache
+from wmda_match.modules.response_cache import ResponseCache, cached_get, invalidate_patients
+from wmda_match.modules.db_writer import close_db_writers
+
+
+def make_response(status_code, data=None, etag=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = data
+    response.headers = {"ETag": etag} if etag else {}
+    return response
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(db_path=os.path.join(self.tmp_dir.name, "cache.db"),
+                                   ttls={"search_summary": 60})
+
+    def tearDown(self):
+        close_db_writers()
+        self.tmp_dir.cleanup()
+
+    def test_fresh_entry_is_served_without_request(self):
+        http_get = MagicMock(return_value=make_response(200, {"status": "Running"}, etag='"v1"'))
+
+        first, _ = cached_get(self.cache, "search_summary", "26774", "url", {}, http_get)
+        second, response = cached_get(self.cache, "search_summary", "26774", "url", {}, http_get)
+
+        self.assertEqual(first, second)
+        self.assertIsNone(response)
+        http_get.assert_called_once()
+
+    def test_stale_entry_is_revalidated_with_etag(self):
+        http_get = MagicMock(return_value=make_response(200, {"status": "Running"}, etag='"v1"'))
+        cached_get(self.cache, "search_summary", "26774", "url", {"Authorization": "Bearer t"}, http_get)
+
+        # Move past the TTL; the API replies 304 so the cached body is reused
+        http_get.return_value = make_response(304)
+        with patch("wmda_match.modules.response_cache.time.time", return_value=10 ** 10):
+            data, response = cached_get(self.cache, "search_summary", "26774", "url",
+                                        {"Authorization": "Bearer t"}, http_get)
+
+        self.assertEqual(data, {"status": "Running"})
+        self.assertEqual(http_get.call_args[1]["headers"],
+                         {"Authorization": "Bearer t", "If-None-Match": '"v1"'})
+
+    def test_errors_are_not_cached(self):
+        http_get = MagicMock(return_value=make_response(404))
+
+        data, response = cached_get(self.cache, "search_summary", "1", "url", {}, http_get)
+
+        self.assertIsNone(data)
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(self.cache.lookup("search_summary", "1"))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        self.cache.max_bytes = 60
+        with patch("wmda_match.modules.response_cache.time.time", side_effect=range(100, 200)):
+            self.cache.store("search_summary", "a", {"body": "x" * 10})
+            self.cache.store("search_summary", "b", {"body": "x" * 10})
+            self.cache.lookup("search_summary", "a")  # "a" is now more recently used than "b"
+            self.cache.store("search_summary", "c", {"body": "x" * 10})
+
+        self.assertIsNotNone(self.cache.lookup("search_summary", "a"))
+        self.assertIsNone(self.cache.lookup("search_summary", "b"))
+        self.assertIsNotNone(self.cache.lookup("search_summary", "c"))
+
+    def test_lookup_does_not_wait_for_a_write(self):
+        self.cache.store("search_summary", "1", {"ok": True})
+
+        with patch("wmda_match.modules.response_cache.get_db_writer") as mock_writer:
+            self.assertEqual(self.cache.lookup("search_summary", "1").data, {"ok": True})
+
+        # The last_access update is queued for the writer thread and never waited on
+        mock_writer.return_value.execute.assert_called_once()
+        mock_writer.return_value.execute.return_value.wait.assert_not_called()
+
+    def test_invalidated_patients_are_fetched_again(self):
+        http_get = MagicMock(return_value=make_response(200, {"searches": []}))
+        cached_get(self.cache, "patient_searches", "215508", "url", {}, http_get)
+        cached_get(self.cache, "patient_searches", "215447", "url", {}, http_get)
+
+        with patch.object(response_cache, "_cache", self.cache):
+            invalidate_patients([215508, None])
+
+        self.assertIsNone(self.cache.lookup("patient_searches", "215508"))
+        self.assertIsNotNone(self.cache.lookup("patient_searches", "215447"))
+
+    def test_no_cache_always_calls_api(self):
+        http_get = MagicMock(return_value=make_response(200, {"ok": True}))
+
+        cached_get(None, "search_summary", "1", "url", {}, http_get)
+        cached_get(None, "search_summary", "1", "url", {}, http_get)
+
+        self.assertEqual(http_get.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import json
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from wmda_match.modules.search_poller import get_outstanding_searches, poll_searches, next_delay
+
+
+class TestSearchPoller(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "sample_data.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE person_data (DONN_NUMERO INTEGER PRIMARY KEY, wmdaID INTEGER, SearchID INTEGER)")
+        conn.executemany("INSERT INTO person_data VALUES (?, ?, ?)", [
+            (2255001, 215508, 26774),
+            (6215667, 215447, 26775),
+            (3606062, 215451, 26775),  # Two donors sharing one search
+            (3717532, 215452, ""),
+        ])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_outstanding_searches_are_grouped(self):
+        self.assertEqual(get_outstanding_searches(self.db_path),
+                         {"26774": ["2255001"], "26775": ["3606062", "6215667"]})
+
+    def test_poll_until_complete(self):
+        calls = []
+        lock = threading.Lock()
+
+        def fake_fetch(search_id):
+            with lock:
+                calls.append(search_id)
+                polls = calls.count(search_id)
+            # 26774 finishes on the third poll, 26775 on the first
+            if search_id == "26774" and polls < 3:
+                return {"status": "Running"}
+            return {"status": "Completed", "searchId": search_id}
+
+        with patch("builtins.print"):
+            completed = poll_searches(db_path=self.db_path, base_delay=0.01, max_delay=0.02, fetch=fake_fetch)
+
+        self.assertEqual(set(completed), {"26774", "26775"})
+        self.assertEqual(calls.count("26774"), 3)
+        self.assertEqual(calls.count("26775"), 1)  # The shared search is requested only once
+
+        # Finished searches are stored and no longer outstanding
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute("SELECT search_id, donor_id, status, summary FROM search_results ORDER BY search_id").fetchall()
+        conn.close()
+        self.assertEqual([(r[0], r[1], r[2]) for r in rows],
+                         [("26774", "2255001", "COMPLETED"), ("26775", "3606062,6215667", "COMPLETED")])
+        self.assertEqual(json.loads(rows[0][3])["searchId"], "26774")
+        self.assertEqual(get_outstanding_searches(self.db_path), {})
+
+    def test_timeout_stops_polling(self):
+        with patch("builtins.print"):
+            completed = poll_searches(db_path=self.db_path, base_delay=0.01, max_delay=0.02, timeout=0.1,
+                                      fetch=lambda search_id: {"status": "Running"})
+
+        self.assertEqual(completed, {})
+
+    def test_next_delay_is_capped(self):
+        for attempt in range(20):
+            self.assertLessEqual(next_delay(attempt, base_delay=1, max_delay=60), 60)
+
+
+if __name__ == "__main__":
+    unittest.main()
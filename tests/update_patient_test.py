@@ -1,12 +1,20 @@
+import os
 import unittest
+import tempfile
 from unittest.mock import patch, MagicMock
 import sqlite3
 import json
 import wmda_match.modules.update_patient as update_patient
+from wmda_match.modules.auth import clear_token_cache
+from wmda_match.modules.person_repository import Donor
 
 class TestUpdatePatient(unittest.TestCase):
+
+    def setUp(self):
+        # The token is cached between calls, so start every test without one
+        clear_token_cache()
     
-    @patch("wmda_match.modules.update_patient.requests.post")
+    @patch("wmda_match.modules.auth.requests.post")
     def test_get_bearer_token_success(self, mock_post):
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -16,7 +24,7 @@ class TestUpdatePatient(unittest.TestCase):
         token = update_patient.get_bearer_token()
         self.assertEqual(token, "mock_token")
 
-    @patch("wmda_match.modules.update_patient.requests.post")
+    @patch("wmda_match.modules.auth.requests.post")
     def test_get_bearer_token_failure(self, mock_post):
         mock_response = MagicMock()
         mock_response.status_code = 400
@@ -26,57 +34,205 @@ class TestUpdatePatient(unittest.TestCase):
         token = update_patient.get_bearer_token()
         self.assertIsNone(token)
 
-    @patch("wmda_match.modules.update_patient.sqlite3.connect")
-    def test_get_existing_patient_data_found(self, mock_connect):
-        mock_conn = MagicMock()
-        mock_cursor = MagicMock()
-        mock_cursor.fetchone.return_value = ("123", "1990-01-01", "A", "Asian", "M", "A1", "A2", "B1", "B2", "C1", "C2", "DRB1_1", "DRB1_2", "DQB1_1", "DQB1_2", "WMDA123")
-        
-        mock_connect.return_value = mock_conn
-        mock_conn.cursor.return_value = mock_cursor
+    @patch("wmda_match.modules.update_patient.get_person_repository")
+    def test_get_existing_patient_data_found(self, mock_repository):
+        mock_repository.return_value.get.return_value = Donor("123", "1990-01-01", "A", "Asian", "M", "A1", "A2", "B1", "B2", "C1", "C2", "DRB1_1", "DRB1_2", "DQB1_1", "DQB1_2", "WMDA123", None)
         
         donor = update_patient.get_existing_patient_data("123")
         self.assertIsNotNone(donor)
         self.assertEqual(donor[0], "123")
+        self.assertEqual(donor.wmdaID, "WMDA123")
 
-    @patch("wmda_match.modules.update_patient.sqlite3.connect")
-    def test_get_existing_patient_data_not_found(self, mock_connect):
-        mock_conn = MagicMock()
-        mock_cursor = MagicMock()
-        mock_cursor.fetchone.return_value = None
-        
-        mock_connect.return_value = mock_conn
-        mock_conn.cursor.return_value = mock_cursor
+    @patch("wmda_match.modules.update_patient.get_person_repository")
+    def test_get_existing_patient_data_not_found(self, mock_repository):
+        mock_repository.return_value.get.return_value = None
         
         donor = update_patient.get_existing_patient_data("999")
         self.assertIsNone(donor)
 
-    @patch("wmda_match.modules.update_patient.requests.put")
+    @patch("wmda_match.modules.update_patient.save_sent_payloads")
+    @patch("wmda_match.modules.update_patient.get_client")
     @patch("wmda_match.modules.update_patient.get_bearer_token", return_value="mock_token")
-    def test_update_patient_success(self, mock_get_token, mock_put):
+    def test_update_patient_success(self, mock_get_token, mock_get_client, mock_save):
+        mock_put = mock_get_client.return_value.put
         mock_response = MagicMock()
         mock_response.status_code = 204
         mock_put.return_value = mock_response
 
-        donor_data = ("123", "1990-01-01", "A", "Asian", "M", "A1", "A2", "B1", "B2", "C1", "C2", "DRB1_1", "DRB1_2", "DQB1_1", "DQB1_2", "WMDA123")
+        donor_data = Donor("123", "1990-01-01", "A", "Asian", "M", "A1", "A2", "B1", "B2", "C1", "C2", "DRB1_1", "DRB1_2", "DQB1_1", "DQB1_2", "WMDA123", None)
         update_patient.update_patient(donor_data)
 
         mock_put.assert_called_once()
         self.assertEqual(mock_put.call_args[1]["headers"]["Authorization"], "Bearer mock_token")
+        mock_save.assert_called_once()
 
-    @patch("wmda_match.modules.update_patient.requests.put")
+    @patch("wmda_match.modules.update_patient.get_client")
     @patch("wmda_match.modules.update_patient.get_bearer_token", return_value="mock_token")
-    def test_update_patient_failure(self, mock_get_token, mock_put):
+    def test_update_patient_failure(self, mock_get_token, mock_get_client):
+        mock_put = mock_get_client.return_value.put
         mock_response = MagicMock()
         mock_response.status_code = 400
         mock_response.text = "Bad Request"
         mock_put.return_value = mock_response
 
-        donor_data = ("123", "1990-01-01", "A", "Asian", "M", "A1", "A2", "B1", "B2", "C1", "C2", "DRB1_1", "DRB1_2", "DQB1_1", "DQB1_2", "WMDA123")
+        donor_data = Donor("123", "1990-01-01", "A", "Asian", "M", "A1", "A2", "B1", "B2", "C1", "C2", "DRB1_1", "DRB1_2", "DQB1_1", "DQB1_2", "WMDA123", None)
         update_patient.update_patient(donor_data)
 
         mock_put.assert_called_once()
         self.assertEqual(mock_put.call_args[1]["headers"]["Authorization"], "Bearer mock_token")
 
+
+class TestUpdatePatientsBulk(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "sample_data.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("""
+            CREATE TABLE person_data (
+                DONN_NUMERO INTEGER PRIMARY KEY, DOB TEXT, Age INTEGER, Ethnic TEXT, Gender TEXT,
+                Ax TEXT, Ay TEXT, Bx TEXT, By TEXT, Cx TEXT, Cy TEXT,
+                DRB1x TEXT, DRB1y TEXT, DQB1x TEXT, DQB1y TEXT, wmdaID INTEGER, SearchID INTEGER
+            )
+        """)
+        conn.executemany("INSERT INTO person_data VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+            (2255001, "1996-08-28", 29, "HICA", "M") + ("01:01",) * 10 + (215508, ""),
+            (6215667, "2001-06-14", 23, "HICA", "F") + ("02:01",) * 10 + (215447, ""),
+            (3606062, "2000-02-15", 24, "HICA", "F") + ("03:01",) * 10 + ("", ""),  # Not on the WMDA yet
+        ])
+        conn.commit()
+        conn.close()
+
+        patcher = patch("wmda_match.modules.update_patient.get_bearer_token", return_value="mock_token")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("wmda_match.modules.update_patient.get_client")
+        self.mock_put = patcher.start().return_value.put
+        self.mock_put.return_value = MagicMock(status_code=204)
+        self.addCleanup(patcher.stop)
+        patcher = patch("builtins.print")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def statuses(self, results):
+        return {r["donor_id"]: r["status"] for r in results}
+
+    def test_each_request_uses_the_current_token(self):
+        # The token is refreshed after the first request of the run
+        with patch("wmda_match.modules.update_patient.get_bearer_token", side_effect=["token-1", "token-1", "token-2"]):
+            update_patient.update_patients_bulk(max_workers=1, db_path=self.db_path)
+
+        tokens = [c[1]["headers"]["Authorization"] for c in self.mock_put.call_args_list]
+        self.assertEqual(tokens, ["Bearer token-1", "Bearer token-2"])
+
+    def test_only_changed_patients_are_sent(self):
+        # First run sends everything registered on the WMDA
+        results = update_patient.update_patients_bulk(db_path=self.db_path)
+        self.assertEqual(self.statuses(results), {"2255001": "updated", "6215667": "updated"})
+        self.assertEqual(self.mock_put.call_count, 2)
+
+        # Nothing changed: nothing is sent
+        self.mock_put.reset_mock()
+        results = update_patient.update_patients_bulk(db_path=self.db_path)
+        self.assertEqual(self.statuses(results), {"2255001": "unchanged", "6215667": "unchanged"})
+        self.mock_put.assert_not_called()
+
+        # One corrected typing: only that patient is sent
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("UPDATE person_data SET Ax = '01:02' WHERE DONN_NUMERO = 2255001")
+        conn.commit()
+        conn.close()
+        results = update_patient.update_patients_bulk(db_path=self.db_path)
+        self.assertEqual(self.statuses(results), {"2255001": "updated", "6215667": "unchanged"})
+        self.assertEqual(self.mock_put.call_args[1]["json"]["hla"]["a"]["field1"], "01:02")
+
+    def test_failed_updates_are_retried(self):
+        self.mock_put.return_value = MagicMock(status_code=500, text="Server error")
+        update_patient.update_patients_bulk(["2255001"], db_path=self.db_path)
+
+        self.mock_put.return_value = MagicMock(status_code=204)
+        results = update_patient.update_patients_bulk(["2255001"], db_path=self.db_path)
+        self.assertEqual(self.statuses(results), {"2255001": "updated"})
+
+    def test_force_sends_unchanged_patients(self):
+        update_patient.update_patients_bulk(db_path=self.db_path)
+        self.mock_put.reset_mock()
+
+        update_patient.update_patients_bulk(db_path=self.db_path, force=True)
+        self.assertEqual(self.mock_put.call_count, 2)
+
+    def test_patch_sends_only_changed_fields(self):
+        mock_patch = update_patient.get_client.return_value.patch
+        mock_patch.return_value = MagicMock(status_code=204)
+        update_patient.update_patients_bulk(db_path=self.db_path)
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("UPDATE person_data SET DRB1y = '15:02' WHERE DONN_NUMERO = 2255001")
+        conn.commit()
+        conn.close()
+        self.mock_put.reset_mock()
+        results = update_patient.update_patients_bulk(db_path=self.db_path, use_patch=True)
+
+        self.assertEqual(self.statuses(results), {"2255001": "updated", "6215667": "unchanged"})
+        self.mock_put.assert_not_called()
+        self.assertEqual(mock_patch.call_args[0][0], update_patient.api_url("/patients/215508"))
+        self.assertEqual(mock_patch.call_args[1]["json"],
+                         [{"op": "replace", "path": "/hla/drb1/field2", "value": "15:02"}])
+
+        # The patched document is the new baseline
+        results = update_patient.update_patients_bulk(db_path=self.db_path, use_patch=True)
+        self.assertEqual(self.statuses(results), {"2255001": "unchanged", "6215667": "unchanged"})
+
+    def test_rejected_patch_falls_back_to_put(self):
+        mock_patch = update_patient.get_client.return_value.patch
+        mock_patch.return_value = MagicMock(status_code=415, text="Unsupported Media Type")
+        update_patient.update_patients_bulk(["2255001"], db_path=self.db_path)
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("UPDATE person_data SET Ethnic = 'CAU' WHERE DONN_NUMERO = 2255001")
+        conn.commit()
+        conn.close()
+        self.mock_put.reset_mock()
+        results = update_patient.update_patients_bulk(["2255001"], db_path=self.db_path, use_patch=True)
+
+        self.assertEqual(self.statuses(results), {"2255001": "updated"})
+        mock_patch.assert_called_once()
+        self.mock_put.assert_called_once()
+        self.assertEqual(self.mock_put.call_args[1]["json"]["ethnicity"], "CAU")
+
+    def test_interrupted_run_is_resumed_without_resending(self):
+        self.mock_put.side_effect = [MagicMock(status_code=204), KeyboardInterrupt()]
+        with self.assertRaises(KeyboardInterrupt):
+            update_patient.update_patients_bulk(db_path=self.db_path, max_workers=1, force=True)
+
+        self.mock_put.side_effect = None
+        self.mock_put.reset_mock()
+        results = update_patient.update_patients_bulk(db_path=self.db_path, resume=True)
+
+        # Only the donor that was interrupted is sent, with the options of the original run
+        self.assertEqual(self.statuses(results), {"6215667": "updated"})
+        self.mock_put.assert_called_once()
+        # The run is finished, so there is nothing left to resume
+        self.assertEqual(update_patient.update_patients_bulk(db_path=self.db_path, resume=True), [])
+
+    def test_make_json_patch(self):
+        old = {"wmdaId": 1, "hla": {"a": {"field1": "01:01", "field2": "02:01"}}, "weight": 76}
+        new = {"wmdaId": 1, "hla": {"a": {"field1": "01:01", "field2": "03:01"}}, "abo": "A"}
+
+        self.assertEqual(update_patient.make_json_patch(old, new), [
+            {"op": "remove", "path": "/weight"},
+            {"op": "replace", "path": "/hla/a/field2", "value": "03:01"},
+            {"op": "add", "path": "/abo", "value": "A"},
+        ])
+        self.assertEqual(update_patient.make_json_patch(new, new), [])
+
+    def test_payload_hash_ignores_key_order(self):
+        self.assertEqual(update_patient.payload_hash({"a": 1, "b": 2}), update_patient.payload_hash({"b": 2, "a": 1}))
+        self.assertNotEqual(update_patient.payload_hash({"a": 1}), update_patient.payload_hash({"a": 2}))
+
+
 if __name__ == "__main__":
     unittest.main()
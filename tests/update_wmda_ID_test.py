@@ -0,0 +1,106 @@
+import os
+import sqlite3
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+from wmda_match.modules.update_wmda_ID import update_wmda_ids_bulk
+from wmda_match.modules.db_writer import close_db_writers
+
+# Function that you want to test
+def update_wmda_id_in_db(donor_id, wmda_id):
+    conn = sqlite3.connect('tests.sample_data.db')
+    cursor = conn.cursor()
+    query = "UPDATE person_data SET wmdaId = ? WHERE DONN_NUMERO = ?"
+    cursor.execute(query, (wmda_id, donor_id))
+    conn.commit()
+    conn.close()
+
+# Test class
+class TestUpdateWmdaId(TestCase):
+
+    @patch('sqlite3.connect')  # Patch sqlite3.connect to mock database connection
+    def test_update_wmda_id_in_db(self, mock_connect):
+        # Set up an in-memory SQLite database for testing
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+
+        # Set the mock cursor to return the mock data when fetchone is called
+        mock_cursor.fetchone.return_value = ('mock_wmda_id',)
+
+        # Assign the mock cursor to the mock connection
+        mock_conn.cursor.return_value = mock_cursor
+
+        # Patch the connect method to return the mock connection
+        mock_connect.return_value = mock_conn
+
+        donor_id = '12345'
+        wmda_id = 'mock_wmda_id'
+
+        # Call the function to update the wmdaId
+        update_wmda_id_in_db(donor_id, wmda_id)
+
+        # Verify the wmdaId was updated correctly
+        mock_cursor.execute.assert_called_with(
+            "UPDATE person_data SET wmdaId = ? WHERE DONN_NUMERO = ?",
+            (wmda_id, donor_id)
+        )
+
+        # Now call fetchone and check if the wmdaId was updated
+        mock_cursor.execute("SELECT wmdaId FROM person_data WHERE DONN_NUMERO = ?", (donor_id,))
+        updated_wmda_id = mock_cursor.fetchone()[0]
+
+        self.assertEqual(updated_wmda_id, wmda_id)  # Check if the wmdaId was updated correctly
+
+class TestUpdateWmdaIdsBulk(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'sample_data.db')
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE person_data (DONN_NUMERO INTEGER PRIMARY KEY, wmdaID INTEGER, SearchID INTEGER)")
+        conn.executemany("INSERT INTO person_data VALUES (?, ?, ?)", [
+            (2255001, '', ''),
+            (6215667, None, ''),
+            (3606062, 215451, ''),
+        ])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        close_db_writers()
+        self.tmp_dir.cleanup()
+
+    def wmda_ids(self):
+        conn = sqlite3.connect(self.db_path)
+        rows = dict(conn.execute("SELECT DONN_NUMERO, wmdaID FROM person_data").fetchall())
+        conn.close()
+        return rows
+
+    def test_only_empty_or_null_ids_are_filled(self):
+        pairs = [('2255001', 215508), ('6215667', 215447), ('3606062', 999999), ('9999999', 1)]
+
+        counts = update_wmda_ids_bulk(iter(pairs), db_path=self.db_path)
+
+        self.assertEqual(counts, {'updated': 2, 'skipped': 1, 'not_found': 1, 'invalid': 0})
+        self.assertEqual(self.wmda_ids(), {2255001: 215508, 6215667: 215447, 3606062: 215451})
+
+    def test_malformed_patient_ids_are_left_out(self):
+        # A None patientId must not be given a rowid that matches some other donor
+        pairs = [(None, 111111), ('MypId-01', 222222), ('6215667', 'x'), (' 2255001 ', '215508')]
+
+        counts = update_wmda_ids_bulk(pairs, db_path=self.db_path)
+
+        self.assertEqual(counts, {'updated': 1, 'skipped': 0, 'not_found': 0, 'invalid': 3})
+        self.assertEqual(self.wmda_ids(), {2255001: 215508, 6215667: None, 3606062: 215451})
+
+    def test_temp_table_is_dropped_between_runs(self):
+        update_wmda_ids_bulk([('2255001', 215508)], db_path=self.db_path)
+        counts = update_wmda_ids_bulk([('6215667', 215447)], db_path=self.db_path)
+
+        self.assertEqual(counts, {'updated': 1, 'skipped': 0, 'not_found': 0, 'invalid': 0})
+
+# To run the test
+if __name__ == '__main__':
+    import unittest
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import requests
+from unittest.mock import patch, MagicMock
+from wmda_match.modules import wmda_client
+from wmda_match.modules.wmda_client import WMDAClient
+from wmda_match.modules.rate_limiter import RateLimiter
+
+
+class TestWMDAClient(unittest.TestCase):
+
+    def test_session_uses_pooled_adapter(self):
+        client = WMDAClient(pool_size=25, user_agent='test-agent', headers={'Accept': 'application/json'})
+
+        adapter = client.session.get_adapter('https://sandbox-search-api.wmda.info')
+        self.assertEqual(adapter._pool_maxsize, 25)
+        self.assertEqual(client.session.headers['User-Agent'], 'test-agent')
+        self.assertEqual(client.session.headers['Accept'], 'application/json')
+
+    def test_request_applies_default_timeout(self):
+        client = WMDAClient(timeout=7)
+        with patch.object(client.session, 'request') as mock_request:
+            client.get('https://example.org/api', params={'Limit': 1})
+
+        mock_request.assert_called_once_with('GET', 'https://example.org/api', params={'Limit': 1}, timeout=7)
+
+    def test_token_provider_adds_authorization(self):
+        provider = MagicMock()
+        provider.get_token.return_value = 'provided_token'
+        client = WMDAClient(token_provider=provider)
+
+        with patch.object(client.session, 'request') as mock_request:
+            client.post('https://example.org/api', headers={'Content-Type': 'application/json'}, json={})
+            client.put('https://example.org/api', headers={'Authorization': 'Bearer explicit'})
+
+        first_headers = mock_request.call_args_list[0][1]['headers']
+        second_headers = mock_request.call_args_list[1][1]['headers']
+        self.assertEqual(first_headers['Authorization'], 'Bearer provided_token')
+        self.assertEqual(second_headers['Authorization'], 'Bearer explicit')
+
+    def test_throttled_get_is_retried_after_retry_after(self):
+        limiter = RateLimiter(rate=None)
+        client = WMDAClient(rate_limiter=limiter, backoff_base=0)
+        throttled = MagicMock(status_code=429, headers={'Retry-After': '0'})
+        ok = MagicMock(status_code=200, headers={})
+
+        with patch.object(client.session, 'request', side_effect=[throttled, ok]) as mock_request:
+            response = client.get('https://example.org/api')
+
+        self.assertIs(response, ok)
+        self.assertEqual(mock_request.call_count, 2)
+
+    def test_post_is_retried_only_on_429(self):
+        client = WMDAClient(backoff_base=0)
+        unavailable = MagicMock(status_code=503, headers={})
+
+        with patch.object(client.session, 'request', return_value=unavailable) as mock_request:
+            response = client.post('https://example.org/api', json={})
+
+        self.assertEqual(response.status_code, 503)
+        mock_request.assert_called_once()
+
+    def test_retries_stop_after_max_retries(self):
+        client = WMDAClient(max_retries=2, backoff_base=0)
+        unavailable = MagicMock(status_code=503, headers={})
+
+        with patch.object(client.session, 'request', return_value=unavailable) as mock_request:
+            response = client.put('https://example.org/api', json={})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(mock_request.call_count, 3)
+
+    def test_connection_errors_are_retried_for_idempotent_requests(self):
+        client = WMDAClient(backoff_base=0)
+        ok = MagicMock(status_code=200, headers={})
+
+        with patch.object(client.session, 'request', side_effect=[requests.ConnectionError(), ok]):
+            self.assertIs(client.get('https://example.org/api'), ok)
+        with patch.object(client.session, 'request', side_effect=requests.ConnectionError()):
+            with self.assertRaises(requests.ConnectionError):
+                client.post('https://example.org/api', json={})
+
+    def test_get_client_returns_shared_instance(self):
+        with patch.object(wmda_client, '_client', None):
+            self.assertIs(wmda_client.get_client(), wmda_client.get_client())
+
+
+if __name__ == '__main__':
+    unittest.main()
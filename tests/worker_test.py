@@ -0,0 +1,173 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+from wmda_match.modules import worker
+from wmda_match.modules.person_repository import Donor
+from wmda_match.modules.worker import (enqueue_jobs, claim_jobs, run_worker, requeue_stale_jobs, job_counts, Job,
+                                       DONE, RETRY, WAIT, FAILED)
+
+
+class TestWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "sample_data.db")
+        # Keep the job output out of the test log
+        print_patch = patch("builtins.print")
+        print_patch.start()
+        self.addCleanup(print_patch.stop)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def jobs(self):
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute("SELECT donor_id, status, attempts, duration, result, not_before FROM jobs ORDER BY id").fetchall()
+        conn.close()
+        return rows
+
+    def test_runs_jobs_and_records_timings(self):
+        handler = MagicMock(return_value=(DONE, "Created"))
+        enqueue_jobs("create", ["1", "2", "3"], db_path=self.db_path)
+
+        with patch.dict(worker.HANDLERS, {"create": handler}):
+            counts = run_worker(self.db_path, concurrency=2, poll_interval=0.01, once=True)
+
+        self.assertEqual(counts, {"done": 3})
+        self.assertEqual(handler.call_count, 3)
+        # Handlers read and write the donors in the same database as the jobs table
+        self.assertEqual({c.args[1] for c in handler.call_args_list}, {self.db_path})
+        for donor_id, status, attempts, duration, result, _ in self.jobs():
+            self.assertEqual((status, attempts, result), ("done", 1, "Created"))
+            self.assertIsNotNone(duration)
+
+    @patch("wmda_match.modules.worker.backoff_delay", return_value=0)
+    def test_failed_jobs_are_retried_up_to_max_attempts(self, _):
+        handler = MagicMock(side_effect=[(RETRY, "Create failed"), RuntimeError("boom"), (RETRY, "Create failed")])
+        enqueue_jobs("create", ["1"], max_attempts=3, db_path=self.db_path)
+
+        with patch.dict(worker.HANDLERS, {"create": handler}):
+            run_worker(self.db_path, concurrency=1, poll_interval=0.01, once=True)
+
+        self.assertEqual(handler.call_count, 3)
+        self.assertEqual(self.jobs()[0][1:3], ("failed", 3))
+
+    def test_waiting_poll_is_rescheduled_without_using_an_attempt(self):
+        enqueue_jobs("poll-summary", ["1"], db_path=self.db_path)
+
+        with patch.dict(worker.HANDLERS, {"poll-summary": MagicMock(return_value=(WAIT, "Search still running"))}):
+            counts = run_worker(self.db_path, concurrency=1, poll_interval=0.01, once=True)
+
+        self.assertEqual(counts, {"pending": 1})
+        _, status, attempts, _, _, not_before = self.jobs()[0]
+        self.assertEqual((status, attempts), ("pending", 0))
+        self.assertGreater(not_before, 0)
+        # The job is not runnable again until its delay has passed
+        self.assertEqual(claim_jobs(10, "test", self.db_path), [])
+
+    def test_claimed_jobs_are_not_claimed_twice(self):
+        enqueue_jobs("update", ["1", "2", "3"], payload={"patch": True}, db_path=self.db_path)
+
+        first = claim_jobs(2, "a", self.db_path)
+        second = claim_jobs(2, "b", self.db_path)
+
+        self.assertEqual([job.donor_id for job in first], ["1", "2"])
+        self.assertEqual([job.donor_id for job in second], ["3"])
+        self.assertEqual(first[0].payload, {"patch": True})
+        self.assertEqual(job_counts(self.db_path), {("update", "running"): 3})
+
+    def test_stale_running_jobs_are_requeued(self):
+        enqueue_jobs("create", ["1"], db_path=self.db_path)
+        claim_jobs(1, "dead-worker", self.db_path, now=0)
+
+        self.assertEqual(requeue_stale_jobs(self.db_path), 1)
+        self.assertEqual(job_counts(self.db_path), {("create", "pending"): 1})
+
+    def test_stop_event_lets_running_jobs_finish(self):
+        stop_event = threading.Event()
+
+        def handler(job, db_path):
+            stop_event.set()
+            return DONE, "Created"
+
+        enqueue_jobs("create", ["1", "2"], db_path=self.db_path)
+        with patch.dict(worker.HANDLERS, {"create": handler}):
+            counts = run_worker(self.db_path, concurrency=1, poll_interval=0.01, stop_event=stop_event)
+
+        self.assertEqual(counts, {"done": 1})
+        self.assertEqual(job_counts(self.db_path), {("create", "done"): 1, ("create", "pending"): 1})
+
+    def test_unknown_kind_is_rejected(self):
+        with self.assertRaises(ValueError):
+            enqueue_jobs("delete", ["1"], db_path=self.db_path)
+
+
+class TestJobHandlers(unittest.TestCase):
+
+    def donor(self, wmda_id="", search_id=""):
+        return Donor._make((1, "1996-08-28", 29, "HICA", "M") + ("01:01",) * 10 + (wmda_id, search_id))
+
+    @patch("wmda_match.modules.worker.create_patient")
+    @patch("wmda_match.modules.worker.get_donor_data")
+    def test_create_skips_donors_already_created(self, mock_get_donor, mock_create):
+        mock_get_donor.return_value = self.donor(wmda_id=555)
+
+        outcome, _ = worker.run_create(Job(1, "create", "1", None, 1, 3))
+
+        self.assertEqual(outcome, DONE)
+        mock_create.assert_not_called()
+
+    @patch("wmda_match.modules.worker.create_patient", return_value=False)
+    @patch("wmda_match.modules.worker.get_donor_data")
+    def test_failed_create_is_retried(self, mock_get_donor, mock_create):
+        mock_get_donor.return_value = self.donor()
+        self.assertEqual(worker.run_create(Job(1, "create", "1", None, 1, 3))[0], RETRY)
+
+    @patch("wmda_match.modules.worker.save_wmda_ids")
+    @patch("wmda_match.modules.worker.lookup_wmda_ids", return_value={"1": 215600})
+    @patch("wmda_match.modules.worker.get_bearer_token", return_value="mocked_token")
+    @patch("wmda_match.modules.worker.create_patient")
+    @patch("wmda_match.modules.worker.get_donor_data")
+    def test_retried_create_found_on_wmda_is_not_posted_again(self, mock_get_donor, mock_create, _, mock_lookup,
+                                                              mock_save):
+        mock_get_donor.return_value = self.donor()
+
+        # The first attempt posts straight away
+        mock_create.return_value = True
+        self.assertEqual(worker.run_create(Job(1, "create", "1", None, 1, 3))[0], DONE)
+        mock_lookup.assert_not_called()
+
+        # A retry looks the donor up first, and stores the wmdaId instead of posting again
+        mock_create.reset_mock()
+        self.assertEqual(worker.run_create(Job(1, "create", "1", None, 2, 3))[0], DONE)
+        mock_lookup.assert_called_once_with([1], "mocked_token")
+        mock_save.assert_called_once_with([(1, 215600)], 'sample_data.db')
+        mock_create.assert_not_called()
+
+        # A retry for a donor the WMDA does not have posts it
+        mock_lookup.return_value = {}
+        self.assertEqual(worker.run_create(Job(1, "create", "1", None, 3, 3))[0], DONE)
+        mock_create.assert_called_once()
+
+    @patch("wmda_match.modules.worker.get_existing_patient_data", return_value=None)
+    def test_missing_donor_fails(self, mock_get_donor):
+        self.assertEqual(worker.run_update(Job(1, "update", "1", None, 1, 3))[0], FAILED)
+        mock_get_donor.assert_called_once_with("1", 'sample_data.db', fresh=True)
+
+    @patch("wmda_match.modules.worker.save_search_result")
+    @patch("wmda_match.modules.worker.fetch_search_summary")
+    @patch("wmda_match.modules.worker.get_search_id", return_value=26774)
+    def test_poll_summary(self, _, mock_fetch, mock_save):
+        mock_fetch.return_value = {"status": "RUNNING"}
+        self.assertEqual(worker.run_poll_summary(Job(1, "poll-summary", "1", None, 1, 3))[0], WAIT)
+
+        mock_fetch.return_value = {"status": "COMPLETED"}
+        self.assertEqual(worker.run_poll_summary(Job(1, "poll-summary", "1", None, 1, 3))[0], DONE)
+        mock_save.assert_called_once_with(26774, ["1"], {"status": "COMPLETED"}, 'sample_data.db')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import sys
+import importlib
+
+from wmda_match.modules.config import load_config, missing_settings, SETTINGS
+
+# Subcommands and the module under wmda_match.modules whose main(argv) runs them.
+# A module is only imported when its command is run, so short commands and --help
+# do not pay for requests, numpy and the rest.
+COMMANDS = {
+    "create": ("create_patient", "Create patients on the WMDA from person_data"),
+    "update": ("update_patient", "Send changed donors to the WMDA"),
+    "sync-ids": ("update_wmda_ID", "Fill empty wmdaIDs from the WMDA patient list"),
+    "list": ("patient_list", "Print every patient registered on the WMDA"),
+    "search": ("create_patient_search", "Start a search for a registered patient"),
+    "search-list": ("patient_search_list", "Show every search for a patient"),
+    "summary": ("patientsummary", "Show the search summary for a patient"),
+    "sync": ("patient_sync", "Copy patients changed since the last run into wmda_patients"),
+    "poll": ("search_poller", "Wait for outstanding searches and store their summaries"),
+    "worker": ("worker", "Run queued jobs from the jobs table in one long-lived process"),
+    "load": ("person_loader", "Stream a CSV, TSV or Parquet extract into person_data"),
+    "migrate": ("migrations", "Upgrade the SQLite schema"),
+    "encode-alleles": ("allele_dictionary", "Fill the allele dictionary and the *_code columns"),
+    "match": ("hla_match", "Rank local donors by HLA mismatches"),
+    "benchmark": ("benchmark", "Measure throughput and latency against the fake server"),
+    "fake-server": ("fake_wmda", "Run the local fake WMDA server"),
+}
+
+# Settings whose values are never printed
+SECRET_SETTINGS = {"CLIENT_SECRET"}
+
+
+def usage():
+    lines = ["usage: python -m wmda_match <command> [options]", "", "commands:"]
+    for command, (_, description) in COMMANDS.items():
+        lines.append(f"  {command:<16}{description}")
+    lines.append(f"  {'config':<16}Show which settings are set")
+    lines += ["", "Run 'python -m wmda_match <command> --help' for the options of a command."]
+    return "\n".join(lines)
+
+
+def show_config():
+    """
+    Print every setting, hiding secrets, and return 1 if a required one is missing.
+    """
+    for name, description in SETTINGS.items():
+        value = os.getenv(name)
+        if value and name in SECRET_SETTINGS:
+            value = "(set)"
+        print(f"{name:<18}{value or '(not set)':<50}{description}")
+    missing = missing_settings()
+    if missing:
+        print(f"\nMissing: {', '.join(missing)}")
+        return 1
+    return 0
+
+
+def main(argv=None):
+    """
+    Run one wmda_match command, loading the .env file once first.
+
+    Returns:
+        int: Exit status of the command.
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return 0
+
+    command, args = argv[0], argv[1:]
+    if command != "config" and command not in COMMANDS:
+        print(f"Unknown command {command!r}\n\n{usage()}")
+        return 2
+
+    load_config()
+    if command == "config":
+        return show_config()
+
+    module = importlib.import_module(f"wmda_match.modules.{COMMANDS[command][0]}")
+    result = module.main(args)
+    return result if isinstance(result, int) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
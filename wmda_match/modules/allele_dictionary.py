@@ -0,0 +1,194 @@
+import re
+import sqlite3
+import argparse
+
+try:
+    from wmda_match.modules.metrics import timed_db
+except ImportError:  # Running this file directly from wmda_match/modules
+    from metrics import timed_db
+
+# HLA loci and their two typing columns in person_data
+LOCI = [("A", "Ax", "Ay"), ("B", "Bx", "By"), ("C", "Cx", "Cy"), ("DRB1", "DRB1x", "DRB1y"), ("DQB1", "DQB1x", "DQB1y")]
+HLA_COLUMNS = [column for _, x, y in LOCI for column in (x, y)]
+LOCUS_BY_COLUMN = {column: locus for locus, x, y in LOCI for column in (x, y)}
+
+# Integer-coded companion column for each HLA column, e.g. Ax -> Ax_code
+CODE_COLUMNS = {column: f"{column}_code" for column in HLA_COLUMNS}
+
+# One allele field: two or more digits, with an optional expression suffix (N, L, S, Q, ...) on the last field
+FIELD_PATTERN = re.compile(r"^(\d+)([A-Z]?)$")
+
+
+def split_allele(allele):
+    """
+    Function to split an HLA typing such as 'A*01:01:01:01' into its fields.
+
+    Returns:
+        list: The fields as strings, e.g. ['01', '01', '01', '01']; empty for a missing typing.
+    """
+    if allele is None:
+        return []
+    allele = str(allele).strip()
+    if "*" in allele:
+        allele = allele.split("*", 1)[1]
+    return [field for field in allele.split(":") if field]
+
+
+def normalize_allele(allele):
+    """
+    Function to bring an HLA typing into the canonical form used in payloads and the allele dictionary.
+
+    The locus prefix ('A*', 'HLA-A*') and surrounding whitespace are removed and
+    single-digit fields are zero-padded, so 'A*1:01:01' becomes '01:01:01'.
+    Values that are not colon-separated allele fields are returned unchanged.
+
+    Returns:
+        str or None: The normalized typing, or None for an empty value.
+    """
+    if allele is None or str(allele).strip() == "":
+        return None
+
+    fields = split_allele(allele)
+    normalized = []
+    for i, field in enumerate(fields):
+        match = FIELD_PATTERN.match(field)
+        # Only the last field may carry an expression suffix
+        if match is None or (match.group(2) and i != len(fields) - 1):
+            return allele
+        normalized.append(match.group(1).zfill(2) + match.group(2))
+    return ":".join(normalized) if normalized else allele
+
+
+def truncate_allele(allele, fields):
+    """
+    Function to reduce a normalized typing to its first few fields, e.g. '01:01:01:02N' to '01:01' at 2 fields.
+
+    The expression suffix belongs to the full allele, so it is only kept when no field is dropped.
+
+    Returns:
+        str or None: The truncated typing, or None if the typing is not an allele or has fewer fields than requested.
+    """
+    matches = [FIELD_PATTERN.match(part) for part in split_allele(allele)]
+    if len(matches) < fields or not all(matches):
+        return None
+
+    suffix = matches[-1].group(2) if fields == len(matches) else ""
+    return ":".join(match.group(1) for match in matches[:fields]) + suffix
+
+
+def ensure_allele_tables(conn):
+    """
+    Create the hla_alleles dictionary and add the *_code columns to person_data if they are missing.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS hla_alleles (
+            id INTEGER PRIMARY KEY,
+            locus TEXT NOT NULL,
+            allele TEXT NOT NULL,
+            field1 TEXT,
+            field2 TEXT,
+            field3 TEXT,
+            field4 TEXT,
+            UNIQUE (locus, allele)
+        )
+    ''')
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(person_data)")}
+    for code_column in CODE_COLUMNS.values():
+        if code_column not in existing:
+            conn.execute(f"ALTER TABLE person_data ADD COLUMN {code_column} INTEGER")
+
+
+def load_allele_ids(conn):
+    """
+    Function to read the dictionary into memory.
+
+    Returns:
+        dict: Allele IDs keyed by (locus, normalized allele).
+    """
+    return {(locus, allele): allele_id for allele_id, locus, allele in
+            conn.execute("SELECT id, locus, allele FROM hla_alleles")}
+
+
+def intern_allele(conn, allele_ids, locus, allele):
+    """
+    Function to return the ID of an allele, adding it to the dictionary if it is new.
+
+    Args:
+        conn (sqlite3.Connection): Open connection; the caller commits.
+        allele_ids (dict): The in-memory dictionary from load_allele_ids, updated in place.
+        locus (str): The locus, e.g. 'DRB1'.
+        allele (str): The typing as stored in person_data.
+
+    Returns:
+        int or None: The allele ID, or None for an empty typing.
+    """
+    allele = normalize_allele(allele)
+    if allele is None:
+        return None
+
+    key = (locus, allele)
+    if key not in allele_ids:
+        cursor = conn.execute(
+            "INSERT INTO hla_alleles (locus, allele, field1, field2, field3, field4) VALUES (?, ?, ?, ?, ?, ?)",
+            (locus, allele) + tuple(truncate_allele(allele, n) for n in range(1, 5))
+        )
+        allele_ids[key] = cursor.lastrowid
+    return allele_ids[key]
+
+
+@timed_db("encode_person_data")
+def encode_person_data(db_path='sample_data.db', reencode=False):
+    """
+    Function to fill the *_code columns of person_data from the allele dictionary.
+
+    Only rows with a typing but no code are encoded, so the function can be run
+    again after new donors are loaded. Everything happens in one transaction.
+
+    Args:
+        db_path (str): Path of the SQLite database.
+        reencode (bool): Encode every row again, e.g. after editing typings in place.
+
+    Returns:
+        int: Number of rows encoded.
+    """
+    conn = sqlite3.connect(db_path)
+    ensure_allele_tables(conn)
+    allele_ids = load_allele_ids(conn)
+
+    query = f"SELECT DONN_NUMERO, {', '.join(HLA_COLUMNS)} FROM person_data"
+    if not reencode:
+        query += " WHERE " + " OR ".join(
+            f"({column} IS NOT NULL AND {column} != '' AND {CODE_COLUMNS[column]} IS NULL)" for column in HLA_COLUMNS
+        )
+
+    updates = []
+    for row in conn.execute(query).fetchall():
+        codes = [intern_allele(conn, allele_ids, LOCUS_BY_COLUMN[column], value)
+                 for column, value in zip(HLA_COLUMNS, row[1:])]
+        updates.append(tuple(codes) + (row[0],))
+
+    assignments = ", ".join(f"{CODE_COLUMNS[column]} = ?" for column in HLA_COLUMNS)
+    conn.executemany(f"UPDATE person_data SET {assignments} WHERE DONN_NUMERO = ?", updates)
+    conn.commit()
+    conn.close()
+    return len(updates)
+
+
+def main(argv=None):
+    """
+    Main function to build the allele dictionary and encode every HLA column of person_data.
+    """
+    parser = argparse.ArgumentParser(description="Encode the HLA columns of person_data as allele dictionary IDs.")
+    parser.add_argument("--reencode", action="store_true", help="Encode every row again, not only new ones")
+    args = parser.parse_args(argv)
+
+    encoded = encode_person_data(reencode=args.reencode)
+
+    conn = sqlite3.connect('sample_data.db')
+    alleles = conn.execute("SELECT COUNT(*) FROM hla_alleles").fetchone()[0]
+    conn.close()
+    print(f"Encoded {encoded} rows; the dictionary holds {alleles} distinct alleles")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import os
+import time
+import asyncio
+import httpx
+
+try:
+    from wmda_match.modules.auth import get_token_provider
+    from wmda_match.modules.wmda_client import (api_url, DEFAULT_MAX_RETRIES, IDEMPOTENT_METHODS,
+                                                RETRY_STATUSES)
+    from wmda_match.modules.rate_limiter import get_rate_limiter, retry_after_seconds, backoff_delay
+    from wmda_match.modules.metrics import get_metrics
+except ImportError:  # Running this file directly from wmda_match/modules
+    from auth import get_token_provider
+    from wmda_client import api_url, DEFAULT_MAX_RETRIES, IDEMPOTENT_METHODS, RETRY_STATUSES
+    from rate_limiter import get_rate_limiter, retry_after_seconds, backoff_delay
+    from metrics import get_metrics
+
+# Maximum number of requests in flight at once on one client
+DEFAULT_CONCURRENCY = 100
+
+# Timeout in seconds for each request
+DEFAULT_TIMEOUT = 30.0
+
+# Seconds between checks while every slot of the shared rate limiter is taken
+SLOT_POLL_INTERVAL = 0.01
+
+
+class AsyncWMDAClient:
+    """
+    Asynchronous client for the WMDA search API, built on httpx.
+
+    A semaphore caps the number of requests in flight on this client, so a single
+    event loop can schedule hundreds of calls with asyncio.gather(). Every request
+    also goes through the same shared rate limiter, retry policy and request
+    metrics as the synchronous WMDAClient, so async and threaded callers share one
+    budget. The bearer token comes from the shared TokenProvider; a worker thread
+    is only used when the cached token has to be refreshed.
+
+    Use it as an async context manager:
+
+        async with AsyncWMDAClient(max_concurrency=50) as client:
+            responses = await asyncio.gather(*(client.get_search_summary(s) for s in search_ids))
+
+    Args:
+        max_concurrency (int): Maximum number of requests in flight at once.
+        timeout (float): Timeout in seconds for each request.
+        user_agent (str or None): User-Agent header; defaults to the USER_AGENT variable.
+        token_provider (object or None): Object with a get_token() method; defaults to the shared provider.
+        rate_limiter (RateLimiter or None): Limiter every request goes through; defaults to the shared one.
+        max_retries (int): Number of retries for throttled or failed requests.
+        backoff_base (float): Delay before the first retry, doubled on every further retry.
+        transport (httpx.AsyncBaseTransport or None): Optional transport, e.g. httpx.MockTransport in tests.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT, user_agent=None,
+                 token_provider=None, rate_limiter=None, max_retries=DEFAULT_MAX_RETRIES, backoff_base=0.5,
+                 transport=None):
+        self.token_provider = token_provider or get_token_provider()
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        headers = {"Content-Type": "application/json", "Accept": "application/json"}
+        user_agent = user_agent or os.getenv("USER_AGENT")
+        if user_agent:
+            headers["User-Agent"] = user_agent
+
+        # Keep as many pooled connections as requests we allow in flight
+        limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+        self._client = httpx.AsyncClient(headers=headers, timeout=timeout, limits=limits, transport=transport)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        # Close all pooled connections
+        await self._client.aclose()
+
+    async def get_token(self):
+        """
+        Return the bearer token, fetching it in a worker thread only if the cached one is missing or expiring.
+
+        Returns:
+            str or None: The access token, or None if it could not be retrieved.
+        """
+        cached_token = getattr(self.token_provider, "cached_token", None)
+        token = cached_token() if cached_token is not None else None
+        if token is None:
+            token = await asyncio.to_thread(self.token_provider.get_token)
+        return token
+
+    async def request(self, method, path, **kwargs):
+        """
+        Send one request to the API once a concurrency slot is free.
+
+        Idempotent requests that get a 429, 502, 503 or 504, or fail to connect, are
+        retried with jittered backoff; other requests only on a 429, as in WMDAClient.
+
+        Args:
+            method (str): HTTP method, e.g. "GET".
+            path (str): Path of the endpoint relative to the base URL.
+            **kwargs: Any other arguments accepted by httpx.AsyncClient.request.
+
+        Returns:
+            httpx.Response: The response from the API.
+
+        Raises:
+            RuntimeError: If no bearer token could be retrieved.
+        """
+        token = await self.get_token()
+        if not token:
+            raise RuntimeError("Unable to get bearer token.")
+
+        kwargs["headers"] = dict(kwargs.get("headers") or {}, Authorization=f"Bearer {token}")
+        url = api_url(path)
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        async with self._semaphore:
+            while True:
+                try:
+                    response = await self._send(method, url, **kwargs)
+                except httpx.TransportError:
+                    if not idempotent or attempt >= self.max_retries:
+                        raise
+                    await asyncio.sleep(backoff_delay(attempt, self.backoff_base))
+                    attempt += 1
+                    continue
+
+                status = response.status_code
+                retryable = status == 429 or (idempotent and status in RETRY_STATUSES)
+                if not retryable or attempt >= self.max_retries:
+                    return response
+
+                # Wait as long as the API asked, or back off if it did not say
+                delay = retry_after_seconds(response)
+                if delay is not None:
+                    self.rate_limiter.pause(delay)
+                await asyncio.sleep(delay if delay is not None else backoff_delay(attempt, self.backoff_base))
+                attempt += 1
+
+    async def _send(self, method, url, **kwargs):
+        # Wait for the shared limiter without blocking the event loop, then send one request,
+        # reporting its status and latency back to the limiter and the shared metrics
+        while True:
+            wait_for = self.rate_limiter.try_acquire()
+            if wait_for == 0:
+                break
+            await asyncio.sleep(SLOT_POLL_INTERVAL if wait_for is None else wait_for)
+
+        start = time.monotonic()
+        status = None
+        try:
+            with get_metrics().track_request(method, url) as outcome:
+                response = await self._client.request(method, url, **kwargs)
+                outcome["status"] = response.status_code
+            status = response.status_code
+            return response
+        finally:
+            self.rate_limiter.release(status, time.monotonic() - start)
+
+    async def create_patient(self, patient_data):
+        return await self.request("POST", "/patients", json=patient_data)
+
+    async def update_patient(self, patient_data):
+        return await self.request("PUT", "/patients", json=patient_data,
+                                  headers={"Content-Type": "application/json-patch+json"})
+
+    async def list_patients(self, limit=100, offset=0, only_my_patients=False):
+        params = {"Limit": limit, "OnlyMyPatients": only_my_patients, "Offset": offset}
+        return await self.request("GET", "/patients", params=params)
+
+    async def create_search(self, search_data):
+        return await self.request("POST", "/searches", json=search_data)
+
+    async def get_patient_searches(self, wmda_id):
+        return await self.request("GET", f"/searches/patientSearches/{wmda_id}")
+
+    async def get_search_summary(self, search_id):
+        return await self.request("GET", f"/searches/{search_id}")
+
+
+async def _gather_json(call, keys, max_concurrency, **client_kwargs):
+    # Run call(client, key) for every key on one client and keep the parsed bodies of the 200 responses
+    async with AsyncWMDAClient(max_concurrency=max_concurrency, **client_kwargs) as client:
+        responses = await asyncio.gather(*(call(client, key) for key in keys), return_exceptions=True)
+
+    results = {}
+    for key, response in zip(keys, responses):
+        if isinstance(response, Exception):
+            print(f"Request for {key} failed: {response}")
+        elif response.status_code == 200:
+            results[key] = response.json()
+        else:
+            print(f"Request for {key} returned {response.status_code}")
+    return results
+
+
+def fetch_search_summaries(search_ids, max_concurrency=DEFAULT_CONCURRENCY, **client_kwargs):
+    """
+    Fetch the summaries of many searches concurrently; a synchronous wrapper for scripts.
+
+    Args:
+        search_ids (list): The search IDs to fetch.
+        max_concurrency (int): Maximum number of requests in flight at once.
+        **client_kwargs: Other AsyncWMDAClient arguments, e.g. transport in tests.
+
+    Returns:
+        dict: The parsed JSON summary for each search ID that returned 200.
+    """
+    return asyncio.run(_gather_json(lambda client, search_id: client.get_search_summary(search_id),
+                                    list(search_ids), max_concurrency, **client_kwargs))
+
+
+def fetch_patient_searches(wmda_ids, max_concurrency=DEFAULT_CONCURRENCY, **client_kwargs):
+    """
+    Fetch the search lists of many patients concurrently; a synchronous wrapper for scripts.
+
+    Returns:
+        dict: The parsed JSON search list for each wmdaId that returned 200.
+    """
+    return asyncio.run(_gather_json(lambda client, wmda_id: client.get_patient_searches(wmda_id),
+                                    list(wmda_ids), max_concurrency, **client_kwargs))
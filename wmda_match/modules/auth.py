@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import threading
+import requests
+
+try:
+    from wmda_match.modules.metrics import get_metrics
+except ImportError:  # Running this file directly from wmda_match/modules
+    from metrics import get_metrics
+
+# Azure AD token endpoint used by every WMDA script; WMDA_TOKEN_URL replaces it, e.g. with fake_wmda.py
+TOKEN_URL = "https://login.microsoftonline.com/{tenant_id}/oauth2/token"
+
+# Refresh the token this many seconds before it actually expires
+REFRESH_MARGIN = 300
+
+# Lifetime to assume if the token response carries no expiry information
+DEFAULT_LIFETIME = 3600
+
+
+class TokenProvider:
+    """
+    Fetches and caches the bearer token used to authenticate against the WMDA API.
+
+    The token is kept in memory and, if a cache file is given, on disk with
+    owner-only permissions so that separate script runs can reuse it. A new token
+    is requested shortly before the cached one expires, and concurrent callers
+    share a single refresh instead of each contacting the token endpoint.
+
+    Args:
+        cache_file (str or None): Optional path of a JSON file to persist the token in.
+        refresh_margin (int): Seconds before expiry at which the token is refreshed.
+    """
+
+    def __init__(self, cache_file=None, refresh_margin=REFRESH_MARGIN):
+        self.cache_file = cache_file
+        self.refresh_margin = refresh_margin
+        self._token = None
+        self._expires_at = 0.0
+        self._generation = 0  # Incremented every time a refresh attempt finishes
+        self._lock = threading.Lock()  # Guards the cached token fields
+        self._refresh_lock = threading.Lock()  # Held by the thread doing the refresh
+
+    def get_token(self):
+        """
+        Return a valid bearer token, refreshing it if it is missing or about to expire.
+
+        Returns:
+            str or None: The access token, or None if the token request failed.
+        """
+        with self._lock:
+            if self._is_fresh():
+                return self._token
+            generation = self._generation
+            still_valid = self._token is not None and time.time() < self._expires_at
+
+        # The token is inside the refresh margin but not expired yet: if another
+        # thread is already refreshing, keep using the current token meanwhile
+        if still_valid and not self._refresh_lock.acquire(blocking=False):
+            return self._token
+        if not still_valid:
+            self._refresh_lock.acquire()
+
+        try:
+            with self._lock:
+                # Another thread finished a refresh while we were waiting for the
+                # lock, so share its result rather than starting a second request
+                if self._generation != generation:
+                    return self._token if time.time() < self._expires_at else None
+                if self._is_fresh():
+                    return self._token
+
+            token, expires_at = self._load_from_disk()
+            if token is None:
+                token, expires_at = self._fetch_token()
+                if token is not None:
+                    self._save_to_disk(token, expires_at)
+
+            with self._lock:
+                if token is not None:
+                    self._token = token
+                    self._expires_at = expires_at
+                self._generation += 1
+                return token
+        finally:
+            self._refresh_lock.release()
+
+    def cached_token(self):
+        """
+        Return the cached token if it is not about to expire, without contacting the token endpoint.
+
+        Returns:
+            str or None: The token, or None if get_token() has to fetch a new one.
+        """
+        with self._lock:
+            return self._token if self._is_fresh() else None
+
+    def clear(self):
+        """
+        Drop the in-memory token (and the cache file, if any) so the next call fetches a new one.
+        """
+        with self._lock:
+            self._token = None
+            self._expires_at = 0.0
+            self._generation += 1
+        if self.cache_file and os.path.exists(self.cache_file):
+            os.remove(self.cache_file)
+
+    def _is_fresh(self):
+        # A token is fresh when it will not expire within the refresh margin
+        return self._token is not None and time.time() < self._expires_at - self.refresh_margin
+
+    def _fetch_token(self):
+        # Read the credentials at call time so tests and long-running processes
+        # pick up the current environment
+        tenant_id = os.getenv("TENANT_ID")
+        user_agent = os.getenv("USER_AGENT")
+
+        # Set headers and payload for the request
+        headers = {
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'User-Agent': user_agent
+        }
+        payload = {
+            'grant_type': 'client_credentials',
+            'client_id': os.getenv("CLIENT_ID"),
+            'client_secret': os.getenv("CLIENT_SECRET"),
+            'resource': os.getenv("RESOURCE_ID")
+        }
+
+        # Make the request to get the bearer token
+        token_url = os.getenv("WMDA_TOKEN_URL", TOKEN_URL)
+        metrics = get_metrics()
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = requests.post(token_url.format(tenant_id=tenant_id), headers=headers, data=payload)
+            status = str(response.status_code)
+        finally:
+            metrics.observe("wmda_token_fetch_duration_seconds", {"status": status}, time.perf_counter() - start)
+            metrics.inc("wmda_token_fetches_total", {"status": status})
+
+        # Check the response status
+        if response.status_code == 200:
+            token_data = response.json()
+            return token_data['access_token'], parse_expiry(token_data)
+        else:
+            print("Error getting bearer token:", response.status_code, response.text)
+            return None, 0.0
+
+    def _cache_key(self):
+        # The cached token is only valid for the same client and resource
+        return {"client_id": os.getenv("CLIENT_ID"), "resource": os.getenv("RESOURCE_ID")}
+
+    def _load_from_disk(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return None, 0.0
+        try:
+            with open(self.cache_file) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None, 0.0
+
+        if cached.get("key") != self._cache_key():
+            return None, 0.0
+        expires_at = float(cached.get("expires_at", 0))
+        if time.time() >= expires_at - self.refresh_margin:
+            return None, 0.0
+        return cached.get("access_token"), expires_at
+
+    def _save_to_disk(self, token, expires_at):
+        if not self.cache_file:
+            return
+        data = {"key": self._cache_key(), "access_token": token, "expires_at": expires_at}
+
+        # Write to a temporary file created with owner-only permissions, then
+        # atomically move it into place so readers never see a partial file
+        tmp_path = f"{self.cache_file}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.cache_file)
+
+
+def parse_expiry(token_data, now=None):
+    """
+    Work out when a token expires from an Azure AD token response.
+
+    Args:
+        token_data (dict): The JSON body returned by the token endpoint.
+        now (float or None): Current time in epoch seconds (defaults to time.time()).
+
+    Returns:
+        float: The expiry time in epoch seconds.
+    """
+    now = time.time() if now is None else now
+
+    # Azure AD v1 returns these as strings, so convert before comparing
+    if token_data.get("expires_on"):
+        return float(token_data["expires_on"])
+    if token_data.get("expires_in"):
+        return now + float(token_data["expires_in"])
+    return now + DEFAULT_LIFETIME
+
+
+# Shared provider used by all the scripts in this package
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_token_provider():
+    """
+    Return the process-wide TokenProvider, creating it on first use.
+
+    Set WMDA_TOKEN_CACHE to a file path to also cache the token on disk.
+    """
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = TokenProvider(cache_file=os.getenv("WMDA_TOKEN_CACHE"))
+        return _provider
+
+
+def get_bearer_token():
+    """
+    Return a cached bearer token for the WMDA API, fetching a new one when needed.
+
+    Returns:
+        str or None: The access token, or None if it could not be retrieved.
+    """
+    return get_token_provider().get_token()
+
+
+def clear_token_cache():
+    """
+    Forget the shared token so that the next get_bearer_token() call requests a new one.
+    """
+    global _provider
+    with _provider_lock:
+        if _provider is not None:
+            _provider.clear()
+        _provider = None
@@ -0,0 +1,347 @@
+import os
+import sys
+import json
+import math
+import time
+import sqlite3
+import argparse
+import tempfile
+import platform
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from wmda_match.modules.auth import get_bearer_token, clear_token_cache
+    from wmda_match.modules.wmda_client import configure_client
+    from wmda_match.modules.rate_limiter import get_rate_limiter
+    from wmda_match.modules.fake_wmda import FakeWMDAServer
+    from wmda_match.modules.create_patient import create_patient
+    from wmda_match.modules.update_patient import update_patient
+    from wmda_match.modules.create_patient_search import create_patient_search
+    from wmda_match.modules.patient_search_list import get_patient_searches
+    from wmda_match.modules.search_poller import get_outstanding_searches, fetch_search_summary
+    from wmda_match.modules.patient_pages import fetch_patient_page, PAGE_SIZE
+    from wmda_match.modules.person_columns import PERSON_COLUMNS
+    from wmda_match.modules.person_repository import Donor, get_person_repository, close_person_repositories
+    from wmda_match.modules.response_cache import ResponseCache, set_response_cache
+    from wmda_match.modules.db_writer import close_db_writers
+    from wmda_match.modules.metrics import get_metrics
+    from wmda_match.modules.config import load_config
+except ImportError:  # Running this file directly from wmda_match/modules
+    from auth import get_bearer_token, clear_token_cache
+    from wmda_client import configure_client
+    from rate_limiter import get_rate_limiter
+    from fake_wmda import FakeWMDAServer
+    from create_patient import create_patient
+    from update_patient import update_patient
+    from create_patient_search import create_patient_search
+    from patient_search_list import get_patient_searches
+    from search_poller import get_outstanding_searches, fetch_search_summary
+    from patient_pages import fetch_patient_page, PAGE_SIZE
+    from person_columns import PERSON_COLUMNS
+    from person_repository import Donor, get_person_repository, close_person_repositories
+    from response_cache import ResponseCache, set_response_cache
+    from db_writer import close_db_writers
+    from metrics import get_metrics
+    from config import load_config
+
+# Every flow the benchmark can run, in the order they depend on each other
+FLOWS = ["create", "update", "list", "search_create", "search_list", "summary"]
+
+# Relative change in throughput or p95 latency that counts as a regression
+DEFAULT_THRESHOLD = 0.10
+
+DEFAULT_COHORT = 200
+DEFAULT_CONCURRENCY = 8
+
+# SQLite writes made by the flows, as recorded by timed_db
+WRITE_OPERATIONS = {"save_wmda_ids", "save_sent_payloads", "update_search_id", "cache_invalidate"}
+
+
+def percentile(values, pct):
+    """
+    Function to return the pct-th percentile of a list using the nearest-rank method.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def make_cohort(db_path, size):
+    """
+    Function to create a person_data table with size synthetic donors.
+
+    Returns:
+        list: The donors as Donor records.
+    """
+    typings = ["01:01:01:01", "24:02:01:01", "08:01:01", "07:02:01", "07:01:01", "07:02:01",
+               "03:01:01", "15:01:01", "02:01:01", "06:02:01"]
+    donors = [Donor._make((1000000 + i, "1990-01-01", 35, "HICA", "MF"[i % 2]) + tuple(typings) + ("", ""))
+              for i in range(size)]
+
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS person_data (
+            DONN_NUMERO INTEGER PRIMARY KEY, DOB TEXT, Age INTEGER, Ethnic TEXT, Gender TEXT,
+            Ax TEXT, Ay TEXT, Bx TEXT, By TEXT, Cx TEXT, Cy TEXT,
+            DRB1x TEXT, DRB1y TEXT, DQB1x TEXT, DQB1y TEXT, wmdaID INTEGER, SearchID INTEGER
+        )
+    ''')
+    # Columns are named, since a migrated database has more columns than these
+    conn.executemany(f"INSERT OR REPLACE INTO person_data ({', '.join(PERSON_COLUMNS)}) "
+                     f"VALUES ({', '.join('?' for _ in PERSON_COLUMNS)})", donors)
+    conn.commit()
+    conn.close()
+    return donors
+
+
+def timed_calls(func, items, concurrency):
+    """
+    Function to call func on every item from a pool of threads, timing each call.
+
+    A call that returns None or False, or raises, counts as an error. What the
+    module functions print for each call is discarded.
+
+    Returns:
+        tuple: (results, latencies, errors, wall-clock seconds)
+    """
+    def run(item):
+        start = time.perf_counter()
+        try:
+            result = func(item)
+            ok = result is not None and result is not False
+        except Exception:
+            result, ok = None, False
+        return result, time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(run, items))
+    elapsed = time.perf_counter() - start
+
+    return ([o[0] for o in outcomes], [o[1] for o in outcomes], sum(1 for o in outcomes if not o[2]), elapsed)
+
+
+def db_write_seconds():
+    """
+    Function to return the total time spent so far in the SQLite writes listed in WRITE_OPERATIONS.
+    """
+    return sum(h["sum"] for h in get_metrics().snapshot()["histograms"]
+               if h["name"] == "wmda_db_operation_duration_seconds" and h["labels"]["operation"] in WRITE_OPERATIONS)
+
+
+def summarize(latencies, errors, elapsed, db_seconds=0.0):
+    """
+    Function to turn the timings of one flow into the figures stored in the results file.
+    """
+    return {
+        "operations": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "requests_per_second": round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+        "db_write_seconds": round(db_seconds, 4),
+    }
+
+
+def run_benchmark(cohort_size=DEFAULT_COHORT, concurrency=DEFAULT_CONCURRENCY, flows=None, db_path=None,
+                  page_size=PAGE_SIZE):
+    """
+    Function to drive every WMDA flow against the configured API and time it.
+
+    Each flow calls the same module function the scripts use for one patient or
+    search (create_patient, update_patient, create_patient_search, ...), so the
+    latencies include their token lookups, database reads and writes. The time
+    spent in SQLite writes is also reported on its own. The API is whatever
+    WMDA_API_BASE_URL points at, normally a FakeWMDAServer.
+
+    Args:
+        cohort_size (int): Number of patients to create, update and search for.
+        concurrency (int): Number of requests in flight at once.
+        flows (list or None): Flows to run; defaults to all of FLOWS. Later flows need the
+            patients (and searches) created by earlier ones.
+        db_path (str or None): SQLite database for the cohort; a temporary one by default.
+        page_size (int): Patients per page in the list flow.
+
+    Returns:
+        dict: Results per flow, keyed by flow name.
+    """
+    flows = flows or FLOWS
+    temp_dir = None
+    if db_path is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(temp_dir.name, "benchmark.db")
+
+    # Cache invalidations made by the flows go to the benchmark database, not sample_data.db
+    previous_cache = set_response_cache(ResponseCache(db_path))
+    try:
+        donors = make_cohort(db_path, cohort_size)
+        token = get_bearer_token()
+        if not token:
+            raise RuntimeError("Unable to get bearer token")
+        repository = get_person_repository(db_path)
+        results = {}
+
+        if "create" in flows:
+            written = db_write_seconds()
+            _, latencies, errors, elapsed = timed_calls(lambda donor: create_patient(donor, db_path), donors,
+                                                        concurrency)
+            results["create"] = summarize(latencies, errors, elapsed, db_write_seconds() - written)
+
+        registered = repository.registered_donors()
+
+        if "update" in flows:
+            # Change one typing so every update carries a real change
+            changed = [donor._replace(Ax="01:02:01:01") for donor in registered]
+            written = db_write_seconds()
+            _, latencies, errors, elapsed = timed_calls(lambda donor: update_patient(donor, db_path=db_path),
+                                                        changed, concurrency)
+            results["update"] = summarize(latencies, errors, elapsed, db_write_seconds() - written)
+
+        if "list" in flows:
+            offsets = list(range(0, max(len(registered), 1), page_size))
+            _, latencies, errors, elapsed = timed_calls(
+                lambda offset: fetch_patient_page(token, offset, page_size), offsets, concurrency)
+            results["list"] = summarize(latencies, errors, elapsed)
+
+        if "search_create" in flows:
+            written = db_write_seconds()
+            _, latencies, errors, elapsed = timed_calls(
+                lambda donor: create_patient_search(donor.DONN_NUMERO, db_path), registered, concurrency)
+            results["search_create"] = summarize(latencies, errors, elapsed, db_write_seconds() - written)
+
+        if "search_list" in flows:
+            _, latencies, errors, elapsed = timed_calls(
+                lambda donor: get_patient_searches(donor.wmdaID, use_cache=False), registered, concurrency)
+            results["search_list"] = summarize(latencies, errors, elapsed)
+
+        if "summary" in flows:
+            search_ids = list(get_outstanding_searches(db_path))
+            _, latencies, errors, elapsed = timed_calls(fetch_search_summary, search_ids, concurrency)
+            results["summary"] = summarize(latencies, errors, elapsed)
+
+        return results
+    finally:
+        set_response_cache(previous_cache)
+        # Commit and stop the writer thread and close the connection kept open on the benchmark database
+        close_person_repositories(db_path)
+        close_db_writers(db_path)
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Function to compare two benchmark runs.
+
+    A flow regresses when its throughput drops, or its p95 latency rises, by more than threshold.
+
+    Args:
+        baseline (dict): Results file of the earlier run.
+        current (dict): Results file of the new run.
+        threshold (float): Allowed relative change, e.g. 0.10 for 10%.
+
+    Returns:
+        list: One message per regression; empty if there is none.
+    """
+    regressions = []
+    for flow, now in current.get("flows", {}).items():
+        before = baseline.get("flows", {}).get(flow)
+        if not before:
+            continue
+        if before.get("requests_per_second") and now.get("requests_per_second") is not None:
+            if now["requests_per_second"] < before["requests_per_second"] * (1 - threshold):
+                regressions.append(f"{flow}: throughput {before['requests_per_second']} -> "
+                                   f"{now['requests_per_second']} req/s")
+        if before.get("p95_ms") and now.get("p95_ms") is not None:
+            if now["p95_ms"] > before["p95_ms"] * (1 + threshold):
+                regressions.append(f"{flow}: p95 latency {before['p95_ms']} -> {now['p95_ms']} ms")
+    return regressions
+
+
+def print_results(results):
+    print(f"{'Flow':<14}{'Ops':>6}{'Errors':>8}{'Req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'DB s':>8}")
+    for flow, r in results.items():
+        print(f"{flow:<14}{r['operations']:>6}{r['errors']:>8}{r['requests_per_second'] or 0:>10}"
+              f"{r['p50_ms'] or 0:>10}{r['p95_ms'] or 0:>10}{r['p99_ms'] or 0:>10}{r['db_write_seconds']:>8}")
+
+
+def main(argv=None):
+    """
+    Main function to run the benchmark, save its results as JSON and check them against a baseline.
+
+    Returns:
+        int: 1 if a regression crossed the threshold, else 0.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark every WMDA flow against a local fake API.")
+    parser.add_argument("--cohort", type=int, default=DEFAULT_COHORT, help="Number of patients")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Requests in flight at once")
+    parser.add_argument("--flows", nargs="+", choices=FLOWS, help="Flows to run (default: all)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latency added by the fake server, in seconds")
+    parser.add_argument("--external", action="store_true",
+                        help="Use the API at WMDA_API_BASE_URL instead of starting a fake server")
+    parser.add_argument("--limit", action=argparse.BooleanOptionalAction, default=False,
+                        help="Send requests through the shared rate limiter (default: off, so the results "
+                             "measure the client and the API rather than the limiter)")
+    parser.add_argument("--output", default="benchmark_results.json", help="File to write the results to")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed relative drop in throughput or rise in p95 latency")
+    args = parser.parse_args(argv)
+
+    server = None
+    if not args.external:
+        server = FakeWMDAServer(latency=args.latency, search_duration=0).start()
+        os.environ["WMDA_API_BASE_URL"] = server.base_url
+        os.environ["WMDA_TOKEN_URL"] = server.token_url
+        clear_token_cache()
+    pool_size = max(args.concurrency, 10)
+    limiter = get_rate_limiter() if args.limit else None
+    configure_client(pool_size=pool_size, user_agent=os.getenv("USER_AGENT"), rate_limiter=limiter)
+    limiter_settings = None
+    if limiter is not None:
+        limiter.start_concurrency(args.concurrency)
+        # Recorded before the run, since the AIMD limit moves while it runs
+        limiter_settings = {"rate": limiter.rate, "burst": limiter.burst, "initial_concurrency": limiter.limit,
+                            "max_concurrency": limiter.max_concurrency}
+
+    try:
+        results = run_benchmark(args.cohort, args.concurrency, args.flows)
+    finally:
+        if server is not None:
+            server.stop()
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": {"cohort": args.cohort, "concurrency": args.concurrency, "pool_size": pool_size,
+                   "latency": args.latency, "external": args.external, "rate_limited": args.limit,
+                   "rate_limiter": limiter_settings},
+        "flows": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print_results(results)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, report, args.threshold)
+        for message in regressions:
+            print("REGRESSION", message)
+        if regressions:
+            return 1
+        print(f"No regression beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    load_config()
+    sys.exit(main())
@@ -0,0 +1,233 @@
+import json
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from wmda_match.modules.metrics import timed_db
+    from wmda_match.modules.db_writer import get_db_writer
+    from wmda_match.modules.rate_limiter import get_rate_limiter
+except ImportError:  # Running this file directly from wmda_match/modules
+    from metrics import timed_db
+    from db_writer import get_db_writer
+    from rate_limiter import get_rate_limiter
+
+# Row states in bulk_progress. A row is written as SENDING just before its request
+# goes out, so after a crash the rows whose outcome is unknown can be told apart
+# from the ones that were never sent. A request that may have reached the API but
+# whose answer was lost (timeout, connection reset, 5xx) is recorded as UNKNOWN,
+# and FAILED is kept for requests the API certainly did not act on.
+PENDING = "pending"
+SENDING = "sending"
+DONE = "done"
+FAILED = "failed"
+UNKNOWN = "unknown"
+SKIPPED = "skipped"
+
+# Rows in these states are never sent again when a run is resumed
+FINISHED_STATES = (DONE, SKIPPED)
+
+
+def ensure_journal_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bulk_runs (
+            run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            operation TEXT NOT NULL,
+            options TEXT,
+            status TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            finished_at REAL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bulk_progress (
+            run_id INTEGER NOT NULL,
+            donor_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            detail TEXT,
+            wmda_id INTEGER,
+            payload TEXT,
+            updated_at REAL,
+            PRIMARY KEY (run_id, donor_id)
+        )
+    ''')
+
+
+class BulkJournal:
+    """
+    Per-row progress journal for one bulk create or update run, kept in SQLite.
+
+    start() records every donor of the run as pending, and record() stores the
+    outcome of each row as soon as its request finishes, committing straight away so
+    the journal survives a network drop, a killed process or Ctrl-C. resume() reopens
+    the latest run of the same operation that did not finish, so only the rows that
+    have not succeeded are sent again. record() may be called from worker threads;
+    its writes go through the shared DB writer thread, so rows finished at the same
+    time by different threads are committed together.
+
+    Args:
+        operation (str): Name of the bulk operation, e.g. "create" or "update".
+        db_path (str): Path of the SQLite database holding the journal tables.
+    """
+
+    def __init__(self, operation, db_path='sample_data.db'):
+        self.operation = operation
+        self.run_id = None
+        self.options = {}
+        self._lock = threading.Lock()
+        self._writer = get_db_writer(db_path)
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        ensure_journal_tables(self._conn)
+        self._conn.commit()
+
+    @timed_db("journal_start")
+    def start(self, donor_ids, options=None):
+        """
+        Begin a new run covering the given donors, all marked as pending.
+
+        Args:
+            donor_ids (list): The donor IDs of the run, in the order they will be sent.
+            options (dict or None): Settings of the run, returned again by resume().
+
+        Returns:
+            int: The id of the new run.
+        """
+        self.options = dict(options or {})
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO bulk_runs (operation, options, status, started_at) VALUES (?, ?, 'running', ?)",
+                (self.operation, json.dumps(self.options), now)
+            )
+            self.run_id = cursor.lastrowid
+            # INSERT OR IGNORE keeps the first position of a donor listed twice
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO bulk_progress (run_id, donor_id, position, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(self.run_id, str(donor_id), position, PENDING, now) for position, donor_id in enumerate(donor_ids)]
+            )
+            self._conn.commit()
+        return self.run_id
+
+    def _latest_unfinished(self):
+        # (run_id, options, progress) of the newest run still marked running, or None
+        self._writer.flush()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT run_id, options FROM bulk_runs WHERE operation = ? AND status = 'running' "
+                "ORDER BY run_id DESC LIMIT 1",
+                (self.operation,)
+            ).fetchone()
+            if row is None:
+                return None
+            run_id, options = row
+            rows = self._conn.execute(
+                "SELECT donor_id, status, detail, wmda_id, payload FROM bulk_progress WHERE run_id = ? ORDER BY position",
+                (run_id,)
+            ).fetchall()
+        progress = {donor_id: (status, detail or "", wmda_id, json.loads(payload) if payload else None)
+                    for donor_id, status, detail, wmda_id, payload in rows}
+        return run_id, json.loads(options) if options else {}, progress
+
+    @timed_db("journal_resume")
+    def resume(self):
+        """
+        Reopen the latest unfinished run of this operation.
+
+        Returns:
+            dict or None: {donor_id: (status, detail, wmda_id, payload)} for every row of
+            the run in its original order, or None if there is no run to resume.
+        """
+        latest = self._latest_unfinished()
+        if latest is None:
+            return None
+        self.run_id, self.options, progress = latest
+        return progress
+
+    @timed_db("journal_unfinished")
+    def unfinished(self):
+        """
+        Look at the latest unfinished run of this operation without reopening it.
+
+        Returns:
+            tuple or None: (run_id, progress), with progress as returned by resume(), or
+            None if every run has finished.
+        """
+        latest = self._latest_unfinished()
+        if latest is None:
+            return None
+        return latest[0], latest[2]
+
+    @timed_db("journal_record")
+    def record(self, donor_id, status, detail="", wmda_id=None, payload=None, wait=True):
+        """
+        Store the state of one row of the current run.
+
+        Args:
+            donor_id (str): The donor the row belongs to.
+            status (str): One of PENDING, SENDING, DONE, FAILED, UNKNOWN or SKIPPED.
+            detail (str): Error message or note shown when the run is resumed.
+            wmda_id (int or None): The wmdaId of a created patient, when known.
+            payload (dict or None): The document the API accepted, for updates.
+            wait (bool): Return only once the row is committed. Without it the row is
+                committed with the writer's next batch.
+        """
+        ticket = self._writer.execute(
+            "UPDATE bulk_progress SET status = ?, detail = ?, wmda_id = COALESCE(?, wmda_id), "
+            "payload = COALESCE(?, payload), updated_at = ? WHERE run_id = ? AND donor_id = ?",
+            (status, detail, wmda_id, json.dumps(payload, default=str) if payload is not None else None,
+             time.time(), self.run_id, str(donor_id))
+        )
+        if wait:
+            ticket.wait()
+
+    @timed_db("journal_finish")
+    def finish(self):
+        """
+        Close the run if every row has finished; otherwise leave it open for resume().
+
+        Returns:
+            int: The number of rows that have not finished.
+        """
+        # Rows recorded without waiting must be committed before they are counted
+        self._writer.flush()
+        with self._lock:
+            placeholders = ", ".join("?" for _ in FINISHED_STATES)
+            remaining = self._conn.execute(
+                f"SELECT COUNT(*) FROM bulk_progress WHERE run_id = ? AND status NOT IN ({placeholders})",
+                (self.run_id,) + FINISHED_STATES
+            ).fetchone()[0]
+            if remaining == 0:
+                self._conn.execute("UPDATE bulk_runs SET status = 'finished', finished_at = ? WHERE run_id = ?",
+                                   (time.time(), self.run_id))
+                self._conn.commit()
+        return remaining
+
+    def close(self):
+        # Also runs after Ctrl-C, so the rows recorded so far are committed before the program ends
+        self._writer.flush()
+        self._conn.close()
+
+
+def run_in_pool(function, items, max_workers):
+    """
+    Function to call function(item) for every item on a thread pool, in order.
+
+    On Ctrl-C or any other error the items that have not started are cancelled, so
+    only the requests already in flight finish (and are journalled) before the error
+    is raised again.
+
+    Returns:
+        list: The return values, in the order of items.
+    """
+    # Let every worker have a request in flight from the start
+    get_rate_limiter().start_concurrency(max_workers)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        results = list(executor.map(function, items))
+    except BaseException:
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
+    executor.shutdown(wait=True)
+    return results
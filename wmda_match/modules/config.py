@@ -0,0 +1,50 @@
+import os
+import threading
+
+# Settings read from the environment (or the .env file) and what they are for
+SETTINGS = {
+    "TENANT_ID": "Azure AD tenant of the WMDA API credentials",
+    "CLIENT_ID": "Client ID used to request the bearer token",
+    "CLIENT_SECRET": "Client secret used to request the bearer token",
+    "RESOURCE_ID": "Resource (audience) of the bearer token",
+    "USER_AGENT": "User-Agent header sent with every request",
+    "WMDA_API_BASE_URL": "Base URL of the WMDA API",
+    "WMDA_TOKEN_URL": "Token endpoint, with {tenant_id} as a placeholder",
+}
+
+_loaded = False
+_lock = threading.Lock()
+
+
+def load_config(dotenv_path=None):
+    """
+    Function to load the .env file into the environment, once per process.
+
+    The scripts only read settings from os.environ when they need them, so
+    importing a module never touches the file system. Entry points (the
+    wmda_match CLI and each script's __main__ block) call this before running.
+    Variables that are already set are not overwritten.
+
+    Args:
+        dotenv_path (str or None): .env file to read; by default it is searched for
+            from the current directory upwards.
+
+    Returns:
+        bool: True if the file was read by this call, False if the config was already loaded.
+    """
+    global _loaded
+    with _lock:
+        if _loaded:
+            return False
+        # Imported here so that importing this module stays cheap
+        from dotenv import load_dotenv
+        load_dotenv(dotenv_path)
+        _loaded = True
+        return True
+
+
+def missing_settings(names=("TENANT_ID", "CLIENT_ID", "CLIENT_SECRET", "RESOURCE_ID", "USER_AGENT")):
+    """
+    Function to list the required settings that are not set.
+    """
+    return [name for name in names if not os.getenv(name)]
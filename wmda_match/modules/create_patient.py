@@ -1,70 +1,52 @@
 import os
+import time
 import sqlite3
-import requests
-import json
-from dotenv import load_dotenv
-
-# Load environment variables from the .env file, which contains sensitive information
-# like the API URL, and user-agent string for API requests
-load_dotenv()
-
-# Retrieve API credentials from environment variables
-TENANT_ID = os.getenv("TENANT_ID")
-RESOURCE_ID = os.getenv("RESOURCE_ID")
-CLIENT_ID = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-USER_AGENT = os.getenv("USER_AGENT")  # Loaded from .env file
-API_URL = "https://sandbox-search-api.wmda.info/api/v2/patients"
-    
-def get_bearer_token():
-    # Construct the token URL
-    token_url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/token"
-    
-    # Set headers and payload for the request
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded',
-        'User-Agent': USER_AGENT
-    }
-    payload = {
-        'grant_type': 'client_credentials',
-        'client_id': CLIENT_ID,
-        'client_secret': CLIENT_SECRET,
-        'resource': RESOURCE_ID
-    }
+import argparse
 
-    # Make the request to get the bearer token
-    response = requests.post(token_url, headers=headers, data=payload)
+try:
+    from wmda_match.modules.auth import get_bearer_token
+    from wmda_match.modules.wmda_client import get_client, api_url
+    from wmda_match.modules.patient_pages import iter_patients
+    from wmda_match.modules.allele_dictionary import normalize_allele
+    from wmda_match.modules.metrics import timed_db, export_metrics
+    from wmda_match.modules.config import load_config
+    from wmda_match.modules.person_repository import get_person_repository
+    from wmda_match.modules.response_cache import invalidate_patients
+    from wmda_match.modules.bulk_journal import BulkJournal, run_in_pool, SENDING, DONE, FAILED, UNKNOWN, SKIPPED, FINISHED_STATES
+except ImportError:  # Running this file directly from wmda_match/modules
+    from auth import get_bearer_token
+    from wmda_client import get_client, api_url
+    from patient_pages import iter_patients
+    from allele_dictionary import normalize_allele
+    from metrics import timed_db, export_metrics
+    from config import load_config
+    from person_repository import get_person_repository
+    from response_cache import invalidate_patients
+    from bulk_journal import BulkJournal, run_in_pool, SENDING, DONE, FAILED, UNKNOWN, SKIPPED, FINISHED_STATES
 
-    # Check the response status
-    if response.status_code == 200:
-        token_data = response.json()
-        return token_data['access_token']
-    else:
-        print("Error getting bearer token:", response.status_code, response.text)
-        return None
+API_PATH = "/patients"
+
+# Number of create requests sent at once in bulk mode
+DEFAULT_WORKERS = 8
+
+# Donors with an empty or NULL wmdaID. The COALESCE term is written exactly as in the
+# WHERE clause of idx_person_data_pending_create, so SQLite uses that small index.
+PENDING_DONORS_SQL = "SELECT DONN_NUMERO FROM person_data WHERE COALESCE(wmdaID, '') = '' ORDER BY DONN_NUMERO"
 
-def get_donor_data(donor_id):
+def get_donor_data(donor_id, db_path='sample_data.db', fresh=False):
     """
     Function to fetch donor details from the SQLite database using the donor ID.
     
     Args:
         donor_id (str): The unique donor ID (DONN_NUMERO) to fetch from the database.
+        db_path (str): Path of the SQLite database.
+        fresh (bool): Read the row from the database even if it is cached.
         
     Returns:
-        donor (tuple or None): Returns donor data as a tuple if found, else None if not found.
+        donor (Donor or None): Returns the donor row as a named record if found, else None if not found.
     """
-    # Connect to the SQLite database (sample_data.db)
-    conn = sqlite3.connect('sample_data.db')
-    cursor = conn.cursor()
-
-    # Execute SQL query to retrieve donor data for the given donor ID
-    cursor.execute("SELECT * FROM person_data WHERE DONN_NUMERO = ?", (donor_id,))
-
-    # Fetch the donor data
-    donor = cursor.fetchone()
-
-    # Close the database connection
-    conn.close()
+    # Read through the shared repository, which caches rows already read by this process
+    donor = get_person_repository(db_path).get(donor_id, fresh)
 
     if donor:
         # Return donor data if found
@@ -74,81 +56,507 @@ def get_donor_data(donor_id):
         print("Donor ID not found.")
         return None
 
-def create_patient(donor):
+def build_patient_data(donor):
     """
-    Function to create a new patient on the WMDA using donor data.
-    
+    Function to build the WMDA patient payload from a donor row.
+
     Args:
-        donor (tuple): A tuple containing donor data retrieved from the database.
-        
-    This function constructs a patient data dictionary from the donor tuple and sends a
-    POST request to the WMDA API to create a new patient.
+        donor (Donor): The donor record read from person_data.
+
+    Returns:
+        dict: The patient data to send to the WMDA API.
     """
     # Extracting the donor data and preparing it to be sent as patient data
-    patient_data = {
-        "patientId": str(donor[0]),  # Convert donor ID to string for the API
+    return {
+        "patientId": str(donor.DONN_NUMERO),  # Convert donor ID to string for the API
         "hla": {
-            "a": {"field1": donor[5], "field2": donor[6]},
-            "b": {"field1": donor[7], "field2": donor[8]},
-            "c": {"field1": donor[9], "field2": donor[10]},
-            "drb1": {"field1": donor[11], "field2": donor[12]},
-            "dqb1": {"field1": donor[13], "field2": donor[14]}
+            "a": {"field1": normalize_allele(donor.Ax), "field2": normalize_allele(donor.Ay)},
+            "b": {"field1": normalize_allele(donor.Bx), "field2": normalize_allele(donor.By)},
+            "c": {"field1": normalize_allele(donor.Cx), "field2": normalize_allele(donor.Cy)},
+            "drb1": {"field1": normalize_allele(donor.DRB1x), "field2": normalize_allele(donor.DRB1y)},
+            "dqb1": {"field1": normalize_allele(donor.DQB1x), "field2": normalize_allele(donor.DQB1y)}
         },
         "idm": {
             "cmvStatus": "P"  # Placeholder; adjust as necessary
         },
-        "dateOfBirth": donor[1],
+        "dateOfBirth": donor.DOB,
         "diagnosis": {
             "diagnosisCode": "ALL",  # Placeholder; adjust as necessary
             "diagnosisText": "acute myeloid leukaemia",  # Placeholder; adjust as necessary
             "diagnosisDate": "2025-01-28"  # Placeholder; adjust as necessary
         },
         "diseasePhase": "PF",  # Placeholder; adjust as necessary
-        "ethnicity": donor[3],
+        "ethnicity": donor.Ethnic,
         "poolCountryCode": "NL",  # Placeholder; adjust as necessary
         "transplantCentreId": "TC X",  # Placeholder; adjust as necessary
         "abo": "A",  # Placeholder; adjust as necessary
         "rhesus": "P",  # Placeholder; adjust as necessary
         "weight": 76,  # Placeholder; adjust as necessary
-        "sex": donor[4],
+        "sex": donor.Gender,
         "legalTerms": True  # Placeholder; adjust as necessary
     }
 
-    # Printing the patient data to the console (for debugging purposes)
-    print(patient_data)
-
-    # Get Bearer Token for API authentication
-    token = get_bearer_token()
+def post_patient(patient_data, token):
+    """
+    Function to send a single create-patient request to the WMDA API.
 
-    # Check if we successfully retrieved the token
-    if not token:
-        # If no token, print an error message and exit the function
-        print("Unable to get bearer token. Aborting.")
-        return
+    Args:
+        patient_data (dict): The patient payload built by build_patient_data().
+        token (str): The bearer token used for authentication.
 
+    Returns:
+        requests.Response: The response from the API.
+    """
     # Prepare the headers for the HTTP request
     headers = {
         "Authorization": f"Bearer {token}",  # Authorization header with Bearer token
         "Content-Type": "application/json",  # Indicate that we're sending JSON data
-        "User-Agent": USER_AGENT  # Custom user-agent string from environment variables
+        "User-Agent": os.getenv("USER_AGENT")  # Custom user-agent string from environment variables
     }
 
     # Send a POST request to the WMDA API to create a new patient
-    response = requests.post(API_URL, headers=headers, json=patient_data)
+    return get_client().post(api_url(API_PATH), headers=headers, json=patient_data)
+
+def create_patient(donor, db_path='sample_data.db'):
+    """
+    Function to create a new patient on the WMDA using donor data.
+    
+    Args:
+        donor (Donor): The donor record read from person_data.
+        db_path (str): Path of the SQLite database the new wmdaId is stored in.
+        
+    This function constructs a patient data dictionary from the donor record and sends a
+    POST request to the WMDA API to create a new patient.
+
+    Returns:
+        bool: True if the patient was created, else False.
+    """
+    patient_data = build_patient_data(donor)
+
+    # Get Bearer Token for API authentication
+    token = get_bearer_token()
+
+    # Check if we successfully retrieved the token
+    if not token:
+        # If no token, print an error message and exit the function
+        print("Unable to get bearer token. Aborting.")
+        return False
+
+    response = post_patient(patient_data, token)
 
     # Check the status code of the response
     if response.status_code == 201:
         # If successful (201 Created), print a success message
         print("Patient created successfully!")
+
+        # Store the new wmdaId straight away so update_wmda_ID.py does not have to be run
+        wmda_id = extract_wmda_id(response)
+        if wmda_id is None:
+            wmda_id = lookup_wmda_ids([donor.DONN_NUMERO], token).get(str(donor.DONN_NUMERO))
+        if wmda_id is not None:
+            save_wmda_ids([(donor.DONN_NUMERO, wmda_id)], db_path)
+            invalidate_patients([wmda_id])
+            print(f"Saved wmdaId {wmda_id} for donor {donor.DONN_NUMERO}")
+        else:
+            print("wmdaId not found yet; run update_wmda_ID.py later to store it.")
+        return True
     else:
         # If an error occurred, print the status code and response text
         print(f"Error creating patient: {response.status_code}, Response: {response.text}")
+        return False
+
+def extract_wmda_id(response):
+    """
+    Function to read the wmdaId of a newly created patient from the create response.
+
+    The id is taken from a 'wmdaId' field in the JSON body, a bare numeric body, or
+    the last segment of the Location header, in that order.
+
+    Args:
+        response (requests.Response): The 201 response from the create request.
+
+    Returns:
+        int or None: The wmdaId, or None if the response does not contain a numeric one.
+    """
+    try:
+        body = response.json()
+    except ValueError:
+        body = None
+
+    if isinstance(body, dict) and body.get("wmdaId"):
+        try:
+            return int(body["wmdaId"])
+        except (ValueError, TypeError):
+            # Not a usable id; the caller looks the patient up instead
+            return None
+    if isinstance(body, int) and not isinstance(body, bool):
+        return body
+
+    location = response.headers.get("Location")
+    if isinstance(location, str) and location.rstrip("/").rsplit("/", 1)[-1].isdigit():
+        return int(location.rstrip("/").rsplit("/", 1)[-1])
+    return None
+
+def lookup_wmda_ids(patient_ids, token):
+    """
+    Function to find the wmdaIds of the given patients on the WMDA API.
+
+    This is only used when the create response did not contain the wmdaId. The
+    patient list is read page by page and the scan stops as soon as every patient
+    has been found.
+
+    Args:
+        patient_ids (list): The patientIds (DONN_NUMERO) to look for.
+        token (str): The bearer token used for authentication.
+
+    Returns:
+        dict: wmdaIds keyed by patientId as a string, for the patients that were found.
+    """
+    wanted = {str(patient_id) for patient_id in patient_ids}
+    found = {}
+    for patient in iter_patients(token):
+        patient_id = str(patient.get("patientId"))
+        if patient_id in wanted and patient.get("wmdaId"):
+            found[patient_id] = patient["wmdaId"]
+            if len(found) == len(wanted):
+                break
+    return found
+
+@timed_db("save_wmda_ids")
+def save_wmda_ids(pairs, db_path='sample_data.db'):
+    """
+    Function to store wmdaIds in the SQLite database in a single transaction.
+
+    The write goes through the shared writer thread and this returns once it is committed.
+
+    Args:
+        pairs (list): (DONN_NUMERO, wmdaId) tuples to write.
+        db_path (str): Path of the SQLite database.
+    """
+    if not pairs:
+        return
+
+    # The repository drops the changed rows from its cache once the write is committed
+    get_person_repository(db_path).set_wmda_ids(pairs)
+
+@timed_db("get_pending_donor_ids")
+def get_pending_donor_ids(db_path='sample_data.db'):
+    """
+    Function to list every donor in person_data that has not been created on the WMDA yet.
 
-def main():
+    Args:
+        db_path (str): Path of the SQLite database.
+
+    Returns:
+        list: The DONN_NUMERO of every row whose wmdaID is empty or NULL.
+    """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(PENDING_DONORS_SQL)
+    donor_ids = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return donor_ids
+
+def read_donor_ids(path):
+    """
+    Function to read donor IDs from a text file, one per line.
+
+    Blank lines and lines starting with '#' are ignored.
+
+    Args:
+        path (str): Path of the file to read.
+
+    Returns:
+        list: The donor IDs found in the file.
+    """
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
+
+def get_donors(donor_ids, db_path='sample_data.db'):
+    """
+    Function to fetch several donors from the SQLite database using the shared repository.
+
+    The rows are always read from the database, since a bulk create decides from the
+    wmdaID whether a donor still has to be created, and are cached for later steps.
+
+    Args:
+        donor_ids (list): The donor IDs (DONN_NUMERO) to fetch.
+        db_path (str): Path of the SQLite database.
+
+    Returns:
+        dict: Donor records keyed by the donor ID as a string. Missing donors are left out.
     """
-    Main function to run the script. This function prompts the user for a donor ID, 
+    return get_person_repository(db_path).get_many(donor_ids, fresh=True)
+
+def save_journalled_wmda_ids(progress, db_path='sample_data.db'):
+    """
+    Function to store the wmdaIds held in a create run's journal in person_data again,
+    in case the run stopped before saving them.
+    """
+    save_wmda_ids([(donor_id, row[2]) for donor_id, row in progress.items() if row[0] == DONE and row[2] is not None],
+                  db_path)
+
+def unsettled_creates(progress):
+    """
+    Function to list the rows of a create run that may exist on the WMDA without a known wmdaId:
+    creates in flight when the run stopped, creates whose response was lost or was a 5xx,
+    and creates whose wmdaId was never found.
+
+    Returns:
+        list: The donor IDs, in the order of the run.
+    """
+    return [donor_id for donor_id, row in progress.items()
+            if row[0] in (SENDING, UNKNOWN) or (row[0] == DONE and row[2] is None)]
+
+def create_outcome(response):
+    """
+    Function to tell what a create request did from its response.
+
+    Returns:
+        str: DONE for a 201, FAILED when the API certainly did not create the patient
+        (a 4xx, e.g. a validation error or a 429), or UNKNOWN for a 5xx, after which the
+        patient may exist anyway.
+    """
+    if response.status_code == 201:
+        return DONE
+    return UNKNOWN if response.status_code >= 500 else FAILED
+
+def recover_earlier_creates(progress, journal, db_path='sample_data.db'):
+    """
+    Function to settle the rows of an interrupted create run before it is resumed.
+
+    wmdaIds the journal already holds are stored in person_data again, in case the
+    run stopped before saving them. Rows that were created without a known wmdaId, and
+    rows whose request was in flight or got no definite answer, are looked up on the
+    WMDA; such a row that turns out to exist is marked as done instead of being sent
+    again, so resuming never creates a duplicate patient.
+
+    Args:
+        progress (dict): The rows returned by BulkJournal.resume().
+        journal (BulkJournal): The journal of the run being resumed.
+        db_path (str): Path of the SQLite database holding person_data.
+
+    Returns:
+        list or None: The donor IDs that still have to be created, in their original
+        order, or None if the bearer token needed for the lookup could not be fetched.
+    """
+    save_journalled_wmda_ids(progress, db_path)
+
+    unknown = unsettled_creates(progress)
+    found = {}
+    if unknown:
+        token = get_bearer_token()
+        if not token:
+            print("Unable to get bearer token. Aborting.")
+            return None
+        found = lookup_wmda_ids(unknown, token)
+        for donor_id, wmda_id in found.items():
+            journal.record(donor_id, DONE, "Found on the WMDA when resuming", wmda_id=wmda_id)
+        save_wmda_ids(list(found.items()), db_path)
+
+    return [donor_id for donor_id, row in progress.items() if row[0] not in FINISHED_STATES and donor_id not in found]
+
+def create_patients_bulk(donor_ids=None, max_workers=DEFAULT_WORKERS, resume=False, db_path='sample_data.db'):
+    """
+    Function to create many patients on the WMDA using a bounded pool of worker threads.
+
+    The outcome of every donor is written to the bulk journal as soon as its request
+    finishes. If the run stops part way (network drop, token failure, Ctrl-C), calling
+    this again with resume=True carries on with the same donors, sending only the
+    ones that have not been created. A new run is refused while an earlier one has
+    creates whose outcome is unknown, since they could otherwise be sent twice.
+
+    Args:
+        donor_ids (list or None): The donor IDs to create. If None, every donor without a
+            wmdaID in person_data is created. Ignored when resuming.
+        max_workers (int): Maximum number of create requests in flight at once.
+        resume (bool): Continue the latest unfinished create run instead of starting a new one.
+        db_path (str): Path of the SQLite database holding person_data and the journal.
+
+    Returns:
+        list: One result dictionary per donor with the keys 'donor_id', 'status'
+        ('created', 'failed' or 'skipped'), 'detail' and 'wmda_id'.
+    """
+    journal = BulkJournal("create", db_path)
+    try:
+        if resume:
+            progress = journal.resume()
+            if progress is None:
+                print("No unfinished create run to resume.")
+                return []
+            donor_ids = recover_earlier_creates(progress, journal, db_path)
+            if donor_ids is None:
+                return []
+            print(f"Resuming create run {journal.run_id}: {len(progress) - len(donor_ids)} of {len(progress)} donors already done.")
+        else:
+            earlier = journal.unfinished()
+            if earlier is not None:
+                run_id, progress = earlier
+                save_journalled_wmda_ids(progress, db_path)
+                unsettled = unsettled_creates(progress)
+                if unsettled:
+                    print(f"Create run {run_id} stopped with {len(unsettled)} creates whose outcome is unknown; "
+                          "run again with --resume first so they are not sent twice.")
+                    return []
+            if donor_ids is None:
+                donor_ids = get_pending_donor_ids(db_path)
+            journal.start(donor_ids)
+
+        results = create_journalled(donor_ids, journal, max_workers, db_path)
+
+        remaining = journal.finish()
+        if remaining:
+            print(f"{remaining} donors of run {journal.run_id} were not created; run again with --resume to retry them.")
+        return results
+    finally:
+        journal.close()
+
+def create_journalled(donor_ids, journal, max_workers, db_path='sample_data.db'):
+    """
+    Function to create the given donors, recording each outcome in the journal.
+
+    Returns:
+        list: The result dictionaries described in create_patients_bulk().
+    """
+    donors = get_donors(donor_ids, db_path)
+    results = []
+    to_create = []
+
+    # Skip donors that are missing from the database or have already been created
+    for donor_id in donor_ids:
+        donor = donors.get(str(donor_id))
+        if donor is None:
+            results.append({"donor_id": str(donor_id), "status": "skipped", "detail": "Donor not found in database", "wmda_id": None})
+        elif donor.wmdaID not in (None, ""):
+            results.append({"donor_id": str(donor_id), "status": "skipped", "detail": f"Already has wmdaID {donor.wmdaID}", "wmda_id": donor.wmdaID})
+        else:
+            to_create.append(donor)
+            continue
+        journal.record(donor_id, SKIPPED, results[-1]["detail"])
+
+    start_time = time.perf_counter()
+
+    if to_create:
+        # Check for a token up front so a run without credentials stops before sending anything
+        if not get_bearer_token():
+            print("Unable to get bearer token. Aborting.")
+            for donor in to_create:
+                results.append({"donor_id": str(donor.DONN_NUMERO), "status": "failed", "detail": "No bearer token", "wmda_id": None})
+            return results
+
+        def create_one(donor):
+            result = {"donor_id": str(donor.DONN_NUMERO), "status": "failed", "detail": "", "wmda_id": None}
+            # Fetched per request: the token is cached and only refreshed when it is about to
+            # expire, so a long run never sends an expired one
+            token = get_bearer_token()
+            if not token:
+                result["detail"] = "No bearer token"
+                journal.record(donor.DONN_NUMERO, FAILED, result["detail"], wait=False)
+                return result
+
+            # Marked before sending, so a resumed run knows this create may have reached the API
+            journal.record(donor.DONN_NUMERO, SENDING)
+            try:
+                response = post_patient(build_patient_data(donor), token)
+            except Exception as e:
+                # A timeout or dropped connection says nothing about whether the patient was created
+                outcome, result["detail"] = UNKNOWN, f"Outcome unknown: {e}"
+            else:
+                outcome = create_outcome(response)
+                if outcome == DONE:
+                    result.update(status="created", wmda_id=extract_wmda_id(response))
+                elif outcome == UNKNOWN:
+                    result["detail"] = f"Outcome unknown: {response.status_code}: {response.text}"
+                else:
+                    result["detail"] = f"{response.status_code}: {response.text}"
+            # Not waited for: if this row is lost, it is still marked SENDING and is looked up on resume
+            journal.record(donor.DONN_NUMERO, outcome, result["detail"], wmda_id=result["wmda_id"], wait=False)
+            if outcome == DONE:
+                created.append(result)
+            elif outcome == UNKNOWN:
+                uncertain.append(result)
+            return result
+
+        created = []
+        uncertain = []
+        try:
+            results.extend(run_in_pool(create_one, to_create, max_workers))
+        finally:
+            # Also runs after Ctrl-C, so donors created before the run stopped are not left
+            # looking pending in person_data and posted again by the next run
+            save_wmda_ids([(r["donor_id"], r["wmda_id"]) for r in created if r["wmda_id"] is not None], db_path)
+            invalidate_patients([r["wmda_id"] for r in created])
+
+        # Look up in one scan the wmdaIds the API did not return and the creates whose outcome
+        # is unknown, then store them all at once. Unknown creates that are not found stay
+        # UNKNOWN and are looked up again before --resume sends them.
+        missing = [r for r in created if r["wmda_id"] is None] + uncertain
+        token = get_bearer_token() if missing else None
+        if token:
+            found = lookup_wmda_ids([r["donor_id"] for r in missing], token)
+            for result in missing:
+                if result["donor_id"] in found:
+                    result.update(status="created", detail="", wmda_id=found[result["donor_id"]])
+                    journal.record(result["donor_id"], DONE, wmda_id=result["wmda_id"])
+            save_wmda_ids(list(found.items()), db_path)
+            invalidate_patients([r["wmda_id"] for r in uncertain if r["status"] == "created"])
+
+    elapsed = time.perf_counter() - start_time
+    print_bulk_summary(results, elapsed)
+    return results
+
+def print_bulk_summary(results, elapsed):
+    """
+    Function to print the per-row results of a bulk run followed by the totals and throughput.
+
+    Args:
+        results (list): The result dictionaries returned by create_patients_bulk().
+        elapsed (float): Time in seconds spent sending requests.
+    """
+    for result in results:
+        line = f"{result['donor_id']}: {result['status']}"
+        if result["status"] == "created":
+            line += f" wmdaId={result['wmda_id']}"
+        if result["detail"]:
+            line += f" ({result['detail']})"
+        print(line)
+
+    counts = {status: sum(1 for r in results if r["status"] == status) for status in ("created", "failed", "skipped")}
+    sent = counts["created"] + counts["failed"]
+    rate = sent / elapsed if elapsed > 0 else 0.0
+    print(f"Created: {counts['created']}, Failed: {counts['failed']}, Skipped: {counts['skipped']}")
+    print(f"Sent {sent} requests in {elapsed:.2f}s ({rate:.1f} patients/s)")
+
+def main(argv=None):
+    """
+    Main function to run the script. Without arguments it prompts the user for a donor ID,
     retrieves the donor data, and attempts to create a new patient on the WMDA using that data.
+    With --all-pending, --ids or --file it creates a whole cohort in bulk, and --resume
+    carries on with a bulk run that stopped part way.
     """
+    parser = argparse.ArgumentParser(description="Create patients on the WMDA from person_data.")
+    parser.add_argument("--all-pending", action="store_true", help="Create every donor that has no wmdaID yet")
+    parser.add_argument("--ids", nargs="+", help="Donor IDs (DONN_NUMERO) to create")
+    parser.add_argument("--file", help="File with one donor ID per line")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Number of concurrent requests (at most WMDA_MAX_CONCURRENCY)")
+    parser.add_argument("--resume", action="store_true", help="Carry on with the last bulk create that did not finish")
+    args = parser.parse_args(argv)
+
+    if args.resume:
+        create_patients_bulk(max_workers=args.workers, resume=True)
+        export_metrics()
+        return
+
+    if args.all_pending or args.ids or args.file:
+        donor_ids = None
+        if args.ids or args.file:
+            donor_ids = list(args.ids or [])
+            if args.file:
+                donor_ids += read_donor_ids(args.file)
+        create_patients_bulk(donor_ids, max_workers=args.workers)
+        export_metrics()
+        return
+
     # Ask the user to input a donor ID
     donor_id = input("Enter the donor ID: ")
 
@@ -164,4 +572,5 @@ def main():
 
 # Only execute the main function if this script is run directly (not imported as a module)
 if __name__ == "__main__":
+    load_config()
     main()
@@ -1,93 +1,62 @@
 import os
-import sqlite3
-import requests
-import json
-from dotenv import load_dotenv
-
-# Load environment variables from the .env file
-load_dotenv()
-
-# Retrieve API credentials from environment variables
-TENANT_ID = os.getenv("TENANT_ID")
-RESOURCE_ID = os.getenv("RESOURCE_ID")
-CLIENT_ID = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-USER_AGENT = os.getenv("USER_AGENT")  # Loaded from .env file
-API_URL_SEARCH = "https://sandbox-search-api.wmda.info/api/v2/searches"
-
-# Get bearer token
-def get_bearer_token():
-    token_url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/token"
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded',
-        'User-Agent': USER_AGENT
-    }
-    payload = {
-        'grant_type': 'client_credentials',
-        'client_id': CLIENT_ID,
-        'client_secret': CLIENT_SECRET,
-        'resource': RESOURCE_ID
-    }
-
-    response = requests.post(token_url, headers=headers, data=payload)
-
-    if response.status_code == 200:
-        token_data = response.json()
-        return token_data['access_token']
-    else:
-        print("Error getting bearer token:", response.status_code, response.text)
-        return None
+import argparse
+
+try:
+    from wmda_match.modules.auth import get_bearer_token
+    from wmda_match.modules.wmda_client import get_client, api_url
+    from wmda_match.modules.metrics import timed_db
+    from wmda_match.modules.config import load_config
+    from wmda_match.modules.person_repository import get_person_repository
+    from wmda_match.modules.response_cache import invalidate_cached
+except ImportError:  # Running this file directly from wmda_match/modules
+    from auth import get_bearer_token
+    from wmda_client import get_client, api_url
+    from metrics import timed_db
+    from config import load_config
+    from person_repository import get_person_repository
+    from response_cache import invalidate_cached
+
+API_PATH_SEARCH = "/searches"
 
 # Get WMDA ID from database using donor ID (DONN_NUMERO)
-def get_wmdaid_from_db(donor_id):
-    conn = sqlite3.connect('sample_data.db')
-    cursor = conn.cursor()
-
-    # Update the table and column names to match your structure
-    query = "SELECT wmdaId FROM person_data WHERE DONN_NUMERO = ?"
-    cursor.execute(query, (donor_id,))
-    result = cursor.fetchone()
+def get_wmdaid_from_db(donor_id, db_path='sample_data.db'):
+    # Read through the shared repository, which caches rows already read by this process
+    donor = get_person_repository(db_path).get(donor_id)
 
-    conn.close()
-
-    if result:
-        return result[0]  # wmdaId
+    if donor:
+        return donor.wmdaID
     else:
         print("No matching WMDA ID found for Donor ID:", donor_id)
         return None
 
 # Update SearchID in the database
-def update_search_id_in_db(donor_id, search_id):
-    conn = sqlite3.connect('sample_data.db')
-    cursor = conn.cursor()
-
-    # Update the SearchID for the given donor ID
-    query = "UPDATE person_data SET SearchID = ? WHERE DONN_NUMERO = ?"
-    cursor.execute(query, (search_id, donor_id))
-
-    conn.commit()
-    conn.close()
+@timed_db("update_search_id")
+def update_search_id_in_db(donor_id, search_id, db_path='sample_data.db'):
+    # Update the SearchID for the given donor ID. The write goes through the shared writer
+    # thread, which commits it together with the other threads' writes, and returns once it is
+    # on disk; the cached row is then read again on its next lookup.
+    get_person_repository(db_path).set_search_id(donor_id, search_id)
     print(f"Search ID {search_id} updated for Donor ID {donor_id}")
 
-# Create patient search
-def create_patient_search(donor_id):
+# Create patient search; returns True if the search was created and its ID stored
+def create_patient_search(donor_id, db_path='sample_data.db'):
     # Get WMDA ID using donor ID
-    wmda_id = get_wmdaid_from_db(donor_id)
+    wmda_id = get_wmdaid_from_db(donor_id, db_path)
     if not wmda_id:
         print("Unable to retrieve WMDA ID. Aborting search creation.")
-        return
+        return False
 
     # Get bearer token
     token = get_bearer_token()
     if not token:
         print("Failed to obtain bearer token. Aborting search creation.")
-        return
+        return False
 
     # Set headers for the request
     headers = {
         'Content-Type': 'application/json',
         'Authorization': f'Bearer {token}',
-        'User-Agent': USER_AGENT
+        'User-Agent': os.getenv("USER_AGENT")
     }
 
     # Construct the request payload with all required parameters
@@ -101,7 +70,7 @@ def create_patient_search(donor_id):
     }
 
     # Make the API request to create the patient search
-    response = requests.post(API_URL_SEARCH, headers=headers, json=payload)
+    response = get_client().post(api_url(API_PATH_SEARCH), headers=headers, json=payload)
 
     # Handle the response
     if response.status_code == 201:  # Success
@@ -111,13 +80,27 @@ def create_patient_search(donor_id):
         if search_id:
             print(f"Patient search created successfully! Search ID: {search_id}")
             # Update the SearchID in the database
-            update_search_id_in_db(donor_id, search_id)
+            update_search_id_in_db(donor_id, search_id, db_path)
+            # The cached list of this patient's searches does not have the new one yet
+            invalidate_cached("patient_searches", [wmda_id])
+            return True
         else:
             print("No search ID returned in the response.")
     else:
         print(f"Failed to create patient search: {response.status_code} {response.text}")
+    return False
 
 
-if __name__ == "__main__":
-    donor_id = input("Enter Donor ID: ")
+# Main function to run the script
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Start a WMDA search for a registered patient.")
+    parser.add_argument("donor_id", nargs="?", help="Donor ID (DONN_NUMERO); asked for if not given")
+    args = parser.parse_args(argv)
+
+    donor_id = args.donor_id or input("Enter Donor ID: ")
     create_patient_search(donor_id)
+
+
+if __name__ == "__main__":
+    load_config()
+    main()
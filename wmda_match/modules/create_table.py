@@ -1,58 +1,72 @@
 import sqlite3
 
-# Connect to SQLite database (or create it if it doesn't exist)
-conn = sqlite3.connect('sample_data.db')
-cursor = conn.cursor()
-
-# Create the table
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS person_data (
-    DONN_NUMERO INTEGER PRIMARY KEY,
-    DOB TEXT,
-    Age INTEGER,
-    Ethnic TEXT,
-    Gender TEXT,
-    Ax TEXT,
-    Ay TEXT,
-    Bx TEXT,
-    By TEXT,
-    Cx TEXT,
-    Cy TEXT,
-    DRB1x TEXT,
-    DRB1y TEXT,
-    DQB1x TEXT,
-    DQB1y TEXT,
-    wmdaID INTEGER,
-    SearchID INTEGER
-)
-''')
-
-# Data to be inserted
-data = [
-    (2255001, '1996-08-28', 29, 'HICA', 'M', '01:01:01:01', '24:07:01:01', '15:02:01', '15:17:01', '07:01:02', '08:01:01', '13:02:01', '15:01:01', '05:02:01', '06:04:01', "", ""),
-    (6215667, '2001-06-14', 23, 'HICA', 'F', '02:01:01:01', '25:01:01:01', '18:01:01', '44:02:01', '05:01:01', '12:03:01', '04:01:01', '15:01:01', '03:01:01', '06:02:01', "", ""),
-    (3606062, '2000-02-15', 24, 'HICA', 'F', '01:01:01:01', '02:01:01:01', '40:01:02', '44:02:01', '03:04:01', '05:01:01', '01:01:01', '04:07:01', '03:01:01:01', '05:01:01:03', "", ""),
-    (3717532, '1991-09-18', 33, 'HICA', 'F', '02:01:01:01', '24:02:01:01', '40:02:01', '40:02:01', '02:02:02', '02:02:02', '13:05:01', '16:01:01', '03:01:01', '05:02:01', "", ""),
-    (7972660, '2002-09-30', 22, 'HICA', 'M', '01:01:01:01', '68:01:02:03', '07:02:01', '27:05:02', '02:02:02', '07:02:01', '04:04:01', '12:01:01', '03:01:01', '03:02:01:02', "", ""),
-    (1126158, '1995-11-05', 29, 'HICA', 'F', '01:01:01:01', '11:01:01:01', '08:01:01', '35:01:01', '04:01:01', '07:01:01', '03:01:01', '14:54:01', '02:01:01', '05:03:01', "", ""),
-    (7846512, '1994-04-15', 30, 'HICA', 'M', '02:01:01:01', '25:01:01:01', '07:02:01', '08:01:01', '07:01:01', '07:02:01', '03:01:01', '15:01:01', '02:01:01', '06:02:01', "", ""),
-    (8330410, '1998-05-30', 26, 'HICA', 'F', '01:01:01:01', '24:02:01:01', '08:01:01', '40:01:02', '03:04:01', '07:01:01', '03:01:01', '04:04:01', '02:01:01', '03:02:01', "", ""),
-    (7381341, '2000-05-21', 24, 'HICA', 'M', '01:01:01', '02:01:01', '08:01:01', '35:01:01', '04:01:01', '07:01:01', '01:01:01', '03:01:01', '02:01:01', '05:01:01', "", ""),
-    (1408174, '1987-06-20', 37, 'HICA', 'F', '02:01:01:01', '31:01:02:01', '07:02:01', '44:02:01', '05:01:01', '07:02:01', '04:01:01', '04:01:01', '03:01:01:01', '03:02:01:01', "", "")
-]
-
-# Insert the data into the table
-cursor.executemany('''
-INSERT INTO person_data (
-    DONN_NUMERO, DOB, Age, Ethnic, Gender, 
-    Ax, Ay, Bx, By, Cx, Cy, DRB1x, DRB1y, DQB1x, DQB1y, wmdaId, SearchID
-) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-''', data)
-
-# Commit the transaction
-conn.commit()
-
-# Close the connection
-conn.close()
-
-print("Table created and data inserted successfully!")
+try:
+    from wmda_match.modules.migrations import migrate
+except ImportError:  # Running this file directly from wmda_match/modules
+    from migrations import migrate
+
+
+def main(db_path='sample_data.db'):
+    # Connect to SQLite database (or create it if it doesn't exist)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    # Create the table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS person_data (
+        DONN_NUMERO INTEGER PRIMARY KEY,
+        DOB TEXT,
+        Age INTEGER,
+        Ethnic TEXT,
+        Gender TEXT,
+        Ax TEXT,
+        Ay TEXT,
+        Bx TEXT,
+        By TEXT,
+        Cx TEXT,
+        Cy TEXT,
+        DRB1x TEXT,
+        DRB1y TEXT,
+        DQB1x TEXT,
+        DQB1y TEXT,
+        wmdaID INTEGER,
+        SearchID INTEGER
+    )
+    ''')
+
+    # Data to be inserted
+    data = [
+        (2255001, '1996-08-28', 29, 'HICA', 'M', '01:01:01:01', '24:07:01:01', '15:02:01', '15:17:01', '07:01:02', '08:01:01', '13:02:01', '15:01:01', '05:02:01', '06:04:01', "", ""),
+        (6215667, '2001-06-14', 23, 'HICA', 'F', '02:01:01:01', '25:01:01:01', '18:01:01', '44:02:01', '05:01:01', '12:03:01', '04:01:01', '15:01:01', '03:01:01', '06:02:01', "", ""),
+        (3606062, '2000-02-15', 24, 'HICA', 'F', '01:01:01:01', '02:01:01:01', '40:01:02', '44:02:01', '03:04:01', '05:01:01', '01:01:01', '04:07:01', '03:01:01:01', '05:01:01:03', "", ""),
+        (3717532, '1991-09-18', 33, 'HICA', 'F', '02:01:01:01', '24:02:01:01', '40:02:01', '40:02:01', '02:02:02', '02:02:02', '13:05:01', '16:01:01', '03:01:01', '05:02:01', "", ""),
+        (7972660, '2002-09-30', 22, 'HICA', 'M', '01:01:01:01', '68:01:02:03', '07:02:01', '27:05:02', '02:02:02', '07:02:01', '04:04:01', '12:01:01', '03:01:01', '03:02:01:02', "", ""),
+        (1126158, '1995-11-05', 29, 'HICA', 'F', '01:01:01:01', '11:01:01:01', '08:01:01', '35:01:01', '04:01:01', '07:01:01', '03:01:01', '14:54:01', '02:01:01', '05:03:01', "", ""),
+        (7846512, '1994-04-15', 30, 'HICA', 'M', '02:01:01:01', '25:01:01:01', '07:02:01', '08:01:01', '07:01:01', '07:02:01', '03:01:01', '15:01:01', '02:01:01', '06:02:01', "", ""),
+        (8330410, '1998-05-30', 26, 'HICA', 'F', '01:01:01:01', '24:02:01:01', '08:01:01', '40:01:02', '03:04:01', '07:01:01', '03:01:01', '04:04:01', '02:01:01', '03:02:01', "", ""),
+        (7381341, '2000-05-21', 24, 'HICA', 'M', '01:01:01', '02:01:01', '08:01:01', '35:01:01', '04:01:01', '07:01:01', '01:01:01', '03:01:01', '02:01:01', '05:01:01', "", ""),
+        (1408174, '1987-06-20', 37, 'HICA', 'F', '02:01:01:01', '31:01:02:01', '07:02:01', '44:02:01', '05:01:01', '07:02:01', '04:01:01', '04:01:01', '03:01:01:01', '03:02:01:01', "", "")
+    ]
+
+    # Insert the data into the table
+    cursor.executemany('''
+    INSERT INTO person_data (
+        DONN_NUMERO, DOB, Age, Ethnic, Gender, 
+        Ax, Ay, Bx, By, Cx, Cy, DRB1x, DRB1y, DQB1x, DQB1y, wmdaId, SearchID
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', data)
+
+    # Commit the transaction
+    conn.commit()
+
+    # Close the connection
+    conn.close()
+
+    # Add the indexes and the tables used by the other scripts
+    migrate(db_path)
+
+    print("Table created and data inserted successfully!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+import os
+import time
+import queue
+import atexit
+import sqlite3
+import threading
+
+try:
+    from wmda_match.modules.metrics import get_metrics
+except ImportError:  # Running this file directly from wmda_match/modules
+    from metrics import get_metrics
+
+# A batch is committed once it holds this many rows...
+DEFAULT_BATCH_ROWS = 500
+# ...or this many milliseconds after its first write was queued, whichever comes first
+DEFAULT_BATCH_MS = 20
+
+# Writes are only acknowledged once their transaction is on disk. Batching means the
+# fsync this costs is paid once per batch rather than once per row.
+SYNCHRONOUS = "FULL"
+
+# Queued to stop the writer thread
+_STOP = object()
+
+
+class WriteTicket:
+    """
+    Acknowledgement for one queued write.
+
+    wait() returns True once the transaction holding the write has been committed,
+    or raises the error that made the write fail. rowcount is the number of rows the
+    write changed, when the write reports it.
+    """
+
+    def __init__(self, writer):
+        self._writer = writer
+        self.rowcount = None
+        self.error = None
+        self._done = threading.Event()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Block until the write is durable.
+
+        A caller waiting on its write does not sit out the rest of the batch window:
+        the writer is asked to commit what it has gathered straight away, and writes
+        queued meanwhile by other threads go into the next transaction together.
+
+        Args:
+            timeout (float or None): Seconds to wait; None waits for as long as it takes.
+
+        Returns:
+            bool: True when committed, False if the timeout ran out first.
+        """
+        if not self._done.is_set():
+            self._writer._nudge()
+        if not self._done.wait(timeout):
+            return False
+        if self.error is not None:
+            raise self.error
+        return True
+
+
+class _Write:
+    def __init__(self, writer, function, rows, urgent=False):
+        self.function = function
+        self.rows = rows
+        self.urgent = urgent
+        self.ticket = WriteTicket(writer)
+
+
+class DBWriter:
+    """
+    Single thread that makes every queued write to one SQLite database.
+
+    Threads that used to open their own connection and commit each row instead
+    queue the write here and get a WriteTicket back. The writer thread keeps one
+    connection in WAL mode and commits the pending writes together, once a batch
+    holds batch_rows rows or batch_ms milliseconds after its first write, so many
+    threads share one transaction and one fsync instead of fighting over the
+    database lock. Each write runs under its own savepoint, so a write that fails
+    is rolled back and reported on its ticket without losing the rest of the batch.
+
+    Args:
+        db_path (str): Path of the SQLite database.
+        batch_rows (int): Rows after which a batch is committed straight away.
+        batch_ms (float): Milliseconds a batch may wait for more writes.
+    """
+
+    def __init__(self, db_path='sample_data.db', batch_rows=DEFAULT_BATCH_ROWS, batch_ms=DEFAULT_BATCH_MS):
+        self.db_path = db_path
+        self.batch_rows = batch_rows
+        self.batch_ms = batch_ms
+        self._queue = queue.Queue()
+        self._closed = False
+        self._nudged = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, function, rows=1, urgent=False):
+        """
+        Queue function(conn) to run on the writer connection inside the next batch.
+
+        The function must not commit. Its return value, if an int, becomes the
+        ticket's rowcount.
+
+        Returns:
+            WriteTicket: Acknowledgement of the write.
+        """
+        write = _Write(self, function, rows, urgent)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("DB writer is closed")
+            self._queue.put(write)
+        return write.ticket
+
+    def _nudge(self):
+        # Queue one marker that ends the current batch; further waiters share it
+        with self._lock:
+            if self._closed or self._nudged:
+                return
+            self._nudged = True
+            self._queue.put(_Write(self, None, 0, urgent=True))
+
+    def execute(self, sql, params=()):
+        return self.submit(lambda conn: conn.execute(sql, params).rowcount)
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        return self.submit(lambda conn: conn.executemany(sql, seq_of_params).rowcount, rows=max(len(seq_of_params), 1))
+
+    def flush(self, timeout=None):
+        """
+        Commit everything queued so far without waiting for the batch to fill up.
+
+        Returns:
+            bool: True once every earlier write is durable, False if the timeout ran out.
+        """
+        ticket = self.submit(None, rows=0, urgent=True)
+        return ticket.wait(timeout)
+
+    def close(self):
+        """
+        Commit the queued writes and stop the writer thread.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join()
+
+    def _connect(self):
+        # Autocommit mode, so BEGIN/COMMIT in _commit are the only transaction boundaries
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+        return conn
+
+    def _run(self):
+        conn = None
+        stopping = False
+        while not stopping:
+            write = self._queue.get()
+            if write is _STOP:
+                break
+            batch = [write]
+            rows = write.rows
+            deadline = time.monotonic() + self.batch_ms / 1000
+            # Gather more writes until the batch is full, its time is up or a flush asks for it
+            while rows < self.batch_rows and not write.urgent:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    write = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if write is _STOP:
+                    stopping = True
+                    break
+                batch.append(write)
+                rows += write.rows
+
+            if any(write.urgent for write in batch):
+                with self._lock:
+                    self._nudged = False
+
+            try:
+                if conn is None:
+                    conn = self._connect()
+                self._commit(conn, batch, rows)
+            except Exception as error:
+                # The transaction could not be started or committed: every write in it is lost
+                for write in batch:
+                    write.ticket.error = write.ticket.error or error
+            for write in batch:
+                write.ticket._done.set()
+
+        if conn is not None:
+            conn.close()
+
+    def _commit(self, conn, batch, rows):
+        if all(write.function is None for write in batch):
+            # Only flush markers: everything before them is already committed
+            return
+        metrics = get_metrics()
+        with metrics.track_db("write_batch"):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for write in batch:
+                    if write.function is None:
+                        continue
+                    conn.execute("SAVEPOINT queued_write")
+                    try:
+                        result = write.function(conn)
+                    except Exception as error:
+                        conn.execute("ROLLBACK TO queued_write")
+                        write.ticket.error = error
+                    else:
+                        write.ticket.rowcount = result if isinstance(result, int) else None
+                    conn.execute("RELEASE queued_write")
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        metrics.inc("wmda_db_writer_batches_total")
+        metrics.inc("wmda_db_writer_rows_total", value=rows)
+
+
+# One writer per database file, shared by every thread of the process
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_db_writer(db_path='sample_data.db'):
+    """
+    Function to return the shared writer thread for a database, starting it if needed.
+
+    Returns:
+        DBWriter: The writer for db_path.
+    """
+    key = os.path.abspath(db_path)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = _writers[key] = DBWriter(db_path)
+        return writer
+
+
+def close_db_writers(db_path=None):
+    """
+    Function to commit the queued writes of the shared writers and stop their threads.
+
+    Args:
+        db_path (str or None): Only close the writer of this database; every writer if None.
+    """
+    with _writers_lock:
+        if db_path is None:
+            writers = list(_writers.values())
+            _writers.clear()
+        else:
+            writer = _writers.pop(os.path.abspath(db_path), None)
+            writers = [writer] if writer is not None else []
+    for writer in writers:
+        writer.close()
+
+
+# Writes still queued when the program ends are committed rather than dropped
+atexit.register(close_db_writers)
@@ -0,0 +1,431 @@
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+# Path prefix of the WMDA API on the fake server
+API_PREFIX = "/api/v2"
+
+# Seconds a fake search stays "Running" before it is "Completed"
+DEFAULT_SEARCH_DURATION = 5.0
+
+# Lifetime in seconds of the tokens the fake token endpoint issues
+TOKEN_LIFETIME = 3600
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class FakeWMDAServer:
+    """
+    Local stand-in for the WMDA search API and the Azure AD token endpoint, for load testing.
+
+    It implements:
+
+    - POST /oauth2/token and /{tenant}/oauth2/token
+    - GET /api/v2/patients (paged with Offset/Limit), POST /api/v2/patients,
+      PUT /api/v2/patients and PATCH /api/v2/patients/{wmdaId} (JSON Patch)
+    - POST /api/v2/searches, GET /api/v2/searches/{searchId} and
+      GET /api/v2/searches/patientSearches/{wmdaId}
+
+    Patients and searches are kept in memory. GET responses carry an ETag and
+    answer If-None-Match with 304. Every API request can be slowed down and can
+    fail on purpose, so retry and rate-limit handling can be exercised.
+
+    Args:
+        host (str): Interface to listen on.
+        port (int): Port to listen on; 0 picks a free port.
+        latency (float): Seconds added to every request.
+        jitter (float): Extra random delay of up to this many seconds.
+        error_rate (float): Fraction of API requests answered with 500.
+        throttle_rate (float): Fraction of API requests answered with 429.
+        rate_limit (float or None): Requests per second above which requests get 429.
+        retry_after (int): Value of the Retry-After header sent with 429 responses.
+        search_duration (float): Seconds before a search reports "Completed".
+        seed (int or None): Seed for the random fault injection.
+
+    Point the scripts at it with:
+
+        WMDA_API_BASE_URL=http://127.0.0.1:8080/api/v2
+        WMDA_TOKEN_URL=http://127.0.0.1:8080/{tenant_id}/oauth2/token
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0,
+                 rate_limit=None, retry_after=1, search_duration=DEFAULT_SEARCH_DURATION, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.search_duration = search_duration
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._patients = {}
+        self._searches = {}
+        self._next_wmda_id = 100000
+        self._next_search_id = 20000
+        self._next_token = 0
+        self._window = []
+        self._counts = {}
+
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def base_url(self):
+        return self.url + API_PREFIX
+
+    @property
+    def token_url(self):
+        return self.url + "/{tenant_id}/oauth2/token"
+
+    def start(self):
+        # Serve from a background thread so tests and benchmarks can run in the same process
+        self._thread = threading.Thread(target=self._httpd.serve_forever, kwargs={"poll_interval": 0.05},
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def stats(self):
+        """
+        Return the number of requests handled, keyed by "METHOD route status".
+        """
+        with self._lock:
+            return dict(self._counts)
+
+    def count(self, key):
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    # --- Fault injection ---
+
+    def inject_fault(self):
+        """
+        Apply the configured latency, and decide whether this request fails on purpose.
+
+        Returns:
+            int or None: 429 or 500 for a failed request, else None.
+        """
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+        with self._lock:
+            if self.rate_limit:
+                now = time.monotonic()
+                self._window = [t for t in self._window if now - t < 1.0]
+                if len(self._window) >= self.rate_limit:
+                    return 429
+                self._window.append(now)
+            roll = self._random.random()
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 500
+        return None
+
+    # --- State ---
+
+    def issue_token(self):
+        with self._lock:
+            self._next_token += 1
+            return {"access_token": f"fake-token-{self._next_token}", "token_type": "Bearer",
+                    "expires_in": TOKEN_LIFETIME}
+
+    def create_patient(self, data):
+        with self._lock:
+            self._next_wmda_id += 1
+            wmda_id = self._next_wmda_id
+            patient = dict(data)
+            patient.update(wmdaId=wmda_id, status="Active", assignedUserName="fake-user", lastUpdated=_now())
+            self._patients[wmda_id] = patient
+            return wmda_id
+
+    def update_patient(self, data):
+        with self._lock:
+            wmda_id = _as_int(data.get("wmdaId"))
+            if wmda_id not in self._patients:
+                return False
+            patient = dict(self._patients[wmda_id], **data)
+            patient.update(wmdaId=wmda_id, lastUpdated=_now())
+            self._patients[wmda_id] = patient
+            return True
+
+    def patch_patient(self, wmda_id, operations):
+        with self._lock:
+            if wmda_id not in self._patients:
+                return 404
+            patched = json.loads(json.dumps(self._patients[wmda_id]))
+            for operation in operations:
+                if not _apply_operation(patched, operation):
+                    return 422
+            patched.update(wmdaId=wmda_id, lastUpdated=_now())
+            self._patients[wmda_id] = patched
+            return 204
+
+    def list_patients(self, offset, limit):
+        with self._lock:
+            patients = [self._listing(p) for _, p in sorted(self._patients.items())]
+        return {"paging": {"totalCount": len(patients), "offset": offset, "limit": limit},
+                "patients": patients[offset:offset + limit]}
+
+    def _listing(self, patient):
+        # Shape of a patient in the list endpoint, as read by patient_list.py
+        requests_summary = [{"summary": {"summaryText": f"Search {s['searchId']}"}}
+                            for s in self._searches.values() if s["wmdaId"] == patient["wmdaId"]]
+        return {
+            "patientId": patient.get("patientId"),
+            "wmdaId": patient["wmdaId"],
+            "status": patient["status"],
+            "dateOfBirth": patient.get("dateOfBirth"),
+            "ethnicity": patient.get("ethnicity"),
+            "assignedUserName": patient["assignedUserName"],
+            "lastUpdated": patient["lastUpdated"],
+            "requests": requests_summary,
+        }
+
+    def create_search(self, data):
+        with self._lock:
+            wmda_id = _as_int(data.get("wmdaId"))
+            if wmda_id not in self._patients:
+                return None
+            self._next_search_id += 1
+            search_id = self._next_search_id
+            self._searches[search_id] = dict(data, searchId=search_id, wmdaId=wmda_id, created=time.time())
+            return search_id
+
+    def search_summary(self, search_id):
+        with self._lock:
+            search = self._searches.get(search_id)
+            return self._summary(search) if search else None
+
+    def patient_searches(self, wmda_id):
+        with self._lock:
+            return [self._summary(s) for s in self._searches.values() if s["wmdaId"] == wmda_id]
+
+    def _summary(self, search):
+        done = time.time() - search["created"] >= self.search_duration
+        return {
+            "searchId": search["searchId"],
+            "wmdaId": search["wmdaId"],
+            "searchType": search.get("searchType"),
+            "status": "Completed" if done else "Running",
+            "numberOfDonors": 3 if done else 0,
+            "numberOfCords": 1 if done else 0,
+        }
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _apply_operation(document, operation):
+    # Apply one RFC 6902 add/replace/remove operation in place; returns False if it cannot be applied
+    tokens = [t.replace("~1", "/").replace("~0", "~") for t in operation.get("path", "").split("/")[1:]]
+    if not tokens:
+        return False
+    parent = document
+    for token in tokens[:-1]:
+        if not isinstance(parent, dict) or token not in parent:
+            return False
+        parent = parent[token]
+    key = tokens[-1]
+    if operation.get("op") in ("add", "replace") and isinstance(parent, dict):
+        if operation["op"] == "replace" and key not in parent:
+            return False
+        parent[key] = operation.get("value")
+        return True
+    if operation.get("op") == "remove" and isinstance(parent, dict) and key in parent:
+        del parent[key]
+        return True
+    return False
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open, so the pooled client is measured as it runs against the real API
+    protocol_version = "HTTP/1.1"
+
+    # Headers and body are written separately; without TCP_NODELAY every response waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        # Stay quiet under load; use stats() for request counts
+        pass
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def _dispatch(self, method):
+        parts = urlsplit(self.path)
+        path = parts.path.rstrip("/")
+        query = parse_qs(parts.query)
+        body = self._read_body()
+
+        if method == "POST" and re.fullmatch(r"(/[^/]+)?/oauth2/token", path):
+            return self._send(200, self.fake.issue_token(), route="/oauth2/token")
+
+        if not path.startswith(API_PREFIX):
+            return self._send(404, {"error": "Not found"}, route="unknown")
+        path = path[len(API_PREFIX):]
+        route = re.sub(r"/\d+$", "/{id}", path)
+
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            return self._send(401, {"error": "Missing bearer token"}, route=route)
+
+        fault = self.fake.inject_fault()
+        if fault == 429:
+            return self._send(429, {"error": "Too many requests"}, route=route,
+                              headers={"Retry-After": str(self.fake.retry_after)})
+        if fault:
+            return self._send(fault, {"error": "Injected failure"}, route=route)
+
+        match = re.fullmatch(r"/patients/(\d+)", path)
+        if path == "/patients" and method == "GET":
+            offset = int(query.get("Offset", ["0"])[0])
+            limit = int(query.get("Limit", ["100"])[0])
+            return self._send(200, self.fake.list_patients(offset, limit), route=route)
+        if path == "/patients" and method == "POST":
+            if not isinstance(body, dict) or not body.get("patientId"):
+                return self._send(400, {"error": "patientId is required"}, route=route)
+            wmda_id = self.fake.create_patient(body)
+            return self._send(201, {"wmdaId": wmda_id}, route=route,
+                              headers={"Location": f"{API_PREFIX}/patients/{wmda_id}"})
+        if path == "/patients" and method == "PUT":
+            if not isinstance(body, dict) or not self.fake.update_patient(body):
+                return self._send(404, {"error": "Unknown wmdaId"}, route=route)
+            return self._send(204, None, route=route)
+        if match and method == "PATCH":
+            if not isinstance(body, list):
+                return self._send(400, {"error": "Expected a JSON Patch document"}, route=route)
+            status = self.fake.patch_patient(int(match.group(1)), body)
+            return self._send(status, None if status == 204 else {"error": "Patch not applied"}, route=route)
+
+        if path == "/searches" and method == "POST":
+            search_id = self.fake.create_search(body if isinstance(body, dict) else {})
+            if search_id is None:
+                return self._send(404, {"error": "Unknown wmdaId"}, route=route)
+            return self._send(201, {"searchId": search_id}, route=route)
+        match = re.fullmatch(r"/searches/patientSearches/(\d+)", path)
+        if match and method == "GET":
+            return self._send(200, self.fake.patient_searches(int(match.group(1))), route=route)
+        match = re.fullmatch(r"/searches/(\d+)", path)
+        if match and method == "GET":
+            summary = self.fake.search_summary(int(match.group(1)))
+            if summary is None:
+                return self._send(404, {"error": "Unknown searchId"}, route=route)
+            return self._send(200, summary, route=route)
+
+        return self._send(404, {"error": "Not found"}, route=route)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return None
+        raw = self.rfile.read(length)
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    def _send(self, status, data, route, headers=None):
+        payload = b"" if data is None else json.dumps(data).encode("utf-8")
+        headers = dict(headers or {})
+
+        # Conditional GET, as used by the response cache
+        if self.command == "GET" and status == 200:
+            etag = '"' + hashlib.sha1(payload).hexdigest() + '"'
+            headers["ETag"] = etag
+            if self.headers.get("If-None-Match") == etag:
+                status, payload = 304, b""
+
+        self.fake.count(f"{self.command} {route} {status}")
+        self.send_response(status)
+        if payload:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if payload:
+            self.wfile.write(payload)
+
+
+def main(argv=None):
+    """
+    Main function to run the fake WMDA server until it is interrupted.
+    """
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the WMDA API and token endpoint.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay of up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--rate-limit", type=float, help="Requests per second above which requests get 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After value sent with 429 responses")
+    parser.add_argument("--search-duration", type=float, default=DEFAULT_SEARCH_DURATION,
+                        help="Seconds before a search reports Completed")
+    args = parser.parse_args(argv)
+
+    server = FakeWMDAServer(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                            error_rate=args.error_rate, throttle_rate=args.throttle_rate, rate_limit=args.rate_limit,
+                            retry_after=args.retry_after, search_duration=args.search_duration)
+    print(f"Fake WMDA API listening on {server.base_url}")
+    print(f"  WMDA_API_BASE_URL={server.base_url}")
+    print(f"  WMDA_TOKEN_URL={server.token_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping")
+
+
+if __name__ == "__main__":
+    main()
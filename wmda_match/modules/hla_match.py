@@ -0,0 +1,228 @@
+import sqlite3
+import argparse
+from collections import namedtuple
+import numpy as np
+
+try:
+    from wmda_match.modules.allele_dictionary import LOCI, HLA_COLUMNS, split_allele, normalize_allele
+    from wmda_match.modules.metrics import timed_db
+except ImportError:  # Running this file directly from wmda_match/modules
+    from allele_dictionary import LOCI, HLA_COLUMNS, split_allele, normalize_allele
+    from metrics import timed_db
+
+# Rows read from SQLite per fetchmany call while loading
+LOAD_BATCH_SIZE = 50000
+
+# One screening result: the donor and its mismatch counts over all loci
+Candidate = namedtuple("Candidate", ["donor_id", "allele_mismatches", "antigen_mismatches"])
+
+
+class HLAMatchEngine:
+    """
+    In-memory HLA pre-screening over the whole person_data cohort.
+
+    Typings are encoded once as integer arrays of shape (loci, 2, donors): one
+    array at allele level (first two fields, e.g. '01:01') and one at antigen
+    level (first field, e.g. '01'). Each typing column is contiguous, so
+    screening a patient is a few NumPy comparisons per locus over the whole
+    cohort with no Python loop per donor.
+
+    A missing typing (code 0) is treated as unknown and never counted as a mismatch.
+
+    Args:
+        donor_ids (list): The DONN_NUMERO of every row.
+        typings (list): For every row, the ten HLA strings in HLA_COLUMNS order.
+    """
+
+    def __init__(self, donor_ids, typings):
+        self._codes = {"allele": {}, "antigen": {}}
+        self.donor_ids = np.asarray(donor_ids)
+        n = len(self.donor_ids)
+
+        # Encode into flat Python lists and convert to arrays once, which is much
+        # faster than filling a NumPy array row by row
+        allele_flat = []
+        antigen_flat = []
+        for typing in typings:
+            for allele in typing:
+                allele_code, antigen_code = self._encode_allele(allele)
+                allele_flat.append(allele_code)
+                antigen_flat.append(antigen_code)
+        self.allele_codes = _to_columns(allele_flat, n)
+        self.antigen_codes = _to_columns(antigen_flat, n)
+
+        # Missing typings per column, or None for a fully typed column so it costs nothing when screening
+        self._missing = {
+            "allele": _missing_masks(self.allele_codes),
+            "antigen": _missing_masks(self.antigen_codes),
+        }
+
+        # Row lookup for screening a patient that is part of the cohort
+        self._row_by_id = {str(donor_id): row for row, donor_id in enumerate(donor_ids)}
+
+    @classmethod
+    @timed_db("load_hla_cohort")
+    def from_db(cls, db_path='sample_data.db'):
+        """
+        Build the engine from every row of person_data.
+        """
+        conn = sqlite3.connect(db_path)
+        cursor = conn.execute(f"SELECT DONN_NUMERO, {', '.join(HLA_COLUMNS)} FROM person_data")
+        donor_ids = []
+        typings = []
+        while True:
+            rows = cursor.fetchmany(LOAD_BATCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                donor_ids.append(row[0])
+                typings.append(row[1:])
+        conn.close()
+        return cls(donor_ids, typings)
+
+    def _intern(self, level, key):
+        # 0 is reserved for a missing typing
+        if not key:
+            return 0
+        codes = self._codes[level]
+        if key not in codes:
+            codes[key] = len(codes) + 1
+        return codes[key]
+
+    def _encode_allele(self, allele):
+        fields = split_allele(normalize_allele(allele))
+        return self._intern("allele", ":".join(fields[:2])), self._intern("antigen", ":".join(fields[:1]))
+
+    def encode_typing(self, typing):
+        """
+        Encode ten HLA strings (in HLA_COLUMNS order) as allele-level and antigen-level codes.
+
+        A typing that does not occur in the cohort gets a new code, so it matches no donor.
+
+        Returns:
+            tuple: Two integer arrays of shape (loci, 2).
+        """
+        codes = [self._encode_allele(allele) for allele in typing]
+        allele_row = np.array([code[0] for code in codes], dtype=np.int64).reshape(len(LOCI), 2)
+        antigen_row = np.array([code[1] for code in codes], dtype=np.int64).reshape(len(LOCI), 2)
+        return allele_row, antigen_row
+
+    def mismatch_counts(self, patient_allele, patient_antigen):
+        """
+        Count allele-level and antigen-level mismatches of every donor against one patient.
+
+        Args:
+            patient_allele (numpy.ndarray): Allele-level codes of the patient, shape (loci, 2).
+            patient_antigen (numpy.ndarray): Antigen-level codes of the patient, shape (loci, 2).
+
+        Returns:
+            tuple: Two integer arrays with one mismatch count per donor.
+        """
+        return (_count_mismatches(self.allele_codes, patient_allele, self._missing["allele"]),
+                _count_mismatches(self.antigen_codes, patient_antigen, self._missing["antigen"]))
+
+    def screen(self, patient, k=10, exclude_self=True):
+        """
+        Return the k donors with the fewest mismatches against a patient.
+
+        Candidates are ordered by allele-level mismatches, then antigen-level
+        mismatches, then donor ID.
+
+        Args:
+            patient (str, int or sequence): A DONN_NUMERO in the cohort, or ten HLA strings.
+            k (int): Number of candidates to return.
+            exclude_self (bool): Leave the patient's own row out of the results.
+
+        Returns:
+            list: Candidate tuples, best first.
+        """
+        skip_row = None
+        if isinstance(patient, (str, int, np.integer)):
+            if str(patient) not in self._row_by_id:
+                raise KeyError(f"Patient {patient} is not in person_data")
+            row = self._row_by_id[str(patient)]
+            skip_row = row if exclude_self else None
+            patient_allele, patient_antigen = self.allele_codes[:, :, row], self.antigen_codes[:, :, row]
+        else:
+            patient_allele, patient_antigen = self.encode_typing(patient)
+
+        allele_mm, antigen_mm = self.mismatch_counts(patient_allele, patient_antigen)
+
+        # One sortable score per donor: allele mismatches first, antigen mismatches as tie-breaker
+        score = allele_mm.astype(np.int32) * (2 * len(LOCI) + 1) + antigen_mm
+        if skip_row is not None:
+            score[skip_row] = np.iinfo(np.int32).max
+
+        k = min(k, len(score) - (1 if skip_row is not None else 0))
+        if k <= 0:
+            return []
+
+        # argpartition finds the k best in linear time; only those k are fully sorted
+        best = np.argpartition(score, k - 1)[:k] if k < len(score) else np.arange(len(score))
+        best = best[np.lexsort((self.donor_ids[best], score[best]))]
+        return [Candidate(self.donor_ids[i].item(), int(allele_mm[i]), int(antigen_mm[i])) for i in best]
+
+
+def _to_columns(flat_codes, n):
+    """
+    Turn row-ordered codes into a contiguous (loci, 2, donors) array, using int16 when the codes fit.
+    """
+    codes = np.array(flat_codes, dtype=np.int32).reshape(n, len(LOCI), 2)
+    dtype = np.int16 if codes.size == 0 or codes.max() <= np.iinfo(np.int16).max else np.int32
+    return np.ascontiguousarray(codes.transpose(1, 2, 0), dtype=dtype)
+
+
+def _missing_masks(codes):
+    return [[codes[locus, side] == 0 if not codes[locus, side].all() else None for side in range(2)]
+            for locus in range(len(LOCI))]
+
+
+def _count_mismatches(cohort, patient, missing):
+    """
+    Count mismatches per donor, pairing the two alleles of each locus in whichever order matches best.
+
+    Args:
+        cohort (numpy.ndarray): Codes of shape (loci, 2, donors).
+        patient (numpy.ndarray): Codes of shape (loci, 2).
+        missing (list): Per locus and side, a mask of untyped donors or None.
+
+    Returns:
+        numpy.ndarray: Mismatch count per donor.
+    """
+    n = cohort.shape[2]
+    mismatches = np.zeros(n, dtype=np.int8)
+
+    def same(locus, side, code):
+        # An unknown typing on either side counts as a match
+        if code == 0:
+            return np.ones(n, dtype=np.int8)
+        matches = cohort[locus, side] == code
+        if missing[locus][side] is not None:
+            matches |= missing[locus][side]
+        return matches.view(np.int8)
+
+    for locus in range(len(LOCI)):
+        p1, p2 = int(patient[locus, 0]), int(patient[locus, 1])
+        straight = same(locus, 0, p1) + same(locus, 1, p2)
+        crossed = same(locus, 0, p2) + same(locus, 1, p1)
+        mismatches += 2 - np.maximum(straight, crossed)
+    return mismatches
+
+
+def main(argv=None):
+    """
+    Main function to list the best local candidates for a patient before running a WMDA search.
+    """
+    parser = argparse.ArgumentParser(description="Pre-screen person_data for HLA matches to a patient.")
+    parser.add_argument("patient_id", help="DONN_NUMERO of the patient")
+    parser.add_argument("--top", type=int, default=10, help="Number of candidates to show")
+    args = parser.parse_args(argv)
+
+    engine = HLAMatchEngine.from_db()
+    print(f"{'DONN_NUMERO':>12} {'Allele MM':>10} {'Antigen MM':>11}")
+    for candidate in engine.screen(args.patient_id, k=args.top):
+        print(f"{candidate.donor_id:>12} {candidate.allele_mismatches:>10} {candidate.antigen_mismatches:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+import os
+import re
+import json
+import time
+import bisect
+import tempfile
+import threading
+import functools
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Type and help text of every metric this package records
+METRICS = {
+    "wmda_http_requests_total": ("counter", "WMDA API requests by endpoint, method and status."),
+    "wmda_http_request_duration_seconds": ("histogram", "Latency of WMDA API requests."),
+    "wmda_http_requests_in_flight": ("gauge", "WMDA API requests currently being sent."),
+    "wmda_token_fetches_total": ("counter", "Bearer token requests by status."),
+    "wmda_token_fetch_duration_seconds": ("histogram", "Latency of bearer token requests."),
+    "wmda_db_operations_total": ("counter", "SQLite operations by operation and outcome."),
+    "wmda_db_operation_duration_seconds": ("histogram", "Duration of SQLite operations."),
+    "wmda_db_operations_in_flight": ("gauge", "SQLite operations currently running."),
+    "wmda_jobs_total": ("counter", "Worker job runs by kind and outcome."),
+    "wmda_db_writer_batches_total": ("counter", "Transactions committed by the SQLite writer thread."),
+    "wmda_db_writer_rows_total": ("counter", "Rows written by the SQLite writer thread."),
+    "wmda_person_cache_total": ("counter", "person_data lookups by cache result."),
+    "wmda_job_duration_seconds": ("histogram", "Duration of worker job runs."),
+}
+
+
+def endpoint_label(url):
+    """
+    Function to turn a request URL into a low-cardinality endpoint label.
+
+    Numeric IDs become {id}, so /api/v2/searches/26774 is reported as /searches/{id}.
+    """
+    path = urlsplit(url).path
+    if "/api/v2" in path:
+        path = path.split("/api/v2", 1)[1]
+    return re.sub(r"/\d+(?=/|$)", "/{id}", path.rstrip("/")) or "/"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + (list(extra) if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+class MetricsRegistry:
+    """
+    Thread-safe in-process store of counters, gauges and latency histograms.
+
+    Every series is identified by a metric name and a set of labels, e.g.
+    wmda_http_requests_total{endpoint="/patients",method="POST",status="201"}.
+    The registry can be rendered as Prometheus text or as a JSON snapshot.
+
+    Args:
+        buckets (tuple): Upper bounds of the histogram buckets in seconds.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((labels or {}).items()))
+
+    def inc(self, name, labels=None, value=1):
+        """
+        Add value to a counter or gauge; a negative value lowers a gauge.
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name, labels, seconds):
+        """
+        Record one duration in a histogram.
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0}
+            histogram["counts"][bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram["sum"] += seconds
+
+    def value(self, name, labels=None):
+        with self._lock:
+            return self._values.get(self._key(name, labels), 0)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+            self._histograms.clear()
+
+    def prometheus_text(self):
+        """
+        Render every series in the Prometheus text exposition format.
+        """
+        with self._lock:
+            values = dict(self._values)
+            histograms = {key: {"counts": list(h["counts"]), "sum": h["sum"]} for key, h in self._histograms.items()}
+
+        lines = []
+        names = sorted({name for name, _ in values} | {name for name, _ in histograms})
+        for name in names:
+            metric_type, help_text = METRICS.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for (series, labels), value in sorted(values.items()):
+                if series == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            for (series, labels), histogram in sorted(histograms.items()):
+                if series != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), histogram["counts"]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """
+        Return every series as plain data for a JSON report.
+
+        Returns:
+            dict: 'counters' and 'histograms' lists; each histogram has its count,
+            sum, mean and cumulative bucket counts.
+        """
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self._values.items())]
+            histograms = []
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                count = sum(histogram["counts"])
+                cumulative = 0
+                buckets = {}
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), histogram["counts"]):
+                    cumulative += bucket_count
+                    buckets["+Inf" if bound == float("inf") else repr(bound)] = cumulative
+                histograms.append({"name": name, "labels": dict(labels), "count": count,
+                                   "sum": round(histogram["sum"], 6),
+                                   "mean": round(histogram["sum"] / count, 6) if count else None,
+                                   "buckets": buckets})
+        return {"timestamp": time.time(), "counters": counters, "histograms": histograms}
+
+    # --- Instrumentation helpers ---
+
+    @contextmanager
+    def track_request(self, method, url):
+        """
+        Time one API request, counting it by endpoint, method and status.
+
+        The body of the with block sets .status on the yielded dict; a request that
+        raises is recorded with status "error".
+        """
+        base = {"endpoint": endpoint_label(url), "method": method.upper()}
+        outcome = {"status": "error"}
+        self.inc("wmda_http_requests_in_flight", base)
+        start = time.perf_counter()
+        try:
+            yield outcome
+        finally:
+            labels = dict(base, status=str(outcome["status"]))
+            self.observe("wmda_http_request_duration_seconds", labels, time.perf_counter() - start)
+            self.inc("wmda_http_requests_total", labels)
+            self.inc("wmda_http_requests_in_flight", base, -1)
+
+    @contextmanager
+    def track_db(self, operation):
+        """
+        Time one SQLite operation, counting it as "ok" or "error".
+        """
+        self.inc("wmda_db_operations_in_flight", {"operation": operation})
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            yield
+            outcome = "ok"
+        finally:
+            labels = {"operation": operation, "outcome": outcome}
+            self.observe("wmda_db_operation_duration_seconds", labels, time.perf_counter() - start)
+            self.inc("wmda_db_operations_total", labels)
+            self.inc("wmda_db_operations_in_flight", {"operation": operation}, -1)
+
+
+def timed_db(operation):
+    """
+    Decorator that records a function as one SQLite operation in the shared registry.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_metrics().track_db(operation):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def write_textfile(path, registry=None):
+    """
+    Write the metrics in Prometheus text format, replacing the file atomically
+    so a collector (e.g. the node_exporter textfile collector) never reads half a file.
+    """
+    registry = registry or get_metrics()
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics-")
+    with os.fdopen(fd, "w") as f:
+        f.write(registry.prometheus_text())
+    os.replace(tmp_path, path)
+
+
+def write_snapshot(path, registry=None):
+    """
+    Write a JSON snapshot of the metrics, e.g. at the end of a batch run.
+    """
+    registry = registry or get_metrics()
+    with open(path, "w") as f:
+        json.dump(registry.snapshot(), f, indent=2)
+
+
+def export_metrics():
+    """
+    Function to write the metrics wherever the environment asks for them, at the end of a batch run.
+
+    WMDA_METRICS_JSON names a JSON snapshot file and WMDA_METRICS_TEXTFILE a
+    Prometheus text file; nothing is written when neither is set.
+    """
+    if os.getenv("WMDA_METRICS_JSON"):
+        write_snapshot(os.getenv("WMDA_METRICS_JSON"))
+        print(f"Metrics snapshot written to {os.getenv('WMDA_METRICS_JSON')}")
+    if os.getenv("WMDA_METRICS_TEXTFILE"):
+        write_textfile(os.getenv("WMDA_METRICS_TEXTFILE"))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.registry.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host="127.0.0.1", registry=None):
+    """
+    Serve the metrics at http://host:port/metrics from a background thread.
+
+    Returns:
+        ThreadingHTTPServer: The running server; call shutdown() to stop it.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry or get_metrics()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# Shared registry used by the scripts in this package
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_metrics():
+    """
+    Return the process-wide MetricsRegistry, creating it on first use.
+
+    If WMDA_METRICS_PORT is set, the metrics are also served over HTTP on that port.
+    When the port cannot be used (e.g. another script is already serving on it), a
+    warning is printed and the metrics are only kept in this process.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry()
+            if os.getenv("WMDA_METRICS_PORT"):
+                try:
+                    start_http_server(int(os.getenv("WMDA_METRICS_PORT")), registry=_registry)
+                except OSError as e:
+                    print(f"Warning: metrics not served on port {os.getenv('WMDA_METRICS_PORT')}: {e}")
+        return _registry
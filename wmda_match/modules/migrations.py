@@ -0,0 +1,343 @@
+import sys
+import time
+import sqlite3
+import argparse
+
+# Each step below holds its own copy of the DDL as it was released. The ensure_*
+# helpers the scripts call at runtime may change later; a database already at a
+# version must still mean the same schema, so the steps never call them.
+
+def _table_columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def create_person_data_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS person_data (
+            DONN_NUMERO INTEGER PRIMARY KEY,
+            DOB TEXT,
+            Age INTEGER,
+            Ethnic TEXT,
+            Gender TEXT,
+            Ax TEXT,
+            Ay TEXT,
+            Bx TEXT,
+            By TEXT,
+            Cx TEXT,
+            Cy TEXT,
+            DRB1x TEXT,
+            DRB1y TEXT,
+            DQB1x TEXT,
+            DQB1y TEXT,
+            wmdaID INTEGER,
+            SearchID INTEGER
+        )
+    ''')
+
+
+def create_person_data_indexes(conn):
+    # Lookups by wmdaID and SearchID
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_person_data_wmdaid ON person_data (wmdaID)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_person_data_searchid ON person_data (SearchID)")
+    # First versions of the partial indexes; replaced by step 10
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_person_data_pending_create ON person_data (DONN_NUMERO)
+        WHERE wmdaID IS NULL OR wmdaID = ''
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_person_data_open_searches ON person_data (SearchID, DONN_NUMERO)
+        WHERE SearchID IS NOT NULL AND SearchID != ''
+    ''')
+
+
+def create_allele_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS hla_alleles (
+            id INTEGER PRIMARY KEY,
+            locus TEXT NOT NULL,
+            allele TEXT NOT NULL,
+            field1 TEXT,
+            field2 TEXT,
+            field3 TEXT,
+            field4 TEXT,
+            UNIQUE (locus, allele)
+        )
+    ''')
+    existing = _table_columns(conn, "person_data")
+    for column in ("Ax", "Ay", "Bx", "By", "Cx", "Cy", "DRB1x", "DRB1y", "DQB1x", "DQB1y"):
+        if f"{column}_code" not in existing:
+            conn.execute(f"ALTER TABLE person_data ADD COLUMN {column}_code INTEGER")
+
+
+def create_payload_hashes_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS payload_hashes (
+            DONN_NUMERO INTEGER PRIMARY KEY,
+            payload_hash TEXT NOT NULL,
+            sent_at REAL NOT NULL,
+            payload TEXT
+        )
+    ''')
+    # Tables created before the last sent document was kept have no payload column
+    if "payload" not in _table_columns(conn, "payload_hashes"):
+        conn.execute("ALTER TABLE payload_hashes ADD COLUMN payload TEXT")
+
+
+def create_sync_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            name TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS wmda_patients (
+            patientId TEXT PRIMARY KEY,
+            wmdaId INTEGER,
+            status TEXT,
+            dateOfBirth TEXT,
+            ethnicity TEXT,
+            assignedUserName TEXT,
+            lastUpdated TEXT,
+            data TEXT
+        )
+    ''')
+
+
+def create_results_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS search_results (
+            search_id TEXT PRIMARY KEY,
+            donor_id TEXT,
+            status TEXT,
+            summary TEXT,
+            completed_at REAL
+        )
+    ''')
+
+
+def create_cache_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS api_cache (
+            endpoint TEXT NOT NULL,
+            cache_key TEXT NOT NULL,
+            body TEXT NOT NULL,
+            etag TEXT,
+            fetched_at REAL NOT NULL,
+            last_access REAL NOT NULL,
+            size INTEGER NOT NULL,
+            PRIMARY KEY (endpoint, cache_key)
+        )
+    ''')
+    # Eviction walks the cache from least to most recently used
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_api_cache_last_access ON api_cache (last_access)")
+
+
+def create_jobs_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            donor_id TEXT,
+            payload TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            not_before REAL,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            duration REAL,
+            worker TEXT,
+            result TEXT
+        )
+    ''')
+    # The worker only ever looks for runnable pending jobs
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_jobs_pending ON jobs (not_before, id)
+        WHERE status = 'pending'
+    ''')
+
+
+def create_journal_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bulk_runs (
+            run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            operation TEXT NOT NULL,
+            options TEXT,
+            status TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            finished_at REAL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bulk_progress (
+            run_id INTEGER NOT NULL,
+            donor_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            detail TEXT,
+            wmda_id INTEGER,
+            payload TEXT,
+            updated_at REAL,
+            PRIMARY KEY (run_id, donor_id)
+        )
+    ''')
+
+
+def rebuild_partial_indexes(conn):
+    # SQLite only uses a partial index when a single term of the query's WHERE clause
+    # matches the index's WHERE clause, and it preferred the wmdaID index with an OR
+    # over the first pending-create index. Both predicates are now one COALESCE term,
+    # which is written the same way in create_patient.PENDING_DONORS_SQL and
+    # search_poller.OUTSTANDING_SEARCHES_SQL and which no other index can serve.
+    conn.execute("DROP INDEX IF EXISTS idx_person_data_pending_create")
+    conn.execute("DROP INDEX IF EXISTS idx_person_data_open_searches")
+    conn.execute('''
+        CREATE INDEX idx_person_data_pending_create ON person_data (DONN_NUMERO)
+        WHERE COALESCE(wmdaID, '') = ''
+    ''')
+    # Ordered by DONN_NUMERO and covering SearchID, so the poller reads it without a sort
+    conn.execute('''
+        CREATE INDEX idx_person_data_open_searches ON person_data (DONN_NUMERO, SearchID)
+        WHERE COALESCE(SearchID, '') != ''
+    ''')
+    # On an analysed database an index without statistics looks worse than a table scan,
+    # so give the new indexes theirs; an unanalysed database uses the defaults for all
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+        conn.execute("ANALYZE idx_person_data_pending_create")
+        conn.execute("ANALYZE idx_person_data_open_searches")
+
+
+def retruncate_expressed_alleles(conn):
+    # The field1..field4 truncations of alleles with an expression suffix kept the suffix
+    # ('01:01:01:02N' gave '01:01N' at 2 fields), so they missed equality joins on the
+    # plain fields. Only the full-length truncation keeps it. Rows whose field1 is NULL
+    # are not allele fields and stay as they are.
+    rows = conn.execute(
+        "SELECT id, allele FROM hla_alleles WHERE field1 IS NOT NULL AND allele GLOB '*[A-Z]'"
+    ).fetchall()
+    for allele_id, allele in rows:
+        fields = allele.split(":")
+        bare = fields[:-1] + [fields[-1].rstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ")]
+        truncated = [allele if n == len(fields) else ":".join(bare[:n]) if n < len(fields) else None
+                     for n in range(1, 5)]
+        conn.execute("UPDATE hla_alleles SET field1 = ?, field2 = ?, field3 = ?, field4 = ? WHERE id = ?",
+                     truncated + [allele_id])
+
+
+# Ordered migration steps: (version, description, function taking an open connection).
+# Steps must never be edited or reordered once released; add a new step instead.
+# The table steps use CREATE ... IF NOT EXISTS so databases created before this
+# module existed are brought under version control without losing data.
+MIGRATIONS = [
+    (1, "person_data table", create_person_data_table),
+    (2, "Indexes on wmdaID and SearchID", create_person_data_indexes),
+    (3, "Allele dictionary and person_data code columns", create_allele_tables),
+    (4, "Payload hashes for bulk updates", create_payload_hashes_table),
+    (5, "Patient sync state and wmda_patients mirror", create_sync_tables),
+    (6, "Search results", create_results_table),
+    (7, "API response cache", create_cache_tables),
+    (8, "Worker job queue", create_jobs_table),
+    (9, "Bulk run progress journal", create_journal_tables),
+    (10, "Partial indexes matching the pending-create and open-search queries", rebuild_partial_indexes),
+    (11, "Allele truncations without the expression suffix", retruncate_expressed_alleles),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def ensure_schema_version_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at REAL NOT NULL
+        )
+    ''')
+
+
+def get_schema_version(conn):
+    """
+    Function to read the version of the latest migration applied to a database.
+
+    Returns:
+        int: The version, or 0 for a database that has never been migrated.
+    """
+    ensure_schema_version_table(conn)
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(db_path='sample_data.db', target=None):
+    """
+    Function to bring a database up to date by applying every pending migration in order.
+
+    Each step runs in its own transaction together with its schema_version row, so a
+    failing step leaves the database at the previous version.
+
+    Args:
+        db_path (str): Path of the SQLite database.
+        target (int or None): Stop after this version; defaults to the latest.
+
+    Returns:
+        list: The versions applied by this call.
+    """
+    target = LATEST_VERSION if target is None else target
+    # Autocommit mode, so BEGIN/COMMIT below are the only transaction boundaries
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    applied = []
+    try:
+        current = get_schema_version(conn)
+        for version, description, step in MIGRATIONS:
+            if version <= current or version > target:
+                continue
+            conn.execute("BEGIN")
+            try:
+                step(conn)
+                conn.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                             (version, description, time.time()))
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+            applied.append(version)
+            print(f"Applied migration {version}: {description}")
+
+        if applied:
+            # Refresh the query planner statistics for the new indexes
+            conn.execute("PRAGMA optimize")
+    finally:
+        conn.close()
+    return applied
+
+
+def main(argv=None):
+    """
+    Main function to upgrade a database in place, or show its schema version.
+    """
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations to the SQLite database.")
+    parser.add_argument("--db", default="sample_data.db", help="SQLite database to upgrade")
+    parser.add_argument("--target", type=int, help="Stop after this migration version")
+    parser.add_argument("--status", action="store_true", help="Only print the current and latest versions")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        conn = sqlite3.connect(args.db)
+        version = get_schema_version(conn)
+        conn.close()
+        print(f"Schema version {version} of {LATEST_VERSION}")
+        return 0
+
+    try:
+        applied = migrate(args.db, target=args.target)
+    except sqlite3.Error as error:
+        print(f"Migration failed: {error}")
+        return 1
+
+    if not applied:
+        print("Database is already up to date.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
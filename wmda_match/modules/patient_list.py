@@ -1,77 +1,25 @@
-import os
-import sqlite3
-import requests
-import json
-from dotenv import load_dotenv
+import argparse
 
-# Load environment variables from the .env file
-load_dotenv()
+try:
+    from wmda_match.modules.auth import get_bearer_token
+    from wmda_match.modules.patient_pages import iter_patient_pages, DEFAULT_WORKERS
+    from wmda_match.modules.config import load_config
+except ImportError:  # Running this file directly from wmda_match/modules
+    from auth import get_bearer_token
+    from patient_pages import iter_patient_pages, DEFAULT_WORKERS
+    from config import load_config
 
-# Retrieve API credentials from environment variables
-TENANT_ID = os.getenv("TENANT_ID")
-RESOURCE_ID = os.getenv("RESOURCE_ID")
-CLIENT_ID = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-USER_AGENT = os.getenv("USER_AGENT")  # Loaded from .env file
-API_URL = "https://sandbox-search-api.wmda.info/api/v2/patients"
-    
-def get_bearer_token():
-    # Construct the token URL
-    token_url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/token"
-    
-    # Set headers and payload for the request
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded',
-        'User-Agent': USER_AGENT
-    }
-    payload = {
-        'grant_type': 'client_credentials',
-        'client_id': CLIENT_ID,
-        'client_secret': CLIENT_SECRET,
-        'resource': RESOURCE_ID
-    }
 
-    # Make the request to get the bearer token
-    response = requests.post(token_url, headers=headers, data=payload)
+# Step 2: Retrieve patient data using GET requests, one page at a time
+def get_patient_data(bearer_token, max_workers=DEFAULT_WORKERS):
 
-    # Check the response status
-    if response.status_code == 200:
-        token_data = response.json()
-        return token_data['access_token']
-    else:
-        print("Error getting bearer token:", response.status_code, response.text)
-        return None
+    # Pages after the first are fetched concurrently, and only a few are held in memory at once
+    for page_number, page in enumerate(iter_patient_pages(bearer_token, max_workers=max_workers)):
+        if page_number == 0:
+            print("Total patients found:", page['paging']['totalCount'])
 
-
-# Step 2: Retrieve patient data using GET request
-def get_patient_data(bearer_token):
-    
-    # Parameters for the API request
-    params = {
-        "Limit": 100,  # Maximum number of patients per page
-        "OnlyMyPatients": False,  # Set to True to only return patients assigned to the current user
-        "Offset": 0,  # Starting from the first page (set as required)
-    }
-
-    # Headers for authentication, content type, and user agent
-    headers = {
-        "Authorization": f"Bearer {bearer_token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-        "User-Agent": USER_AGENT  # Custom User Agent
-    }
-
-    # Send GET request to the API
-    response = requests.get(API_URL, headers=headers, params=params)
-
-    # Check for successful response
-    if response.status_code == 200:
-        # Parse JSON response
-        response_data = response.json()
-
-        # Print patient data (example: print first patient details)
-        print("Total patients found:", response_data['paging']['totalCount'])
-        for patient in response_data['patients']:
+        # Print the details of every patient on this page
+        for patient in page['patients']:
             print("\nPatient ID:", patient['patientId'])
             print("WMDA ID:", patient['wmdaId'])
             print("Status:", patient['status'])
@@ -80,13 +28,13 @@ def get_patient_data(bearer_token):
             print("Assigned User:", patient['assignedUserName'])
             print("Last Updated:", patient['lastUpdated'])
             print("Requests Summary:", patient['requests'][0]['summary']['summaryText'] if patient['requests'] else "No requests")
-    else:
-        # Handle errors
-        print(f"Failed to retrieve data. Status Code: {response.status_code}")
-        print("Response:", response.text)
 
 # Main execution flow
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print every patient registered on the WMDA.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Number of pages fetched at once (at most WMDA_MAX_CONCURRENCY)")
+    args = parser.parse_args(argv)
+
     # Step 1: Retrieve the Bearer Token
     bearer_token = get_bearer_token()
     if not bearer_token:
@@ -94,7 +42,9 @@ def main():
         return
 
     # Step 2: Retrieve and display patient data
-    get_patient_data(bearer_token)
+    get_patient_data(bearer_token, max_workers=args.workers)
 
 # Run the script
-main()
+if __name__ == "__main__":
+    load_config()
+    main()
@@ -0,0 +1,130 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from wmda_match.modules.wmda_client import get_client, api_url
+    from wmda_match.modules.rate_limiter import get_rate_limiter
+except ImportError:  # Running this file directly from wmda_match/modules
+    from wmda_client import get_client, api_url
+    from rate_limiter import get_rate_limiter
+
+API_PATH = "/patients"
+
+# Maximum number of patients the API returns per page
+PAGE_SIZE = 100
+
+# Number of pages fetched at the same time after the first one
+DEFAULT_WORKERS = 4
+
+
+def fetch_patient_page(bearer_token, offset=0, limit=PAGE_SIZE, only_my_patients=False, extra_params=None):
+    """
+    Function to fetch one page of the patient list from the WMDA API.
+
+    Args:
+        bearer_token (str): The Bearer token used for authentication.
+        offset (int): Index of the first patient to return.
+        limit (int): Maximum number of patients to return.
+        only_my_patients (bool): Whether to return only the patients assigned to the current user.
+        extra_params (dict or None): Additional query parameters, e.g. a sort order or filter.
+
+    Returns:
+        dict or None: The parsed JSON page (with 'paging' and 'patients'), or None if the request failed.
+    """
+    params = {
+        "Limit": limit,
+        "OnlyMyPatients": only_my_patients,
+        "Offset": offset,
+    }
+    if extra_params:
+        params.update(extra_params)
+    headers = {
+        "Authorization": f"Bearer {bearer_token}",
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+        "User-Agent": os.getenv("USER_AGENT")
+    }
+
+    response = get_client().get(api_url(API_PATH), headers=headers, params=params)
+
+    if response.status_code == 200:
+        return response.json()
+    else:
+        print(f"Failed to retrieve data. Status Code: {response.status_code}")
+        print("Response:", response.text)
+        return None
+
+
+def iter_patient_pages(bearer_token, page_size=PAGE_SIZE, max_workers=DEFAULT_WORKERS, only_my_patients=False,
+                       extra_params=None):
+    """
+    Generator that yields every page of the patient list, in order.
+
+    The first page is fetched on its own to read paging.totalCount. The remaining
+    offsets are then fetched concurrently, keeping at most max_workers pages in
+    flight, so memory use does not grow with the size of the registry.
+
+    Args:
+        bearer_token (str): The Bearer token used for authentication.
+        page_size (int): Number of patients requested per page.
+        max_workers (int): Maximum number of pages fetched at the same time.
+        only_my_patients (bool): Whether to return only the patients assigned to the current user.
+        extra_params (dict or None): Additional query parameters sent with every page request.
+
+    Yields:
+        dict: One parsed JSON page at a time.
+
+    Raises:
+        RuntimeError: If a page after the first one cannot be retrieved, so that
+        callers never mistake a partial listing for the whole registry.
+    """
+    first_page = fetch_patient_page(bearer_token, 0, page_size, only_my_patients, extra_params)
+    if first_page is None:
+        return
+    yield first_page
+
+    total_count = first_page["paging"]["totalCount"]
+    offsets = iter(range(page_size, total_count, page_size))
+
+    get_rate_limiter().start_concurrency(max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        def submit(offset):
+            return offset, executor.submit(fetch_patient_page, bearer_token, offset, page_size, only_my_patients,
+                                           extra_params)
+
+        # Fill the window, then submit one new page for every page handed out
+        pending = deque(submit(offset) for _, offset in zip(range(max_workers), offsets))
+        try:
+            while pending:
+                offset, future = pending.popleft()
+                page = future.result()
+                next_offset = next(offsets, None)
+                if next_offset is not None:
+                    pending.append(submit(next_offset))
+                if page is None:
+                    raise RuntimeError(f"Failed to retrieve patients at offset {offset}")
+                yield page
+        finally:
+            # Stop queued pages if the caller stopped early or a page failed
+            for _, future in pending:
+                future.cancel()
+
+
+def iter_patients(bearer_token, page_size=PAGE_SIZE, max_workers=DEFAULT_WORKERS, only_my_patients=False,
+                  extra_params=None):
+    """
+    Generator that yields every patient on the WMDA API, one at a time.
+
+    Args:
+        bearer_token (str): The Bearer token used for authentication.
+        page_size (int): Number of patients requested per page.
+        max_workers (int): Maximum number of pages fetched at the same time.
+        only_my_patients (bool): Whether to return only the patients assigned to the current user.
+        extra_params (dict or None): Additional query parameters sent with every page request.
+
+    Yields:
+        dict: One patient record at a time.
+    """
+    for page in iter_patient_pages(bearer_token, page_size, max_workers, only_my_patients, extra_params):
+        yield from page["patients"]
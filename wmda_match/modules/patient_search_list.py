@@ -1,63 +1,34 @@
 import os
-import sqlite3
-import requests
+import argparse
 import json
-from dotenv import load_dotenv
 
-# Load environment variables from the .env file
-load_dotenv()
+try:
+    from wmda_match.modules.auth import get_bearer_token
+    from wmda_match.modules.wmda_client import get_client, api_url
+    from wmda_match.modules.response_cache import get_response_cache, cached_get
+    from wmda_match.modules.config import load_config
+    from wmda_match.modules.person_repository import get_person_repository
+except ImportError:  # Running this file directly from wmda_match/modules
+    from auth import get_bearer_token
+    from wmda_client import get_client, api_url
+    from response_cache import get_response_cache, cached_get
+    from config import load_config
+    from person_repository import get_person_repository
 
-# Retrieve API credentials from environment variables
-TENANT_ID = os.getenv("TENANT_ID")
-RESOURCE_ID = os.getenv("RESOURCE_ID")
-CLIENT_ID = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-USER_AGENT = os.getenv("USER_AGENT")  # Loaded from .env file
-API_URL_SEARCH = "https://sandbox-search-api.wmda.info/api/v2/searches/patientSearches/{wmdaId}"
-    
-def get_bearer_token():
-    # Construct the token URL
-    token_url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/token"
-    
-    # Set headers and payload for the request
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded',
-        'User-Agent': USER_AGENT
-    }
-    payload = {
-        'grant_type': 'client_credentials',
-        'client_id': CLIENT_ID,
-        'client_secret': CLIENT_SECRET,
-        'resource': RESOURCE_ID
-    }
-
-    # Make the request to get the bearer token
-    response = requests.post(token_url, headers=headers, data=payload)
-
-    # Check the response status
-    if response.status_code == 200:
-        token_data = response.json()
-        return token_data['access_token']
-    else:
-        print("Error getting bearer token:", response.status_code, response.text)
-        return None
+API_PATH_SEARCH = "/searches/patientSearches/{wmdaId}"
 
-# Function to get wmdaId from the SQLite database for a specific donor
-def get_wmda_id(donor_id):
-    conn = sqlite3.connect('sample_data.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT wmdaId FROM person_data WHERE DONN_NUMERO = ?", (donor_id,))
-    result = cursor.fetchone()
-    conn.close()
+# Function to get wmdaId from the SQLite database for a specific donor, through the cached repository
+def get_wmda_id(donor_id, db_path='sample_data.db'):
+    wmda_id = get_person_repository(db_path).get_wmda_id(donor_id)
 
-    if result and result[0]:
-        return result[0]
+    if wmda_id:
+        return wmda_id
     else:
         print("wmdaId not found for DONN_NUMERO:", donor_id)
         return None
 
 # Function to retrieve all search results for a patient using their wmdaId
-def get_patient_searches(wmda_id):
+def get_patient_searches(wmda_id, use_cache=True):
 
     # Get Bearer Token
     token = get_bearer_token()
@@ -66,34 +37,43 @@ def get_patient_searches(wmda_id):
         return
 
     # Send a GET request to fetch search results
-    url = API_URL_SEARCH.format(wmdaId=wmda_id)
+    url = api_url(API_PATH_SEARCH.format(wmdaId=wmda_id))
     headers = {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json",
-        "User-Agent": USER_AGENT  # Custom User Agent
+        "User-Agent": os.getenv("USER_AGENT")  # Custom User Agent
     }
 
-    response = requests.get(url, headers=headers)
+    # Use the local cache unless it is disabled (--no-cache)
+    cache = get_response_cache() if use_cache else None
+    search_data, response = cached_get(cache, "patient_searches", wmda_id, url, headers, get_client().get)
 
-    if response.status_code == 200:
-        search_data = response.json()
+    if search_data is not None:
         print("Search Results for wmdaId:", wmda_id)
         print(json.dumps(search_data, indent=4))
     else:
         print(f"Error retrieving search results: {response.status_code}, Response: {response.text}")
+        return None
+    return search_data
 
 # Main function to run the script
-def main():
-    donor_id = input("Enter the donor ID: ")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show every WMDA search for a patient.")
+    parser.add_argument("donor_id", nargs="?", help="Donor ID (DONN_NUMERO); asked for if not given")
+    parser.add_argument("--no-cache", action="store_true", help="Always fetch the search list from the API")
+    args = parser.parse_args(argv)
+
+    donor_id = args.donor_id or input("Enter the donor ID: ")
 
     # Retrieve wmdaId from the database
     wmda_id = get_wmda_id(donor_id)
 
     if wmda_id:
         # Retrieve all patient search results
-        get_patient_searches(wmda_id)
+        get_patient_searches(wmda_id, use_cache=not args.no_cache)
     else:
         print("wmdaId not found. Aborting search retrieval.")
 
 if __name__ == "__main__":
+    load_config()
     main()
@@ -0,0 +1,255 @@
+import json
+import sqlite3
+import argparse
+from datetime import timezone
+from dateutil import parser as date_parser
+
+try:
+    from wmda_match.modules.auth import get_bearer_token
+    from wmda_match.modules.patient_pages import iter_patient_pages, iter_patients, DEFAULT_WORKERS
+    from wmda_match.modules.metrics import timed_db, export_metrics
+    from wmda_match.modules.config import load_config
+    from wmda_match.modules.person_repository import invalidate_person_cache
+    from wmda_match.modules.db_writer import get_db_writer
+except ImportError:  # Running this file directly from wmda_match/modules
+    from auth import get_bearer_token
+    from patient_pages import iter_patient_pages, iter_patients, DEFAULT_WORKERS
+    from metrics import timed_db, export_metrics
+    from config import load_config
+    from person_repository import invalidate_person_cache
+    from db_writer import get_db_writer
+
+# Key of the patient-list high-water mark in the sync_state table
+HIGH_WATER_MARK = "patients.lastUpdated"
+
+# Number of changed patients written to the database per executemany call
+UPSERT_BATCH_SIZE = 500
+
+
+def ensure_sync_tables(conn):
+    """
+    Function to create the sync state table and the local mirror of WMDA patients if needed.
+
+    Args:
+        conn (sqlite3.Connection): Open connection to the database.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            name TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS wmda_patients (
+            patientId TEXT PRIMARY KEY,
+            wmdaId INTEGER,
+            status TEXT,
+            dateOfBirth TEXT,
+            ethnicity TEXT,
+            assignedUserName TEXT,
+            lastUpdated TEXT,
+            data TEXT
+        )
+    ''')
+
+
+@timed_db("get_high_water_mark")
+def get_high_water_mark(conn):
+    """
+    Function to read the newest lastUpdated value seen by the previous sync.
+
+    Returns:
+        str or None: The stored lastUpdated timestamp, or None before the first sync.
+    """
+    row = conn.execute("SELECT value FROM sync_state WHERE name = ?", (HIGH_WATER_MARK,)).fetchone()
+    return row[0] if row else None
+
+
+@timed_db("set_high_water_mark")
+def set_high_water_mark(conn, value):
+    conn.execute(
+        "INSERT INTO sync_state (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+        (HIGH_WATER_MARK, value)
+    )
+
+
+def parse_timestamp(value):
+    """
+    Function to turn a lastUpdated string from the API into a comparable datetime.
+
+    Timestamps without a timezone are treated as UTC so that they can be compared
+    with ones that have one.
+    """
+    parsed = date_parser.isoparse(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+@timed_db("upsert_patients")
+def upsert_patients(conn, patients):
+    """
+    Function to insert or update patient records in the wmda_patients mirror table.
+
+    Args:
+        conn (sqlite3.Connection): Open connection to the database.
+        patients (list): Patient records as returned by the API.
+    """
+    rows = [
+        (
+            str(p.get("patientId")), p.get("wmdaId"), p.get("status"), p.get("dateOfBirth"),
+            p.get("ethnicity"), p.get("assignedUserName"), p.get("lastUpdated"), json.dumps(p)
+        )
+        for p in patients
+    ]
+    conn.executemany('''
+        INSERT INTO wmda_patients (
+            patientId, wmdaId, status, dateOfBirth, ethnicity, assignedUserName, lastUpdated, data
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(patientId) DO UPDATE SET
+            wmdaId = excluded.wmdaId,
+            status = excluded.status,
+            dateOfBirth = excluded.dateOfBirth,
+            ethnicity = excluded.ethnicity,
+            assignedUserName = excluded.assignedUserName,
+            lastUpdated = excluded.lastUpdated,
+            data = excluded.data
+    ''', rows)
+
+
+def iter_changed_patients(bearer_token, since, since_param=None, sort_params=None):
+    """
+    Generator that yields the patients changed at or after the given timestamp.
+
+    If the API supports a server-side filter, pass its query parameter name as
+    since_param and only changed patients are transferred. Otherwise, if
+    sort_params makes the API return the most recently updated patients first,
+    the listing stops at the first page that reaches older records. With neither,
+    the whole list is read and filtered locally.
+
+    Args:
+        bearer_token (str): The Bearer token used for authentication.
+        since (str or None): The high-water mark; None yields every patient.
+        since_param (str or None): Name of a server-side "updated since" query parameter.
+        sort_params (dict or None): Query parameters sorting the list by lastUpdated, newest first.
+
+    Yields:
+        dict: One changed patient record at a time.
+    """
+    if since is None:
+        yield from iter_patients(bearer_token)
+        return
+
+    since_time = parse_timestamp(since)
+
+    if since_param:
+        # The server does the filtering; keep the local check as a safety net
+        for patient in iter_patients(bearer_token, extra_params={since_param: since}):
+            if patient.get("lastUpdated") and parse_timestamp(patient["lastUpdated"]) >= since_time:
+                yield patient
+        return
+
+    # Read pages one at a time when sorted, so no pages past the stopping point are requested
+    max_workers = 1 if sort_params else DEFAULT_WORKERS
+    pages = iter_patient_pages(bearer_token, max_workers=max_workers, extra_params=sort_params)
+    for page in pages:
+        reached_older = False
+        for patient in page["patients"]:
+            if patient.get("lastUpdated") and parse_timestamp(patient["lastUpdated"]) >= since_time:
+                yield patient
+            else:
+                reached_older = True
+        if sort_params and reached_older:
+            pages.close()
+            return
+
+
+def sync_patients(bearer_token, db_path='sample_data.db', since_param=None, sort_params=None, full=False):
+    """
+    Function to copy the patients changed since the last sync into the wmda_patients table.
+
+    Changed records are upserted and committed in batches, so no write transaction
+    is held open while pages are fetched. The high-water mark is only moved forward
+    after the last page has been written, so an interrupted sync is simply repeated
+    from the same point on the next run.
+
+    Args:
+        bearer_token (str): The Bearer token used for authentication.
+        db_path (str): Path of the SQLite database.
+        since_param (str or None): Name of a server-side "updated since" query parameter.
+        sort_params (dict or None): Query parameters sorting the list by lastUpdated, newest first.
+        full (bool): Ignore the stored high-water mark and re-read every patient.
+
+    Returns:
+        dict: The number of 'changed' patients and the new 'high_water_mark'.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_sync_tables(conn)
+        since = None if full else get_high_water_mark(conn)
+        newest = since
+        changed = 0
+        batch = []
+
+        for patient in iter_changed_patients(bearer_token, since, since_param, sort_params):
+            batch.append(patient)
+            updated = patient.get("lastUpdated")
+            if updated and (newest is None or parse_timestamp(updated) > parse_timestamp(newest)):
+                newest = updated
+            if len(batch) >= UPSERT_BATCH_SIZE:
+                upsert_patients(conn, batch)
+                conn.commit()
+                changed += len(batch)
+                batch = []
+
+        upsert_patients(conn, batch)
+        conn.commit()
+        changed += len(batch)
+
+        # Fill empty wmdaIds in person_data from the refreshed mirror, through the writer
+        # thread that every other person_data write goes through
+        get_db_writer(db_path).execute('''
+            UPDATE person_data
+            SET wmdaId = (SELECT w.wmdaId FROM wmda_patients AS w WHERE w.patientId = person_data.DONN_NUMERO)
+            WHERE (wmdaId IS NULL OR wmdaId = '')
+              AND DONN_NUMERO IN (SELECT patientId FROM wmda_patients WHERE wmdaId IS NOT NULL)
+        ''').wait()
+
+        # Only now that every page is stored does the next sync start from the newer mark
+        if newest is not None:
+            set_high_water_mark(conn, newest)
+            conn.commit()
+    finally:
+        conn.close()
+    # Rows cached before the sync would still show the empty wmdaIds it filled in
+    invalidate_person_cache(db_path)
+
+    return {"changed": changed, "high_water_mark": newest}
+
+
+def main(argv=None):
+    """
+    Main function to run an incremental sync of the WMDA patient list into the local database.
+    """
+    parser = argparse.ArgumentParser(description="Sync patients changed since the last run into wmda_patients.")
+    parser.add_argument("--full", action="store_true", help="Ignore the stored high-water mark and re-read every patient")
+    parser.add_argument("--since-param", help="Name of a server-side 'updated since' query parameter, if the API has one")
+    parser.add_argument("--sort-param", action="append", default=[], metavar="KEY=VALUE",
+                        help="Query parameter that sorts the list by lastUpdated, newest first (repeatable)")
+    args = parser.parse_args(argv)
+
+    sort_params = dict(item.split("=", 1) for item in args.sort_param) or None
+
+    bearer_token = get_bearer_token()
+    if not bearer_token:
+        print("Failed to retrieve bearer token.")
+        return
+
+    result = sync_patients(bearer_token, since_param=args.since_param, sort_params=sort_params, full=args.full)
+    print(f"Synced {result['changed']} changed patients. High-water mark: {result['high_water_mark']}")
+    export_metrics()
+
+
+if __name__ == "__main__":
+    load_config()
+    main()
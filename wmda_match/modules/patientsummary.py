@@ -1,69 +1,38 @@
 import os
-import sqlite3
-import requests
+import argparse
 import json
-from dotenv import load_dotenv
-
-# Load environment variables from the .env file
-load_dotenv()
-
-# Retrieve API credentials from environment variables
-TENANT_ID = os.getenv("TENANT_ID")
-RESOURCE_ID = os.getenv("RESOURCE_ID")
-CLIENT_ID = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-USER_AGENT = os.getenv("USER_AGENT")  # Loaded from .env file
-API_URL_SEARCH = "https://sandbox-search-api.wmda.info/api/v2/searches/{searchId}"  # Modified URL with placeholder
-    
-def get_bearer_token():
-    # Construct the token URL
-    token_url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/token"
-    
-    # Set headers and payload for the request
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded',
-        'User-Agent': USER_AGENT
-    }
-    payload = {
-        'grant_type': 'client_credentials',
-        'client_id': CLIENT_ID,
-        'client_secret': CLIENT_SECRET,
-        'resource': RESOURCE_ID
-    }
 
-    # Make the request to get the bearer token
-    response = requests.post(token_url, headers=headers, data=payload)
-
-    # Check the response status
-    if response.status_code == 200:
-        token_data = response.json()
-        return token_data['access_token']
-    else:
-        print("Error getting bearer token:", response.status_code, response.text)
-        return None
+try:
+    from wmda_match.modules.auth import get_bearer_token
+    from wmda_match.modules.wmda_client import get_client, api_url
+    from wmda_match.modules.response_cache import get_response_cache, cached_get
+    from wmda_match.modules.config import load_config
+    from wmda_match.modules.person_repository import get_person_repository
+    from wmda_match.modules.async_client import fetch_search_summaries
+except ImportError:  # Running this file directly from wmda_match/modules
+    from auth import get_bearer_token
+    from wmda_client import get_client, api_url
+    from response_cache import get_response_cache, cached_get
+    from config import load_config
+    from person_repository import get_person_repository
+    from async_client import fetch_search_summaries
+
+API_PATH_SEARCH = "/searches/{searchId}"  # Path with placeholder, appended to the API base URL
 
 # Function to retrieve the SearchID from the database using Patient ID (DONN_NUMERO)
-def get_search_id(patient_id):
-    # Connect to SQLite database
-    conn = sqlite3.connect('sample_data.db')
-    cursor = conn.cursor()
+def get_search_id(patient_id, db_path='sample_data.db'):
+    # Read through the shared repository, which caches rows already read by this process
+    donor = get_person_repository(db_path).get(patient_id)
 
-    # Query to get SearchID based on DONN_NUMERO (Patient ID)
-    cursor.execute("SELECT SearchID FROM person_data WHERE DONN_NUMERO=?", (patient_id,))
-    search_id = cursor.fetchone()
-
-    # Close the connection
-    conn.close()
-
-    if search_id:
-        return search_id[0]
+    if donor:
+        return donor.SearchID
     else:
         print(f"No SearchID found for Patient ID {patient_id}")
         return None
 
 
 # Function to retrieve search summary for a specific searchId
-def get_search_summary(search_id):
+def get_search_summary(search_id, use_cache=True):
 
     # Get Bearer Token
     token = get_bearer_token()
@@ -72,32 +41,60 @@ def get_search_summary(search_id):
         return
 
     # Send a GET request to fetch search summary
-    url = API_URL_SEARCH.format(searchId=search_id)  # Correct formatting of the URL
+    url = api_url(API_PATH_SEARCH.format(searchId=search_id))  # Correct formatting of the URL
     headers = {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json",
-        "User-Agent": USER_AGENT  # Custom User Agent
+        "User-Agent": os.getenv("USER_AGENT")  # Custom User Agent
     }
 
-    response = requests.get(url, headers=headers)
+    # Use the local cache unless it is disabled (--no-cache)
+    cache = get_response_cache() if use_cache else None
+    search_data, response = cached_get(cache, "search_summary", search_id, url, headers, get_client().get)
 
-    if response.status_code == 200:
-        search_data = response.json()
+    if search_data is not None:
         print(f"Search Summary for SearchID: {search_id}")
         print(json.dumps(search_data, indent=4))
     else:
         print(f"Error retrieving search summary: {response.status_code}, Response: {response.text}")
+        return None
+    return search_data
+
+# Function to retrieve the summaries of several patients' searches at once over the async client
+def get_search_summaries(patient_ids, db_path='sample_data.db'):
+    search_ids = {}
+    for patient_id in patient_ids:
+        search_id = get_search_id(patient_id, db_path)
+        if search_id:
+            search_ids[str(search_id)] = patient_id
+
+    summaries = fetch_search_summaries(search_ids)
+    for search_id, summary in summaries.items():
+        print(f"Search Summary for SearchID: {search_id} (Patient ID {search_ids[search_id]})")
+        print(json.dumps(summary, indent=4))
+    return summaries
 
 # Main function to run the script
-def main():
-    patient_id = input("Enter the Patient ID (DONN_NUMERO): ")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the WMDA search summary for one or more patients.")
+    parser.add_argument("patient_ids", nargs="*", help="Patient IDs (DONN_NUMERO); asked for if not given")
+    parser.add_argument("--no-cache", action="store_true", help="Always fetch the summary from the API")
+    args = parser.parse_args(argv)
+
+    # Several patients are fetched concurrently, bypassing the response cache
+    if len(args.patient_ids) > 1:
+        get_search_summaries(args.patient_ids)
+        return
+
+    patient_id = args.patient_ids[0] if args.patient_ids else input("Enter the Patient ID (DONN_NUMERO): ")
 
     # Retrieve SearchID for the given Patient ID
     search_id = get_search_id(patient_id)
 
     if search_id:
         # Retrieve search summary for the found SearchID
-        get_search_summary(search_id)
+        get_search_summary(search_id, use_cache=not args.no_cache)
 
 if __name__ == "__main__":
+    load_config()
     main()
@@ -0,0 +1,8 @@
+try:
+    from wmda_match.modules.allele_dictionary import HLA_COLUMNS
+except ImportError:  # Running this file directly from wmda_match/modules
+    from allele_dictionary import HLA_COLUMNS
+
+# Columns of person_data, in table order. Kept apart from person_loader so that modules
+# reading person_data do not import the loader's optional pyarrow and dateutil dependencies.
+PERSON_COLUMNS = ["DONN_NUMERO", "DOB", "Age", "Ethnic", "Gender"] + HLA_COLUMNS + ["wmdaID", "SearchID"]
@@ -0,0 +1,334 @@
+import os
+import csv
+import sys
+import sqlite3
+import argparse
+from datetime import date
+from functools import lru_cache
+from itertools import islice
+from dateutil import parser as date_parser
+
+try:
+    from wmda_match.modules.allele_dictionary import HLA_COLUMNS, CODE_COLUMNS, normalize_allele, truncate_allele
+    from wmda_match.modules.metrics import timed_db
+    from wmda_match.modules.person_columns import PERSON_COLUMNS
+except ImportError:  # Running this file directly from wmda_match/modules
+    from allele_dictionary import HLA_COLUMNS, CODE_COLUMNS, normalize_allele, truncate_allele
+    from metrics import timed_db
+    from person_columns import PERSON_COLUMNS
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet support is optional
+    pq = None
+
+# Rows sent to SQLite per executemany call
+DEFAULT_CHUNK_SIZE = 5000
+
+# Rows written per transaction; a commit every chunk would spend most of the load syncing the file
+DEFAULT_TRANSACTION_ROWS = 100000
+
+# Distinct typings and dates remembered by the cleaning functions; bounded so memory stays constant
+CLEAN_CACHE_SIZE = 65536
+
+# Rejected rows printed in full before the loader only counts them
+MAX_REPORTED_ERRORS = 20
+
+# File extensions and the delimiter used for each
+DELIMITERS = {".csv": ",", ".tsv": "\t", ".tab": "\t", ".txt": "\t"}
+
+# Header names are matched case-insensitively, e.g. 'donn_numero' or 'WMDAID'
+COLUMN_BY_HEADER = {column.lower(): column for column in PERSON_COLUMNS}
+
+
+def ensure_person_data_table(conn):
+    """
+    Create person_data with the schema from create_table.py if it does not exist yet.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS person_data (
+            DONN_NUMERO INTEGER PRIMARY KEY,
+            DOB TEXT,
+            Age INTEGER,
+            Ethnic TEXT,
+            Gender TEXT,
+            Ax TEXT,
+            Ay TEXT,
+            Bx TEXT,
+            By TEXT,
+            Cx TEXT,
+            Cy TEXT,
+            DRB1x TEXT,
+            DRB1y TEXT,
+            DQB1x TEXT,
+            DQB1y TEXT,
+            wmdaID INTEGER,
+            SearchID INTEGER
+        )
+    ''')
+
+
+def _blank(value):
+    return value is None or str(value).strip() == ""
+
+
+def _to_int(value, column):
+    if _blank(value):
+        return None
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"{column} is not a whole number: {value!r}")
+
+
+@lru_cache(maxsize=CLEAN_CACHE_SIZE)
+def clean_allele(value):
+    """
+    Function to normalize one HLA typing, rejecting values that are not allele fields.
+
+    Extracts repeat the same few thousand typings, so results are cached.
+    """
+    allele = normalize_allele(value)
+    # normalize_allele returns anything that is not allele fields unchanged
+    if allele is not None and truncate_allele(allele, 1) is None:
+        raise ValueError(f"not an HLA typing: {value!r}")
+    return allele
+
+
+@lru_cache(maxsize=CLEAN_CACHE_SIZE)
+def clean_date(value):
+    """
+    Function to turn a date of birth into YYYY-MM-DD, accepting day-first dates such as 28/08/1996.
+    """
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        pass
+    try:
+        return date_parser.parse(value, dayfirst=True).date().isoformat()
+    except (ValueError, OverflowError):
+        raise ValueError(f"DOB is not a date: {value!r}")
+
+
+def clean_record(record):
+    """
+    Function to validate one input row and bring it into the form stored in person_data.
+
+    HLA typings are normalized with normalize_allele, so 'A*1:01:01' is stored as '01:01:01'.
+    Dates of birth are stored as YYYY-MM-DD; day-first dates such as 28/08/1996 are accepted.
+
+    Args:
+        record (dict): Values keyed by person_data column name.
+
+    Returns:
+        dict: The cleaned values for the columns present in the record.
+
+    Raises:
+        ValueError: If the donor number is missing or a value cannot be read.
+    """
+    cleaned = {}
+    for column, value in record.items():
+        if column == "DONN_NUMERO":
+            cleaned[column] = _to_int(value, column)
+            if cleaned[column] is None:
+                raise ValueError("DONN_NUMERO is missing")
+        elif column in ("Age", "wmdaID", "SearchID"):
+            cleaned[column] = _to_int(value, column)
+        elif column == "DOB":
+            cleaned[column] = None if _blank(value) else clean_date(str(value).strip())
+        elif column in HLA_COLUMNS:
+            try:
+                cleaned[column] = clean_allele(value)
+            except ValueError as error:
+                raise ValueError(f"{column} is {error}")
+        else:
+            cleaned[column] = None if _blank(value) else str(value).strip()
+    return cleaned
+
+
+def map_header(header):
+    """
+    Function to match the column names of an input file to person_data columns.
+
+    Returns:
+        list: The person_data column for each input column, or None for columns that are not loaded.
+
+    Raises:
+        ValueError: If there is no DONN_NUMERO column.
+    """
+    columns = [COLUMN_BY_HEADER.get(str(name).strip().lower()) for name in header]
+    if "DONN_NUMERO" not in columns:
+        raise ValueError("The input has no DONN_NUMERO column")
+    return columns
+
+
+def iter_delimited(path, delimiter):
+    """
+    Function to stream the rows of a CSV or TSV file one at a time.
+
+    Yields:
+        tuple: (line number, record keyed by person_data column).
+    """
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        header = next(reader, None)
+        if header is None:
+            return
+        columns = map_header(header)
+        for values in reader:
+            if not any(value.strip() for value in values):
+                continue
+            yield reader.line_num, {column: value for column, value in zip(columns, values) if column}
+
+
+def iter_parquet(path, batch_size=DEFAULT_CHUNK_SIZE):
+    """
+    Function to stream the rows of a Parquet file, one record batch in memory at a time.
+
+    Yields:
+        tuple: (row number, record keyed by person_data column).
+    """
+    if pq is None:
+        raise ImportError("Reading Parquet files requires pyarrow")
+    parquet_file = pq.ParquetFile(path)
+    names = parquet_file.schema_arrow.names
+    columns = map_header(names)
+    wanted = [name for name, column in zip(names, columns) if column]
+    row_number = 0
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=wanted):
+        for row in batch.to_pylist():
+            row_number += 1
+            yield row_number, {COLUMN_BY_HEADER[name.strip().lower()]: value for name, value in row.items()}
+
+
+def iter_records(path, delimiter=None):
+    """
+    Function to stream the rows of an input file, picking the reader from its extension.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".parquet", ".pq"):
+        return iter_parquet(path)
+    if delimiter is None:
+        if extension not in DELIMITERS:
+            raise ValueError(f"Unknown file type {extension!r}; pass a delimiter")
+        delimiter = DELIMITERS[extension]
+    return iter_delimited(path, delimiter)
+
+
+def upsert_sql(columns, code_columns=()):
+    """
+    Build the INSERT ... ON CONFLICT statement for the columns present in the input.
+
+    Columns missing from the input are left as they are on existing rows. When the
+    allele dictionary columns exist, they are cleared on every loaded row so that
+    allele_dictionary.py encodes the new typings on its next run.
+    """
+    updates = [f"{column} = excluded.{column}" for column in columns if column != "DONN_NUMERO"]
+    updates += [f"{column} = NULL" for column in code_columns]
+    conflict = f"DO UPDATE SET {', '.join(updates)}" if updates else "DO NOTHING"
+    return (f"INSERT INTO person_data ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT(DONN_NUMERO) {conflict}")
+
+
+@timed_db("load_person_data")
+def load_person_data(path, db_path='sample_data.db', delimiter=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                     transaction_rows=DEFAULT_TRANSACTION_ROWS):
+    """
+    Function to stream a donor extract into person_data, inserting new donors and updating existing ones.
+
+    Rows are validated and sent to SQLite in executemany chunks of chunk_size, committed
+    every transaction_rows rows, so memory use does not grow with the size of the file.
+    During the load the database runs in WAL mode with synchronous=NORMAL; the previous
+    journal mode is restored at the end.
+
+    Args:
+        path (str): CSV, TSV or Parquet file with a header row.
+        db_path (str): SQLite database to load into.
+        delimiter (str or None): Field delimiter; by default chosen from the file extension.
+        chunk_size (int): Rows per executemany call.
+        transaction_rows (int): Rows per transaction.
+
+    Returns:
+        dict: Counts of 'loaded' and 'rejected' rows.
+    """
+    records = iter_records(path, delimiter)
+
+    conn = sqlite3.connect(db_path)
+    ensure_person_data_table(conn)
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(person_data)")}
+    code_columns = [CODE_COLUMNS[column] for column in HLA_COLUMNS if CODE_COLUMNS[column] in existing]
+
+    previous_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+
+    counts = {"loaded": 0, "rejected": 0}
+    statements = {}
+    since_commit = 0
+    try:
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+
+            # Group the chunk by the columns present, which are the same for every row of a file
+            batches = {}
+            for line, record in chunk:
+                try:
+                    cleaned = clean_record(record)
+                except ValueError as error:
+                    counts["rejected"] += 1
+                    if counts["rejected"] <= MAX_REPORTED_ERRORS:
+                        print(f"Rejected row {line}: {error}")
+                    continue
+                batches.setdefault(tuple(cleaned), []).append(tuple(cleaned.values()))
+
+            for columns, rows in batches.items():
+                if columns not in statements:
+                    statements[columns] = upsert_sql(columns, code_columns)
+                conn.executemany(statements[columns], rows)
+                counts["loaded"] += len(rows)
+                since_commit += len(rows)
+
+            if since_commit >= transaction_rows:
+                conn.commit()
+                since_commit = 0
+        conn.commit()
+    finally:
+        conn.close()
+        # journal_mode is stored in the database file, so put it back for the other scripts
+        conn = sqlite3.connect(db_path)
+        conn.execute(f"PRAGMA journal_mode={previous_mode}")
+        conn.close()
+
+    if counts["rejected"] > MAX_REPORTED_ERRORS:
+        print(f"... {counts['rejected'] - MAX_REPORTED_ERRORS} more rows rejected")
+    return counts
+
+
+def main(argv=None):
+    """
+    Main function to load a donor extract into person_data from the command line.
+    """
+    parser = argparse.ArgumentParser(description="Stream a CSV, TSV or Parquet donor extract into person_data.")
+    parser.add_argument("path", help="File to load; the type is taken from the extension")
+    parser.add_argument("--db", default="sample_data.db", help="SQLite database to load into")
+    parser.add_argument("--delimiter", help="Field delimiter for text files with another extension")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per executemany batch")
+    parser.add_argument("--transaction-rows", type=int, default=DEFAULT_TRANSACTION_ROWS,
+                        help="Rows committed per transaction")
+    args = parser.parse_args(argv)
+
+    try:
+        counts = load_person_data(args.path, db_path=args.db, delimiter=args.delimiter, chunk_size=args.chunk_size,
+                                  transaction_rows=args.transaction_rows)
+    except (ValueError, ImportError, OSError) as error:
+        print(f"Could not load {args.path}: {error}")
+        return 1
+
+    print(f"Loaded {counts['loaded']} rows, rejected {counts['rejected']}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict, namedtuple
+
+try:
+    from wmda_match.modules.person_columns import PERSON_COLUMNS
+    from wmda_match.modules.db_writer import get_db_writer
+    from wmda_match.modules.metrics import get_metrics, timed_db
+except ImportError:  # Running this file directly from wmda_match/modules
+    from person_columns import PERSON_COLUMNS
+    from db_writer import get_db_writer
+    from metrics import get_metrics, timed_db
+
+# One person_data row. It is still a tuple, so donor[15] and donor.wmdaID are the same value.
+Donor = namedtuple("Donor", PERSON_COLUMNS)
+
+# Rows kept in memory per database; the least recently used are dropped first
+DEFAULT_CACHE_SIZE = 10000
+
+# Seconds a cached row is used before it is read again. Writes made through this
+# module are seen at once; this bounds how long a change made by another process
+# (e.g. person_loader.py or update_wmda_ID.py run separately) can go unnoticed.
+DEFAULT_TTL = 60.0
+
+# The statements are fixed strings, so the connection's statement cache prepares each once
+SELECT_DONOR = f"SELECT {', '.join(PERSON_COLUMNS)} FROM person_data WHERE DONN_NUMERO = ?"
+SELECT_REGISTERED = (f"SELECT {', '.join(PERSON_COLUMNS)} FROM person_data "
+                     "WHERE wmdaID IS NOT NULL AND wmdaID != '' ORDER BY DONN_NUMERO")
+
+
+def _key(donor_id):
+    return str(donor_id).strip()
+
+
+class PersonRepository:
+    """
+    Read-through access to person_data with a bounded LRU cache of rows.
+
+    Rows are read with prepared statements over one long-lived connection and
+    returned as Donor records. Each row is cached by DONN_NUMERO, so a batch that
+    reads the same donor for its create, its search and its summary only queries
+    SQLite once. Writes to person_data made through this class go through the
+    shared DB writer thread and drop the rows they change from the cache; other
+    writers in the same process should call invalidate(). Donors that are not
+    found are not cached, so a row loaded later is picked up straight away.
+
+    Args:
+        db_path (str): Path of the SQLite database.
+        cache_size (int): Maximum number of rows kept in memory.
+        ttl (float): Seconds a cached row is used before it is read again.
+    """
+
+    def __init__(self, db_path='sample_data.db', cache_size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_TTL):
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+
+    def _cached(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        donor, loaded_at = entry
+        if time.monotonic() - loaded_at > self.ttl:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return donor
+
+    def _store(self, key, donor):
+        self._cache[key] = (donor, time.monotonic())
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def get(self, donor_id, fresh=False):
+        """
+        Return one donor, from the cache when possible.
+
+        Args:
+            donor_id (str): The DONN_NUMERO to look up.
+            fresh (bool): Always read the row from SQLite, then cache it. Used where a
+                stale row could cost a duplicate create or an outdated update.
+
+        Returns:
+            Donor or None: The row, or None if there is no donor with this DONN_NUMERO.
+        """
+        key = _key(donor_id)
+        metrics = get_metrics()
+        with self._lock:
+            donor = None if fresh else self._cached(key)
+            if donor is not None:
+                metrics.inc("wmda_person_cache_total", {"result": "hit"})
+                return donor
+            metrics.inc("wmda_person_cache_total", {"result": "refresh" if fresh else "miss"})
+            with metrics.track_db("person_lookup"):
+                row = self._conn.execute(SELECT_DONOR, (donor_id,)).fetchone()
+            if row is None:
+                self._cache.pop(key, None)
+                return None
+            donor = Donor._make(row)
+            self._store(key, donor)
+            return donor
+
+    def get_many(self, donor_ids, fresh=False):
+        """
+        Return several donors, reading only the ones that are not cached unless fresh is set.
+
+        Returns:
+            dict: Donor records keyed by the donor ID as a string. Missing donors are left out.
+        """
+        donors = {}
+        for donor_id in donor_ids:
+            donor = self.get(donor_id, fresh)
+            if donor is not None:
+                donors[_key(donor_id)] = donor
+        return donors
+
+    def get_wmda_id(self, donor_id):
+        donor = self.get(donor_id)
+        return donor.wmdaID if donor else None
+
+    def get_search_id(self, donor_id):
+        donor = self.get(donor_id)
+        return donor.SearchID if donor else None
+
+    @timed_db("registered_donors")
+    def registered_donors(self):
+        """
+        Return every donor that has a wmdaID, in DONN_NUMERO order.
+
+        This reads the whole table, so the rows are not added to the cache. The scan
+        uses a connection of its own rather than the shared one, so lookups made by
+        other threads do not wait for it.
+
+        Returns:
+            list: Donor records.
+        """
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            return [Donor._make(row) for row in conn.execute(SELECT_REGISTERED)]
+        finally:
+            conn.close()
+
+    def set_wmda_ids(self, pairs, only_empty=False):
+        """
+        Store wmdaIds in one transaction and drop the changed rows from the cache.
+
+        Args:
+            pairs (list): (DONN_NUMERO, wmdaId) tuples to write.
+            only_empty (bool): Leave donors whose wmdaID is already set unchanged.
+
+        Returns:
+            int: The number of rows changed.
+        """
+        pairs = list(pairs)
+        if not pairs:
+            return 0
+        sql = "UPDATE person_data SET wmdaID = ? WHERE DONN_NUMERO = ?"
+        if only_empty:
+            # Checked in the same statement so no other write can slip in between
+            sql += " AND (wmdaID IS NULL OR wmdaID = '')"
+        ticket = get_db_writer(self.db_path).executemany(sql, [(wmda_id, donor_id) for donor_id, wmda_id in pairs])
+        try:
+            ticket.wait()
+        finally:
+            self.invalidate(donor_id for donor_id, _ in pairs)
+        return ticket.rowcount or 0
+
+    def set_search_id(self, donor_id, search_id):
+        """
+        Store the SearchID of one donor and drop the row from the cache.
+
+        Returns:
+            int: The number of rows changed.
+        """
+        ticket = get_db_writer(self.db_path).execute("UPDATE person_data SET SearchID = ? WHERE DONN_NUMERO = ?",
+                                                     (search_id, donor_id))
+        try:
+            ticket.wait()
+        finally:
+            self.invalidate([donor_id])
+        return ticket.rowcount or 0
+
+    def invalidate(self, donor_ids=None):
+        """
+        Drop rows from the cache so they are read again, or every row if donor_ids is None.
+        """
+        with self._lock:
+            if donor_ids is None:
+                self._cache.clear()
+                return
+            for donor_id in donor_ids:
+                self._cache.pop(_key(donor_id), None)
+
+    def close(self):
+        with self._lock:
+            self._cache.clear()
+            self._conn.close()
+
+
+# One repository per database file, shared by every thread of the process
+_repositories = {}
+_repositories_lock = threading.Lock()
+
+
+def get_person_repository(db_path='sample_data.db'):
+    """
+    Function to return the shared repository for a database, opening it if needed.
+
+    Returns:
+        PersonRepository: The repository for db_path.
+    """
+    key = os.path.abspath(db_path)
+    with _repositories_lock:
+        repository = _repositories.get(key)
+        if repository is None:
+            repository = _repositories[key] = PersonRepository(db_path)
+        return repository
+
+
+def invalidate_person_cache(db_path='sample_data.db', donor_ids=None):
+    """
+    Function to drop cached rows after person_data was written outside the repository.
+
+    Does nothing if no repository is open for db_path.
+    """
+    with _repositories_lock:
+        repository = _repositories.get(os.path.abspath(db_path))
+    if repository is not None:
+        repository.invalidate(donor_ids)
+
+
+def close_person_repositories(db_path=None):
+    """
+    Function to close the shared repositories and their connections.
+
+    Args:
+        db_path (str or None): Only close the repository of this database; every repository if None.
+    """
+    with _repositories_lock:
+        if db_path is None:
+            repositories = list(_repositories.values())
+            _repositories.clear()
+        else:
+            repository = _repositories.pop(os.path.abspath(db_path), None)
+            repositories = [repository] if repository is not None else []
+    for repository in repositories:
+        repository.close()
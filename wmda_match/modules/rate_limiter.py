@@ -0,0 +1,222 @@
+import os
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+# Requests per second the token bucket allows, and how many may be sent back to back.
+# The bucket is off by default: the AIMD limit and Retry-After pauses already back off
+# when the API pushes back, so a fixed rate is only an opt-in ceiling.
+DEFAULT_RATE = 0
+DEFAULT_BURST = 20
+
+# Concurrency limits for the AIMD controller
+DEFAULT_INITIAL_CONCURRENCY = 4
+DEFAULT_MAX_CONCURRENCY = 32
+
+# A smoothed latency this many times the fastest one seen counts as congestion
+LATENCY_TOLERANCE = 3.0
+
+# Weight of the newest sample in the smoothed latency
+LATENCY_SMOOTHING = 0.1
+
+# Shortest time between two multiplicative decreases, so one burst of 429s halves the limit only once
+DECREASE_INTERVAL = 1.0
+
+# Statuses that mean the API is overloaded or asked us to slow down
+THROTTLE_STATUSES = {429, 503}
+
+
+def retry_after_seconds(response):
+    """
+    Function to read the Retry-After header of a response.
+
+    Returns:
+        float or None: Seconds to wait, or None if the header is missing or unreadable.
+    """
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("Retry-After") if hasattr(headers, "get") else None
+    if not isinstance(value, str) or not value.strip():
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        # HTTP-date form, e.g. "Wed, 21 Oct 2026 07:28:00 GMT"
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base_delay=0.5, max_delay=30.0):
+    """
+    Function to work out how long to wait before retry number attempt (starting at 0).
+
+    The delay doubles every attempt up to max_delay, with full jitter so that many
+    workers retrying together do not hit the API again at the same moment.
+    """
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+class RateLimiter:
+    """
+    Shared limiter that every outbound WMDA call goes through.
+
+    Three things decide when a request may start:
+
+    - an optional token bucket caps the request rate at `rate` per second, allowing bursts of `burst`;
+    - a pause set from a Retry-After header holds back every request until it ends;
+    - an AIMD concurrency limit caps the number of requests in flight. It grows by
+      one for every `limit` successful responses and halves on a 429/503 or when the
+      smoothed latency rises well above the fastest seen, at most once per DECREASE_INTERVAL.
+
+    Args:
+        rate (float): Requests per second; None or 0 disables the token bucket.
+        burst (int): Size of the token bucket.
+        initial_concurrency (int): Concurrency limit to start from.
+        min_concurrency (int): Lowest concurrency limit.
+        max_concurrency (int): Highest concurrency limit.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, initial_concurrency=DEFAULT_INITIAL_CONCURRENCY,
+                 min_concurrency=1, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.rate = rate
+        self.burst = burst
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.limit = float(min(max(initial_concurrency, min_concurrency), max_concurrency))
+
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._min_latency = None
+        self._smoothed_latency = None
+
+    def acquire(self):
+        """
+        Block until a request may be sent, then count it as in flight.
+        """
+        with self._condition:
+            while True:
+                wait_for = self._admit(time.monotonic())
+                if wait_for == 0:
+                    return
+                # None waits until another request is released
+                self._condition.wait(wait_for)
+
+    def try_acquire(self):
+        """
+        Count a request as in flight if it may be sent now, without blocking.
+
+        Used by asyncio callers, which must not block the event loop while they wait.
+
+        Returns:
+            float or None: 0 if the request may be sent, the seconds to wait before
+            trying again, or None if it has to wait for another request to finish.
+        """
+        with self._condition:
+            return self._admit(time.monotonic())
+
+    def _admit(self, now):
+        # Returns 0 once the request is counted as in flight, else how long to wait (None: until a release)
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._in_flight >= int(self.limit):
+            return None
+        wait_for = self._take_token(now)
+        if wait_for > 0:
+            return wait_for
+        self._in_flight += 1
+        return 0
+
+    def _take_token(self, now):
+        # Returns 0 when a token was taken, else the time until the next one is available
+        if not self.rate:
+            return 0
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def release(self, status_code=None, latency=None):
+        """
+        Mark a request as finished and feed its outcome to the AIMD controller.
+
+        Args:
+            status_code (int or None): Status of the response, or None if the request failed.
+            latency (float or None): Time the request took in seconds.
+        """
+        with self._condition:
+            self._in_flight -= 1
+            now = time.monotonic()
+
+            congested = status_code in THROTTLE_STATUSES
+            if latency is not None and status_code is not None and status_code < 400:
+                if self._min_latency is None or latency < self._min_latency:
+                    self._min_latency = latency
+                if self._smoothed_latency is None:
+                    self._smoothed_latency = latency
+                else:
+                    self._smoothed_latency += LATENCY_SMOOTHING * (latency - self._smoothed_latency)
+                congested = congested or self._smoothed_latency > self._min_latency * LATENCY_TOLERANCE
+
+            if congested:
+                if now - self._last_decrease >= DECREASE_INTERVAL:
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self._last_decrease = now
+            elif status_code is not None and status_code < 400:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+            self._condition.notify_all()
+
+    def start_concurrency(self, workers):
+        """
+        Raise the concurrency limit to the number of workers about to send requests.
+
+        Without this a run started with more workers than DEFAULT_INITIAL_CONCURRENCY
+        would keep the extra workers waiting until the AIMD controller caught up. The
+        limit is never raised past max_concurrency, nor once the API has pushed back.
+
+        Args:
+            workers (int): Number of threads that will send requests at once.
+        """
+        with self._condition:
+            if self._last_decrease == 0.0 and workers > self.limit:
+                self.limit = float(min(workers, self.max_concurrency))
+                self._condition.notify_all()
+
+    def pause(self, seconds):
+        """
+        Hold back every request for the given number of seconds, e.g. from a Retry-After header.
+        """
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._condition.notify_all()
+
+
+# Shared limiter used by the scripts in this package
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    Return the process-wide RateLimiter, creating it on first use.
+
+    WMDA_RATE sets a ceiling in requests per second (unset or 0 leaves the token
+    bucket off) and WMDA_MAX_CONCURRENCY the highest concurrency limit.
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(
+                rate=float(os.getenv("WMDA_RATE", DEFAULT_RATE)),
+                max_concurrency=int(os.getenv("WMDA_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)),
+            )
+        return _limiter
@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import namedtuple
+
+try:
+    from wmda_match.modules.metrics import timed_db
+    from wmda_match.modules.db_writer import get_db_writer
+except ImportError:  # Running this file directly from wmda_match/modules
+    from metrics import timed_db
+    from db_writer import get_db_writer
+
+# How long, in seconds, a cached response is used without asking the API again
+DEFAULT_TTLS = {
+    "search_summary": 300,
+    "patient_searches": 900,
+}
+
+# Total size of cached response bodies before the least recently used are evicted
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+# Cached endpoints whose responses describe one patient, keyed by its wmdaId
+PATIENT_ENDPOINTS = ("patient_searches",)
+
+# A cached response: the parsed JSON body, its ETag, and whether it is still within its TTL
+CacheEntry = namedtuple("CacheEntry", ["data", "etag", "fresh"])
+
+
+def ensure_cache_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS api_cache (
+            endpoint TEXT NOT NULL,
+            cache_key TEXT NOT NULL,
+            body TEXT NOT NULL,
+            etag TEXT,
+            fetched_at REAL NOT NULL,
+            last_access REAL NOT NULL,
+            size INTEGER NOT NULL,
+            PRIMARY KEY (endpoint, cache_key)
+        )
+    ''')
+
+
+class ResponseCache:
+    """
+    SQLite-backed cache of API responses, stored in the api_cache table.
+
+    Entries are keyed by endpoint name and id (e.g. a searchId or wmdaId). Each
+    endpoint has its own time-to-live; once an entry is stale it can be revalidated
+    with its ETag instead of being downloaded again. When the cached bodies grow
+    past max_bytes the least recently used entries are removed. Writes go through
+    the shared DB writer thread; a lookup only queues its last_access update, so
+    reading the cache never waits for a write transaction.
+
+    Args:
+        db_path (str): Path of the SQLite database holding the api_cache table.
+        ttls (dict or None): Seconds to live per endpoint name; defaults to DEFAULT_TTLS.
+        max_bytes (int): Maximum total size of the cached bodies.
+    """
+
+    def __init__(self, db_path='sample_data.db', ttls=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.db_path = db_path
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_bytes = max_bytes
+        conn = self._connect()
+        ensure_cache_table(conn)
+        conn.commit()
+        conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @timed_db("cache_lookup")
+    def lookup(self, endpoint, key):
+        """
+        Return the cached entry for an endpoint and key, marking it as recently used.
+
+        Returns:
+            CacheEntry or None: The entry, or None if nothing is cached.
+        """
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT body, etag, fetched_at FROM api_cache WHERE endpoint = ? AND cache_key = ?",
+            (endpoint, str(key))
+        ).fetchone()
+        if row is None:
+            conn.close()
+            return None
+
+        conn.close()
+
+        # Not waited for: the writer commits it with the next batch, ahead of any later eviction
+        now = time.time()
+        get_db_writer(self.db_path).execute("UPDATE api_cache SET last_access = ? WHERE endpoint = ? AND cache_key = ?",
+                                            (now, endpoint, str(key)))
+
+        body, etag, fetched_at = row
+        fresh = now - fetched_at < self.ttls.get(endpoint, 0)
+        return CacheEntry(json.loads(body), etag, fresh)
+
+    @timed_db("cache_store")
+    def store(self, endpoint, key, data, etag=None):
+        """
+        Cache a response body, then evict old entries if the cache is over its size limit.
+        """
+        body = json.dumps(data)
+        now = time.time()
+        row = (endpoint, str(key), body, etag if isinstance(etag, str) else None, now, now, len(body))
+
+        def write(conn):
+            conn.execute('''
+                INSERT OR REPLACE INTO api_cache (endpoint, cache_key, body, etag, fetched_at, last_access, size)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', row)
+            self._evict(conn)
+
+        get_db_writer(self.db_path).submit(write).wait()
+
+    @timed_db("cache_revalidate")
+    def revalidate(self, endpoint, key):
+        """
+        Restart the TTL of an entry after the API confirmed it is unchanged (304 Not Modified).
+        """
+        now = time.time()
+        get_db_writer(self.db_path).execute(
+            "UPDATE api_cache SET fetched_at = ?, last_access = ? WHERE endpoint = ? AND cache_key = ?",
+            (now, now, endpoint, str(key))
+        ).wait()
+
+    @timed_db("cache_invalidate")
+    def invalidate(self, endpoint, key):
+        """
+        Drop one entry, e.g. after a write to the API made the cached response out of date.
+        """
+        self.invalidate_many(endpoint, [key])
+
+    @timed_db("cache_invalidate")
+    def invalidate_many(self, endpoint, keys):
+        """
+        Drop the entries of several keys of one endpoint in a single write.
+        """
+        keys = [(endpoint, str(key)) for key in keys]
+        if keys:
+            get_db_writer(self.db_path).executemany("DELETE FROM api_cache WHERE endpoint = ? AND cache_key = ?",
+                                                    keys).wait()
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM api_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # Walk from least to most recently used until enough space has been freed
+        to_delete = []
+        for endpoint, cache_key, size in conn.execute(
+                "SELECT endpoint, cache_key, size FROM api_cache ORDER BY last_access"):
+            if total <= self.max_bytes:
+                break
+            to_delete.append((endpoint, cache_key))
+            total -= size
+        conn.executemany("DELETE FROM api_cache WHERE endpoint = ? AND cache_key = ?", to_delete)
+
+
+def cached_get(cache, endpoint, key, url, headers, http_get):
+    """
+    Function to GET a JSON resource through the cache.
+
+    A fresh entry is returned without any request. A stale entry with an ETag is
+    revalidated with If-None-Match, and a 304 reply reuses the cached body.
+
+    Args:
+        cache (ResponseCache or None): The cache to use, or None to always call the API.
+        endpoint (str): Endpoint name used for the TTL and the cache key, e.g. "search_summary".
+        key (str): Id of the resource, e.g. the searchId.
+        url (str): URL to request.
+        headers (dict): Request headers.
+        http_get (callable): Function sending the GET request, e.g. get_client().get.
+
+    Returns:
+        tuple: (data, response). data is the parsed JSON or None if the request failed;
+        response is None when the data was served from the cache without a request.
+    """
+    entry = cache.lookup(endpoint, key) if cache is not None else None
+    if entry is not None and entry.fresh:
+        return entry.data, None
+
+    if entry is not None and entry.etag:
+        headers = dict(headers, **{"If-None-Match": entry.etag})
+
+    response = http_get(url, headers=headers)
+
+    if response.status_code == 304 and entry is not None:
+        cache.revalidate(endpoint, key)
+        return entry.data, response
+    if response.status_code == 200:
+        data = response.json()
+        if cache is not None:
+            cache.store(endpoint, key, data, response.headers.get("ETag"))
+        return data, response
+    return None, response
+
+
+# Shared cache used by the scripts in this package
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Return the process-wide ResponseCache, creating it on first use.
+
+    The cache lives in sample_data.db unless WMDA_CACHE_DB points at another file.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(db_path=os.getenv("WMDA_CACHE_DB", "sample_data.db"))
+        return _cache
+
+
+def set_response_cache(cache):
+    """
+    Function to replace the shared ResponseCache, e.g. with one kept in another database.
+
+    Args:
+        cache (ResponseCache or None): The new shared cache; None opens the default one on next use.
+
+    Returns:
+        ResponseCache or None: The cache it replaced.
+    """
+    global _cache
+    with _cache_lock:
+        previous, _cache = _cache, cache
+        return previous
+
+
+def invalidate_cached(endpoint, keys):
+    """
+    Function to drop cached responses after the resources changed on the WMDA.
+
+    Nothing is done if the cache database does not exist, since nothing can be cached there.
+
+    Args:
+        endpoint (str): Endpoint name, e.g. "patient_searches".
+        keys (list): Ids of the changed resources.
+    """
+    if _cache is None and not os.path.exists(os.getenv("WMDA_CACHE_DB", "sample_data.db")):
+        return
+    get_response_cache().invalidate_many(endpoint, keys)
+
+
+def invalidate_patients(wmda_ids):
+    """
+    Function to drop every cached response about the given patients after they were created or updated.
+    """
+    wmda_ids = [wmda_id for wmda_id in wmda_ids if wmda_id not in (None, "")]
+    if wmda_ids:
+        for endpoint in PATIENT_ENDPOINTS:
+            invalidate_cached(endpoint, wmda_ids)
@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    from wmda_match.modules.auth import get_bearer_token
+    from wmda_match.modules.wmda_client import get_client, api_url
+    from wmda_match.modules.metrics import timed_db, export_metrics
+    from wmda_match.modules.config import load_config
+    from wmda_match.modules.db_writer import get_db_writer
+    from wmda_match.modules.rate_limiter import get_rate_limiter
+except ImportError:  # Running this file directly from wmda_match/modules
+    from auth import get_bearer_token
+    from wmda_client import get_client, api_url
+    from metrics import timed_db, export_metrics
+    from config import load_config
+    from db_writer import get_db_writer
+    from rate_limiter import get_rate_limiter
+
+API_PATH_SEARCH = "/searches/{searchId}"
+
+# Search statuses after which the summary will not change any more
+TERMINAL_STATUSES = {"COMPLETED", "COMPLETE", "FINISHED", "DONE", "FAILED", "CANCELLED", "CANCELED", "CLOSED"}
+
+# Polling delays in seconds: the first retry waits BASE_DELAY, doubling up to MAX_DELAY
+BASE_DELAY = 30
+MAX_DELAY = 30 * 60
+
+# Number of summaries requested at the same time
+DEFAULT_WORKERS = 8
+
+# Searches without a final summary. COALESCE(SearchID, '') != '' is written exactly as in
+# the WHERE clause of idx_person_data_open_searches, so SQLite reads that index in order.
+OUTSTANDING_SEARCHES_SQL = '''
+    SELECT SearchID, DONN_NUMERO FROM person_data
+    WHERE COALESCE(SearchID, '') != ''
+      AND CAST(SearchID AS TEXT) NOT IN (SELECT search_id FROM search_results)
+    ORDER BY DONN_NUMERO
+'''
+
+
+def ensure_results_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS search_results (
+            search_id TEXT PRIMARY KEY,
+            donor_id TEXT,
+            status TEXT,
+            summary TEXT,
+            completed_at REAL
+        )
+    ''')
+
+
+@timed_db("get_outstanding_searches")
+def get_outstanding_searches(db_path='sample_data.db'):
+    """
+    Function to list the searches in person_data that do not have a final summary yet.
+
+    Returns:
+        dict: Donor IDs keyed by SearchID. A search shared by several donors is listed once.
+    """
+    conn = sqlite3.connect(db_path)
+    ensure_results_table(conn)
+    rows = conn.execute(OUTSTANDING_SEARCHES_SQL).fetchall()
+    conn.commit()
+    conn.close()
+
+    searches = {}
+    for search_id, donor_id in rows:
+        searches.setdefault(str(search_id), []).append(str(donor_id))
+    return searches
+
+
+def get_search_status(summary):
+    """
+    Function to read the status of a search from its summary.
+
+    Returns:
+        str or None: The upper-cased status, or None if the summary has none.
+    """
+    if not isinstance(summary, dict):
+        return None
+    status = summary.get("status") or summary.get("searchStatus")
+    return str(status).upper() if status else None
+
+
+def is_search_complete(summary):
+    return get_search_status(summary) in TERMINAL_STATUSES
+
+
+@timed_db("save_search_result")
+def save_search_result(search_id, donor_ids, summary, db_path='sample_data.db'):
+    """
+    Function to store the final summary of a finished search.
+    """
+    row = (str(search_id), ",".join(donor_ids), get_search_status(summary), json.dumps(summary), time.time())
+
+    def write(conn):
+        ensure_results_table(conn)
+        conn.execute('''
+            INSERT OR REPLACE INTO search_results (search_id, donor_id, status, summary, completed_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', row)
+
+    get_db_writer(db_path).submit(write).wait()
+
+
+def fetch_search_summary(search_id):
+    """
+    Function to fetch the current summary of a search from the API.
+
+    Returns:
+        dict or None: The parsed summary, or None if it could not be retrieved.
+    """
+    token = get_bearer_token()
+    if not token:
+        return None
+
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json",
+        "User-Agent": os.getenv("USER_AGENT")
+    }
+    response = get_client().get(api_url(API_PATH_SEARCH.format(searchId=search_id)), headers=headers)
+    if response.status_code == 200:
+        return response.json()
+    print(f"Error retrieving search summary for {search_id}: {response.status_code}")
+    return None
+
+
+def next_delay(attempt, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+    """
+    Function to work out how long to wait before polling a search again.
+
+    The delay doubles with every attempt up to max_delay, and "full jitter" picks a
+    random point below it so that many searches started together do not keep
+    polling in lockstep.
+    """
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def poll_searches(searches=None, db_path='sample_data.db', max_workers=DEFAULT_WORKERS, base_delay=BASE_DELAY,
+                  max_delay=MAX_DELAY, timeout=None, fetch=fetch_search_summary):
+    """
+    Function to watch outstanding searches until they finish, storing each final summary.
+
+    Each search is polled on its own backoff schedule, and a search is never
+    requested again while a previous request for it is still in flight.
+
+    Args:
+        searches (dict or None): Donor IDs keyed by SearchID; defaults to every outstanding search.
+        db_path (str): Path of the SQLite database.
+        max_workers (int): Maximum number of summary requests in flight.
+        base_delay (float): Delay before the first re-poll of a running search.
+        max_delay (float): Longest delay between two polls of the same search.
+        timeout (float or None): Stop after this many seconds even if searches are still running.
+        fetch (callable): Function returning the summary of a search ID.
+
+    Returns:
+        dict: The final summaries keyed by SearchID for the searches that finished.
+    """
+    if searches is None:
+        searches = get_outstanding_searches(db_path)
+
+    start = time.monotonic()
+    next_poll = {search_id: start for search_id in searches}  # Poll every search once straight away
+    attempts = {search_id: 0 for search_id in searches}
+    completed = {}
+    in_flight = {}
+
+    get_rate_limiter().start_concurrency(max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while next_poll or in_flight:
+            now = time.monotonic()
+            if timeout is not None and now - start >= timeout:
+                break
+
+            # Submit every search that is due and not already being fetched
+            for search_id in [s for s, due in next_poll.items() if due <= now]:
+                del next_poll[search_id]
+                in_flight[executor.submit(fetch, search_id)] = search_id
+
+            # Sleep until a request finishes or the next search is due, but not past the timeout
+            wait_for = min(next_poll.values(), default=now + 1) - now
+            if timeout is not None:
+                wait_for = min(wait_for, start + timeout - now)
+            if in_flight:
+                done, _ = wait(list(in_flight), timeout=max(wait_for, 0), return_when=FIRST_COMPLETED)
+            else:
+                done = set()
+                time.sleep(max(wait_for, 0))
+
+            for future in done:
+                search_id = in_flight.pop(future)
+                summary = future.result() if future.exception() is None else None
+                if summary is not None and is_search_complete(summary):
+                    save_search_result(search_id, searches[search_id], summary, db_path)
+                    completed[search_id] = summary
+                    print(f"Search {search_id} finished with status {get_search_status(summary)}")
+                else:
+                    next_poll[search_id] = time.monotonic() + next_delay(attempts[search_id], base_delay, max_delay)
+                    attempts[search_id] += 1
+
+    return completed
+
+
+def main(argv=None):
+    """
+    Main function to poll every outstanding search in person_data until it finishes.
+    """
+    parser = argparse.ArgumentParser(description="Wait for outstanding WMDA searches and store their summaries.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Number of concurrent requests (at most WMDA_MAX_CONCURRENCY)")
+    parser.add_argument("--timeout", type=float, help="Stop after this many seconds")
+    args = parser.parse_args(argv)
+
+    searches = get_outstanding_searches()
+    print(f"Watching {len(searches)} outstanding searches")
+    completed = poll_searches(searches, max_workers=args.workers, timeout=args.timeout)
+    print(f"{len(completed)} searches finished, {len(searches) - len(completed)} still running")
+    export_metrics()
+
+
+if __name__ == "__main__":
+    load_config()
+    main()
@@ -1,54 +1,41 @@
 import os
+import time
 import sqlite3
-import requests
+import hashlib
+import argparse
 import json
-from dotenv import load_dotenv
-
-# Load environment variables from the .env file
-load_dotenv()
-
-# Retrieve API credentials from environment variables
-TENANT_ID = os.getenv("TENANT_ID")
-RESOURCE_ID = os.getenv("RESOURCE_ID")
-CLIENT_ID = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-USER_AGENT = os.getenv("USER_AGENT")  # Loaded from .env file
-API_URL = "https://sandbox-search-api.wmda.info/api/v2/patients"
-
-def get_bearer_token():
-    # Construct the token URL
-    token_url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/token"
-    
-    # Set headers and payload for the request
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded',
-        'User-Agent': USER_AGENT
-    }
-    payload = {
-        'grant_type': 'client_credentials',
-        'client_id': CLIENT_ID,
-        'client_secret': CLIENT_SECRET,
-        'resource': RESOURCE_ID
-    }
 
-    # Make the request to get the bearer token
-    response = requests.post(token_url, headers=headers, data=payload)
+try:
+    from wmda_match.modules.auth import get_bearer_token
+    from wmda_match.modules.wmda_client import get_client, api_url
+    from wmda_match.modules.allele_dictionary import normalize_allele
+    from wmda_match.modules.create_patient import read_donor_ids
+    from wmda_match.modules.metrics import timed_db, export_metrics
+    from wmda_match.modules.config import load_config
+    from wmda_match.modules.db_writer import get_db_writer
+    from wmda_match.modules.person_repository import get_person_repository
+    from wmda_match.modules.response_cache import invalidate_patients
+    from wmda_match.modules.bulk_journal import BulkJournal, run_in_pool, DONE, FAILED, SKIPPED, FINISHED_STATES
+except ImportError:  # Running this file directly from wmda_match/modules
+    from auth import get_bearer_token
+    from wmda_client import get_client, api_url
+    from allele_dictionary import normalize_allele
+    from create_patient import read_donor_ids
+    from metrics import timed_db, export_metrics
+    from config import load_config
+    from db_writer import get_db_writer
+    from person_repository import get_person_repository
+    from response_cache import invalidate_patients
+    from bulk_journal import BulkJournal, run_in_pool, DONE, FAILED, SKIPPED, FINISHED_STATES
 
-    # Check the response status
-    if response.status_code == 200:
-        token_data = response.json()
-        return token_data['access_token']
-    else:
-        print("Error getting bearer token:", response.status_code, response.text)
-        return None
-    
-# Function to fetch existing patient details from SQLite database using donor ID
-def get_existing_patient_data(donor_id):
-    conn = sqlite3.connect('sample_data.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM person_data WHERE DONN_NUMERO = ?", (donor_id,))
-    donor = cursor.fetchone()
-    conn.close()
+API_PATH = "/patients"
+
+# Number of update requests sent at once in bulk mode
+DEFAULT_WORKERS = 8
+
+# Function to fetch existing patient details from SQLite database using donor ID, through the cached repository
+def get_existing_patient_data(donor_id, db_path='sample_data.db', fresh=False):
+    donor = get_person_repository(db_path).get(donor_id, fresh)
 
     if donor:
         return donor
@@ -56,39 +43,175 @@ def get_existing_patient_data(donor_id):
         print("Donor ID not found.")
         return None
 
-# Function to update an existing patient on WMDA
-def update_patient(donor):
-    
-    # Extracting the data from the donor
-    patient_data = {
-        "wmdaId": (donor[15]),
-        "patientId": str(donor[0]),
+# Function to build the WMDA update payload from a donor row
+def build_update_data(donor):
+    return {
+        "wmdaId": donor.wmdaID,
+        "patientId": str(donor.DONN_NUMERO),
         "hla": {
-            "a": {"field1": donor[5], "field2": donor[6]},
-            "b": {"field1": donor[7], "field2": donor[8]},
-            "c": {"field1": donor[9], "field2": donor[10]},
-            "drb1": {"field1": donor[11], "field2": donor[12]},
-            "dqb1": {"field1": donor[13], "field2": donor[14]}
+            "a": {"field1": normalize_allele(donor.Ax), "field2": normalize_allele(donor.Ay)},
+            "b": {"field1": normalize_allele(donor.Bx), "field2": normalize_allele(donor.By)},
+            "c": {"field1": normalize_allele(donor.Cx), "field2": normalize_allele(donor.Cy)},
+            "drb1": {"field1": normalize_allele(donor.DRB1x), "field2": normalize_allele(donor.DRB1y)},
+            "dqb1": {"field1": normalize_allele(donor.DQB1x), "field2": normalize_allele(donor.DQB1y)}
         },
         "idm": {
             "cmvStatus": "P"  # Placeholder; adjust as necessary
         },
-        "dateOfBirth": donor[1],
+        "dateOfBirth": donor.DOB,
         "diagnosis": {
             "diagnosisCode": "ALL",  # Placeholder; adjust as necessary
             "diagnosisText": "acute myeloid leukaemia",  # Placeholder; adjust as necessary
             "diagnosisDate": "2025-01-28"  # Placeholder; adjust as necessary
         },
         "diseasePhase": "PF",  # Placeholder; adjust as necessary
-        "ethnicity": donor[3],
+        "ethnicity": donor.Ethnic,
         "poolCountryCode": "NL",  # Placeholder; adjust as necessary
         "transplantCentreId": "TC X",  # Placeholder; adjust as necessary
         "abo": "A",  # Placeholder; adjust as necessary
         "rhesus": "P",  # Placeholder; adjust as necessary
         "weight": 76,  # Placeholder; adjust as necessary
-        "sex": donor[4],
+        "sex": donor.Gender,
         "legalTerms": True  # Placeholder; adjust as necessary
     }
+
+# Function to fingerprint a payload; key order and whitespace do not change the hash
+def payload_hash(patient_data):
+    canonical = json.dumps(patient_data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def ensure_payload_hashes_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS payload_hashes (
+            DONN_NUMERO INTEGER PRIMARY KEY,
+            payload_hash TEXT NOT NULL,
+            sent_at REAL NOT NULL,
+            payload TEXT
+        )
+    ''')
+    # Tables created before the last sent document was kept have no payload column
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(payload_hashes)")}
+    if "payload" not in columns:
+        conn.execute("ALTER TABLE payload_hashes ADD COLUMN payload TEXT")
+
+# Function to read the hash of the last payload sent for each donor
+@timed_db("get_payload_hashes")
+def get_payload_hashes(db_path='sample_data.db'):
+    conn = sqlite3.connect(db_path)
+    ensure_payload_hashes_table(conn)
+    hashes = {str(donor_id): value for donor_id, value in conn.execute("SELECT DONN_NUMERO, payload_hash FROM payload_hashes")}
+    conn.commit()
+    conn.close()
+    return hashes
+
+# Function to read the last document the API accepted for each donor, used to build JSON Patches
+@timed_db("get_sent_payloads")
+def get_sent_payloads(db_path='sample_data.db'):
+    conn = sqlite3.connect(db_path)
+    ensure_payload_hashes_table(conn)
+    payloads = {str(donor_id): json.loads(payload) for donor_id, payload in
+                conn.execute("SELECT DONN_NUMERO, payload FROM payload_hashes WHERE payload IS NOT NULL")}
+    conn.commit()
+    conn.close()
+    return payloads
+
+# Function to record the payloads the API accepted, all in one transaction of the shared writer thread
+@timed_db("save_sent_payloads")
+def save_sent_payloads(items, db_path='sample_data.db'):
+    if not items:
+        return
+    now = time.time()
+    rows = [(donor_id, payload_hash(patient_data), now, json.dumps(patient_data, default=str))
+            for donor_id, patient_data in items]
+
+    def write(conn):
+        ensure_payload_hashes_table(conn)
+        conn.executemany("INSERT OR REPLACE INTO payload_hashes (DONN_NUMERO, payload_hash, sent_at, payload) VALUES (?, ?, ?, ?)",
+                         rows)
+
+    get_db_writer(db_path).submit(write, rows=len(rows)).wait()
+
+# Function to escape a key for use in a JSON Pointer (RFC 6901)
+def _pointer_token(key):
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+def make_json_patch(old, new, path=""):
+    """
+    Function to list the RFC 6902 operations that turn one patient document into another.
+
+    Nested objects such as "hla" are compared field by field, so a single corrected
+    typing becomes one "replace" operation. Lists and other values are replaced whole.
+
+    Args:
+        old (dict): The last document the API accepted.
+        new (dict): The current document built from person_data.
+
+    Returns:
+        list: The patch operations; empty if the documents are equal.
+    """
+    operations = []
+    for key in old:
+        if key not in new:
+            operations.append({"op": "remove", "path": f"{path}/{_pointer_token(key)}"})
+    for key, value in new.items():
+        pointer = f"{path}/{_pointer_token(key)}"
+        if key not in old:
+            operations.append({"op": "add", "path": pointer, "value": value})
+        elif isinstance(old[key], dict) and isinstance(value, dict):
+            operations.extend(make_json_patch(old[key], value, pointer))
+        elif old[key] != value:
+            operations.append({"op": "replace", "path": pointer, "value": value})
+    return operations
+
+# Function to send a single update request to the WMDA API
+def put_patient(patient_data, token):
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json-patch+json",
+        "User-Agent": os.getenv("USER_AGENT")  # Custom User Agent
+    }
+    return get_client().put(api_url(API_PATH), headers=headers, json=patient_data)
+
+# Function to send JSON Patch operations for one patient to the WMDA API
+def patch_patient(wmda_id, operations, token):
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json-patch+json",
+        "User-Agent": os.getenv("USER_AGENT")  # Custom User Agent
+    }
+    return get_client().patch(api_url(f"{API_PATH}/{wmda_id}"), headers=headers, json=operations)
+
+def send_update(patient_data, previous, token, use_patch=False):
+    """
+    Function to send an update as a JSON Patch when possible, falling back to a full PUT.
+
+    A patch is only tried when use_patch is set and the last accepted document is
+    known. If the API rejects the patch with a 4xx error the full document is PUT instead.
+
+    Args:
+        patient_data (dict): The current patient document.
+        previous (dict or None): The last document the API accepted for this patient.
+        token (str): The bearer token used for authentication.
+        use_patch (bool): Try a JSON Patch before a full PUT.
+
+    Returns:
+        tuple: (response, method) where method is "PATCH", "PUT" or None when there was nothing to send.
+    """
+    if use_patch and previous is not None:
+        operations = make_json_patch(previous, patient_data)
+        if not operations:
+            return None, None
+        response = patch_patient(patient_data["wmdaId"], operations, token)
+        if response.status_code in (200, 204) or not 400 <= response.status_code < 500:
+            return response, "PATCH"
+        print(f"Patch for wmdaId {patient_data['wmdaId']} rejected ({response.status_code}); sending the full document.")
+    return put_patient(patient_data, token), "PUT"
+
+# Function to update an existing patient on WMDA
+def update_patient(donor, use_patch=False, db_path='sample_data.db'):
+    
+    # Extracting the data from the donor
+    patient_data = build_update_data(donor)
     
     print("\n=== Patient Data for Update ===")
     print(json.dumps(patient_data, indent=4))
@@ -97,25 +220,211 @@ def update_patient(donor):
     token = get_bearer_token()
     if not token:
         print("Unable to get bearer token. Aborting.")
-        return
+        return False
 
-    # Send a PUT request to update an existing patient
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json-patch+json",
-        "User-Agent": USER_AGENT  # Custom User Agent
-    }
-
-    response = requests.put(API_URL, headers=headers, json=patient_data)
+    # Send a PATCH with only the changed fields, or a PUT to replace the whole patient
+    previous = get_sent_payloads(db_path).get(str(donor.DONN_NUMERO)) if use_patch else None
+    response, method = send_update(patient_data, previous, token, use_patch)
 
-    if response.status_code == 204:
-        print("Patient updated successfully!")
+    if response is None:
+        print("Nothing changed since the last update.")
+        return True
+    if response.status_code in (200, 204):
+        print("Patient updated successfully!" if method == "PUT" else "Patient patched successfully!")
+        save_sent_payloads([(donor.DONN_NUMERO, patient_data)], db_path)
+        # Cached responses about this patient describe the document before the update
+        invalidate_patients([patient_data.get("wmdaId")])
+        return True
     else:
         print(f"Error updating patient: {response.status_code}, Response: {response.text}")
+        return False
+
+# Function to list every donor that already exists on the WMDA, or the given donors
+def get_registered_donors(donor_ids=None, db_path='sample_data.db'):
+    repository = get_person_repository(db_path)
+    if donor_ids is None:
+        return repository.registered_donors()
+    donors = []
+    for donor_id in donor_ids:
+        # Read from the database: a cached row could hide a change that should be sent
+        donor = repository.get(donor_id, fresh=True)
+        if donor:
+            donors.append(donor)
+        else:
+            print(f"Donor {donor_id} not found in database.")
+    return donors
+
+def update_patients_bulk(donor_ids=None, max_workers=DEFAULT_WORKERS, force=False, use_patch=False,
+                         db_path='sample_data.db', resume=False):
+    """
+    Function to update many patients on the WMDA, sending only the ones whose payload changed.
+
+    The hash of every payload the API accepted is stored in payload_hashes. A donor
+    whose current payload has the same hash as the last one sent is skipped, and the
+    changed donors are sent concurrently. With use_patch, each changed donor is sent
+    as a JSON Patch against the last accepted document, falling back to a full PUT.
+
+    The outcome of every donor is also written to the bulk journal as soon as its
+    request finishes. With resume=True the latest unfinished update run is carried
+    on with its original options, and the donors it already updated are not sent again.
+
+    Args:
+        donor_ids (list or None): The donor IDs to update. If None, every donor with a wmdaID is checked.
+            Ignored when resuming.
+        max_workers (int): Maximum number of update requests in flight at once.
+        force (bool): Send every donor even if its payload is unchanged, as a full PUT.
+        use_patch (bool): Send only the changed fields as a JSON Patch when possible.
+        db_path (str): Path of the SQLite database.
+        resume (bool): Continue the latest unfinished update run instead of starting a new one.
+
+    Returns:
+        list: One result dictionary per donor with the keys 'donor_id', 'status'
+        ('updated', 'unchanged', 'failed' or 'skipped') and 'detail'.
+    """
+    journal = BulkJournal("update", db_path)
+    try:
+        if resume:
+            progress = journal.resume()
+            if progress is None:
+                print("No unfinished update run to resume.")
+                return []
+            force, use_patch = journal.options.get("force", False), journal.options.get("use_patch", False)
+            # The run may have stopped before the accepted payloads became the new baseline
+            save_sent_payloads([(donor_id, row[3]) for donor_id, row in progress.items()
+                                if row[0] == DONE and row[3] is not None], db_path)
+            donor_ids = [donor_id for donor_id, row in progress.items() if row[0] not in FINISHED_STATES]
+            print(f"Resuming update run {journal.run_id}: {len(progress) - len(donor_ids)} of {len(progress)} donors already done.")
+            donors = get_registered_donors(donor_ids, db_path)
+            found = {str(donor.DONN_NUMERO) for donor in donors}
+            for donor_id in donor_ids:
+                if donor_id not in found:
+                    journal.record(donor_id, SKIPPED, "Donor not found in database")
+        else:
+            donors = get_registered_donors(donor_ids, db_path)
+            journal.start([donor.DONN_NUMERO for donor in donors], {"force": force, "use_patch": use_patch})
+
+        results = update_journalled(donors, journal, max_workers, force, use_patch, db_path)
+
+        remaining = journal.finish()
+        if remaining:
+            print(f"{remaining} donors of run {journal.run_id} were not updated; run again with --resume to retry them.")
+        return results
+    finally:
+        journal.close()
+
+def update_journalled(donors, journal, max_workers, force, use_patch, db_path):
+    """
+    Function to send the changed donors, recording each outcome in the journal.
+
+    Returns:
+        list: The result dictionaries described in update_patients_bulk().
+    """
+    hashes = get_payload_hashes(db_path)
+    previous = get_sent_payloads(db_path) if use_patch and not force else {}
+    results = []
+    to_send = []
+
+    for donor in donors:
+        if donor.wmdaID in (None, ""):
+            results.append({"donor_id": str(donor.DONN_NUMERO), "status": "skipped", "detail": "No wmdaID yet"})
+            journal.record(donor.DONN_NUMERO, SKIPPED, "No wmdaID yet")
+            continue
+        patient_data = build_update_data(donor)
+        fingerprint = payload_hash(patient_data)
+        if not force and hashes.get(str(donor.DONN_NUMERO)) == fingerprint:
+            results.append({"donor_id": str(donor.DONN_NUMERO), "status": "unchanged", "detail": ""})
+            journal.record(donor.DONN_NUMERO, SKIPPED, "Unchanged")
+        else:
+            to_send.append((donor.DONN_NUMERO, patient_data))
+
+    start_time = time.perf_counter()
+
+    if to_send:
+        # Check for a token up front so a run without credentials stops before sending anything
+        if not get_bearer_token():
+            print("Unable to get bearer token. Aborting.")
+            for donor_id, _ in to_send:
+                results.append({"donor_id": str(donor_id), "status": "failed", "detail": "No bearer token"})
+            return results
+
+        accepted = []
+
+        # Updates replace the whole document (or patch it to the same result), so a row
+        # in flight when the run stops can simply be sent again and is not marked first
+        def update_one(item):
+            donor_id, patient_data = item
+            try:
+                # Fetched per request: the token is cached and only refreshed when it is about to
+                # expire, so a long run never sends an expired one
+                token = get_bearer_token()
+                if not token:
+                    raise RuntimeError("No bearer token")
+                response, method = send_update(patient_data, previous.get(str(donor_id)), token, use_patch)
+            except Exception as e:
+                result = {"donor_id": str(donor_id), "status": "failed", "detail": str(e)}
+            else:
+                if response is None:
+                    result = {"donor_id": str(donor_id), "status": "unchanged", "detail": ""}
+                elif response.status_code in (200, 204):
+                    result = {"donor_id": str(donor_id), "status": "updated", "detail": method}
+                else:
+                    result = {"donor_id": str(donor_id), "status": "failed", "detail": f"{response.status_code}: {response.text}"}
+            # Not waited for: a row lost in a crash is just sent again on resume
+            if result["status"] == "updated":
+                journal.record(donor_id, DONE, method, payload=patient_data, wait=False)
+                accepted.append(item)
+            else:
+                journal.record(donor_id, FAILED if result["status"] == "failed" else SKIPPED, result["detail"] or "Unchanged",
+                               wait=False)
+            return result
+
+        try:
+            sent = run_in_pool(update_one, to_send, max_workers)
+        finally:
+            # Only accepted payloads become the new baseline, so failed rows are retried next run.
+            # This also runs after Ctrl-C, for the rows accepted before the run stopped.
+            save_sent_payloads(accepted, db_path)
+            invalidate_patients([patient_data.get("wmdaId") for _, patient_data in accepted])
+        results.extend(sent)
+
+    elapsed = time.perf_counter() - start_time
+    counts = {status: sum(1 for r in results if r["status"] == status) for status in ("updated", "unchanged", "failed", "skipped")}
+    for result in results:
+        if result["status"] in ("failed", "skipped"):
+            print(f"{result['donor_id']}: {result['status']} ({result['detail']})")
+    print(f"Updated: {counts['updated']}, Unchanged: {counts['unchanged']}, Failed: {counts['failed']}, Skipped: {counts['skipped']}")
+    print(f"Sent {len(to_send)} requests in {elapsed:.2f}s")
+    return results
 
 
 # Main function to run the script
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Update patients on the WMDA from person_data.")
+    parser.add_argument("--all", action="store_true", help="Check every donor with a wmdaID and send the changed ones")
+    parser.add_argument("--ids", nargs="+", help="Donor IDs (DONN_NUMERO) to update")
+    parser.add_argument("--file", help="File with one donor ID per line")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Number of concurrent requests (at most WMDA_MAX_CONCURRENCY)")
+    parser.add_argument("--force", action="store_true", help="Send every donor even if its payload is unchanged")
+    parser.add_argument("--patch", action="store_true", help="Send only the changed fields as a JSON Patch")
+    parser.add_argument("--resume", action="store_true",
+                        help="Carry on with the last bulk update that did not finish, using its original options")
+    args = parser.parse_args(argv)
+
+    if args.resume:
+        update_patients_bulk(max_workers=args.workers, resume=True)
+        export_metrics()
+        return
+
+    if args.all or args.ids or args.file:
+        donor_ids = None
+        if args.ids or args.file:
+            donor_ids = list(args.ids or [])
+            if args.file:
+                donor_ids += read_donor_ids(args.file)
+        update_patients_bulk(donor_ids, max_workers=args.workers, force=args.force, use_patch=args.patch)
+        export_metrics()
+        return
+
     donor_id = input("Enter the donor ID to update: ")
 
     # Retrieve existing patient data from the database
@@ -123,9 +432,10 @@ def main():
 
     if donor:
         # Update patient on WMDA API
-        update_patient(donor)
+        update_patient(donor, use_patch=args.patch)
     else:
         print("Donor not found in database.")
 
 if __name__ == "__main__":
+    load_config()
     main()
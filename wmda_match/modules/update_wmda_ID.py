@@ -1,130 +1,149 @@
-import os
-import sqlite3
-import requests
-import json
-from dotenv import load_dotenv
-
-
-# Load environment variables from the .env file (e.g., API URL, user agent)
-load_dotenv()
-
-# Retrieve API credentials from environment variables
-TENANT_ID = os.getenv("TENANT_ID")
-RESOURCE_ID = os.getenv("RESOURCE_ID")
-CLIENT_ID = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-USER_AGENT = os.getenv("USER_AGENT")  # Loaded from .env file
-API_URL = "https://sandbox-search-api.wmda.info/api/v2/patients"
-    
-def get_bearer_token():
-    # Construct the token URL
-    token_url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/token"
-    
-    # Set headers and payload for the request
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded',
-        'User-Agent': USER_AGENT
-    }
-    payload = {
-        'grant_type': 'client_credentials',
-        'client_id': CLIENT_ID,
-        'client_secret': CLIENT_SECRET,
-        'resource': RESOURCE_ID
-    }
-
-    # Make the request to get the bearer token
-    response = requests.post(token_url, headers=headers, data=payload)
-
-    # Check the response status
-    if response.status_code == 200:
-        token_data = response.json()
-        return token_data['access_token']
-    else:
-        print("Error getting bearer token:", response.status_code, response.text)
-        return None
-
-
-def get_patient_data(bearer_token):
+import argparse
+
+try:
+    from wmda_match.modules.auth import get_bearer_token
+    from wmda_match.modules.patient_pages import iter_patients, DEFAULT_WORKERS
+    from wmda_match.modules.metrics import timed_db, export_metrics
+    from wmda_match.modules.config import load_config
+    from wmda_match.modules.person_repository import get_person_repository, invalidate_person_cache
+    from wmda_match.modules.db_writer import get_db_writer
+except ImportError:  # Running this file directly from wmda_match/modules
+    from auth import get_bearer_token
+    from patient_pages import iter_patients, DEFAULT_WORKERS
+    from metrics import timed_db, export_metrics
+    from config import load_config
+    from person_repository import get_person_repository, invalidate_person_cache
+    from db_writer import get_db_writer
+
+
+def get_patient_data(bearer_token, max_workers=DEFAULT_WORKERS):
     """
-    Function to fetch patient data from an API using a GET request.
+    Function to fetch every patient from the API, following the pagination.
 
     Args:
         bearer_token (str): The Bearer token used for authentication.
+        max_workers (int): Maximum number of pages fetched at the same time.
 
     Returns:
-        list: A list of patient data retrieved from the API.
+        generator: Yields the patient records one at a time, so the whole registry
+        is never held in memory.
     """
+    return iter_patients(bearer_token, max_workers=max_workers)
 
-    # Parameters to send with the API request (limit, offset, etc.)
-    params = {
-        "Limit": 100,  # Set the maximum number of patients per request (100 patients)
-        "OnlyMyPatients": False,  # Whether to return only the patients assigned to the current user
-        "Offset": 0,  # Set the offset to 0 to start from the first page (can be adjusted for pagination)
-    }
-
-    # Headers for the HTTP request, including Authorization (with Bearer token) and Content-Type
-    headers = {
-        "Authorization": f"Bearer {bearer_token}",  # Authentication with Bearer token
-        "Content-Type": "application/json",  # We're sending JSON data
-        "Accept": "application/json",  # We expect the response to be in JSON format
-        "User-Agent": USER_AGENT  # Custom User-Agent for this request
-    }
-
-    # Send a GET request to the API with the above parameters and headers
-    response = requests.get(API_URL, headers=headers, params=params)
-
-    # Check if the request was successful (HTTP status code 200)
-    if response.status_code == 200:
-        # Parse the JSON response and return the 'patients' list
-        response_data = response.json()  # Convert the JSON response to a Python dictionary
-        return response_data['patients']  # Extract and return the list of patients
-    else:
-        # If the request failed, print the error status and message
-        print(f"Failed to retrieve data. Status Code: {response.status_code}")
-        print("Response:", response.text)
-        return []  # Return an empty list if the request fails
-
-def update_wmda_id_in_db(donn_numero, wmda_id):
+@timed_db("update_wmda_id")
+def update_wmda_id_in_db(donn_numero, wmda_id, db_path='sample_data.db'):
     """
     Function to update the wmdaId in the SQLite database for a given donor number.
 
+    The write is queued to the shared writer thread, so concurrent callers share one
+    transaction, and this returns once it has been committed. The donor's cached row
+    is dropped so the next lookup sees the new wmdaId.
+
     Args:
         donn_numero (str): The donor number (DONN_NUMERO) used to identify the record.
         wmda_id (str): The new wmdaId to update in the database.
+        db_path (str): Path of the SQLite database.
+
+    Returns:
+        bool: True if the wmdaId was written, False if it was already populated.
     """
-    # Connect to the SQLite database where donor information is stored
-    conn = sqlite3.connect('sample_data.db')  # Open a connection to the database
-    cursor = conn.cursor()  # Create a cursor to execute SQL commands
-
-    # Query the database to find the existing wmdaId for the given DONN_NUMERO
-    cursor.execute(''' 
-        SELECT wmdaId FROM person_data WHERE DONN_NUMERO = ? 
-    ''', (donn_numero,))  # Use parameterized queries to prevent SQL injection
-    existing_wmda_id = cursor.fetchone()  # Fetch the result of the query
-
-    # Check if the wmdaId is either NULL or empty before updating
-    if existing_wmda_id and (existing_wmda_id[0] == "" or existing_wmda_id[0] is None):
-        # If the wmdaId is empty or NULL, update it with the new wmdaId
-        cursor.execute(''' 
-            UPDATE person_data 
-            SET wmdaId = ? 
-            WHERE DONN_NUMERO = ? 
-        ''', (wmda_id, donn_numero))  # Execute the update query
-        conn.commit()  # Commit the transaction to save changes
+    # Only fill in a wmdaId that is empty or NULL
+    updated = get_person_repository(db_path).set_wmda_ids([(donn_numero, wmda_id)], only_empty=True)
+
+    if updated:
         print(f"Updated wmdaId for DONN_NUMERO {donn_numero} to {wmda_id}")  # Print success message
-    else:
-        # If the wmdaId is already populated, skip the update
-        print(f"wmdaId already populated for DONN_NUMERO {donn_numero}, skipping update.")
+        return True
+    # If the wmdaId is already populated, the update was skipped
+    print(f"wmdaId already populated for DONN_NUMERO {donn_numero}, skipping update.")
+    return False
+
+def _clean_pair(pair):
+    # Returns (DONN_NUMERO, wmdaId) as integers, or None if either is missing or not a number
+    patient_id, wmda_id = pair
+    try:
+        return int(str(patient_id).strip()), int(str(wmda_id).strip())
+    except (TypeError, ValueError):
+        return None
 
-    # Close the database connection to free up resources
-    conn.close()
+@timed_db("update_wmda_ids_bulk")
+def update_wmda_ids_bulk(pairs, db_path='sample_data.db'):
+    """
+    Function to write many wmdaIds to the SQLite database in a single transaction.
+
+    The (patientId, wmdaId) pairs are streamed into a temporary table and applied
+    with one UPDATE, so the database is synced to disk once instead of once per
+    patient. As with update_wmda_id_in_db(), only rows whose wmdaId is empty or
+    NULL are filled in. The write runs on the shared writer thread. Pairs whose
+    patientId or wmdaId is missing or not a number are left out, so they can
+    neither stop the sync nor be matched to the wrong donor.
+
+    Args:
+        pairs (iterable): (patientId, wmdaId) tuples, e.g. from the API patient list.
+        db_path (str): Path of the SQLite database.
 
-def main():
+    Returns:
+        dict: Counts of rows 'updated', 'skipped' (wmdaId already populated),
+        'not_found' (no matching DONN_NUMERO in person_data) and 'invalid'
+        (malformed pairs that were left out).
+    """
+    cleaned = []
+    invalid = 0
+    for pair in pairs:
+        pair = _clean_pair(pair)
+        if pair is None:
+            invalid += 1
+        else:
+            cleaned.append(pair)
+    counts = {}
+
+    def apply(conn):
+        # The writer connection lives on, so start from an empty temp table every time
+        conn.execute("DROP TABLE IF EXISTS temp.api_wmda_ids")
+        conn.execute("CREATE TEMP TABLE api_wmda_ids (DONN_NUMERO INTEGER NOT NULL UNIQUE, wmdaId INTEGER NOT NULL)")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO temp.api_wmda_ids (DONN_NUMERO, wmdaId) VALUES (?, ?)", cleaned)
+
+            # Count how the API rows line up with person_data before updating
+            matched, to_update, total = conn.execute('''
+                SELECT
+                    COUNT(p.DONN_NUMERO),
+                    SUM(CASE WHEN p.DONN_NUMERO IS NOT NULL AND (p.wmdaId IS NULL OR p.wmdaId = '') THEN 1 ELSE 0 END),
+                    COUNT(*)
+                FROM temp.api_wmda_ids AS a
+                LEFT JOIN person_data AS p ON p.DONN_NUMERO = a.DONN_NUMERO
+            ''').fetchone()
+
+            # Fill in every empty or NULL wmdaId with one statement
+            cursor = conn.execute('''
+                UPDATE person_data
+                SET wmdaId = (SELECT a.wmdaId FROM temp.api_wmda_ids AS a WHERE a.DONN_NUMERO = person_data.DONN_NUMERO)
+                WHERE (wmdaId IS NULL OR wmdaId = '')
+                  AND DONN_NUMERO IN (SELECT DONN_NUMERO FROM temp.api_wmda_ids)
+            ''')
+            counts.update(updated=cursor.rowcount, skipped=matched - (to_update or 0), not_found=total - matched)
+        finally:
+            conn.execute("DROP TABLE IF EXISTS temp.api_wmda_ids")
+        return cursor.rowcount
+
+    try:
+        get_db_writer(db_path).submit(apply, rows=max(len(cleaned), 1)).wait()
+    finally:
+        # Rows cached before the update would still show the empty wmdaId
+        invalidate_person_cache(db_path)
+
+    counts["invalid"] = invalid
+    return counts
+
+def main(argv=None):
     """
     Main function to run the entire script. It retrieves the Bearer token,
-    fetches patient data from the API, and updates the wmdaId for each patient
-    in the SQLite database.
+    fetches patient data from the API, and updates the wmdaId for every patient
+    in the SQLite database in a single transaction.
     """
+    parser = argparse.ArgumentParser(description="Fill empty wmdaIDs in person_data from the WMDA patient list.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Number of pages fetched at once (at most WMDA_MAX_CONCURRENCY)")
+    args = parser.parse_args(argv)
+
     # Step 1: Retrieve the Bearer Token for API authentication
     bearer_token = get_bearer_token()  # Get the Bearer token using the helper function
     if not bearer_token:
@@ -133,16 +152,16 @@ def main():
         return
 
     # Step 2: Retrieve patient data from the API using the Bearer token
-    patients = get_patient_data(bearer_token)  # Fetch patient data from the API
-
-    # Step 3: Loop through each patient and update their wmdaId in the database
-    for patient in patients:
-        donn_numero = patient.get('patientId')  # Get the patientId from the API response (matches DONN_NUMERO)
-        wmda_id = patient.get('wmdaId')  # Get the wmdaId for this patient
+    patients = get_patient_data(bearer_token, max_workers=args.workers)  # Fetch patient data from the API
 
-        # If wmdaId is available, update it in the database
-        if wmda_id:
-            update_wmda_id_in_db(donn_numero, wmda_id)
+    # Step 3: Write the (patientId, wmdaId) pair of every patient that has a wmdaId to the database
+    pairs = ((patient.get('patientId'), patient.get('wmdaId')) for patient in patients if patient.get('wmdaId'))
+    counts = update_wmda_ids_bulk(pairs)
+    print(f"Updated {counts['updated']} wmdaIds, skipped {counts['skipped']} already populated, "
+          f"{counts['not_found']} not found in the database, {counts['invalid']} malformed.")
+    export_metrics()
 
 # Run the main function to start the execution
-main()
+if __name__ == "__main__":
+    load_config()
+    main()
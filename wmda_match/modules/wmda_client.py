@@ -0,0 +1,210 @@
+import os
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from wmda_match.modules.rate_limiter import get_rate_limiter, retry_after_seconds, backoff_delay, THROTTLE_STATUSES
+    from wmda_match.modules.metrics import get_metrics
+except ImportError:  # Running this file directly from wmda_match/modules
+    from rate_limiter import get_rate_limiter, retry_after_seconds, backoff_delay, THROTTLE_STATUSES
+    from metrics import get_metrics
+
+# Base URL of the WMDA API; WMDA_API_BASE_URL points the scripts at another server, e.g. fake_wmda.py
+DEFAULT_API_BASE_URL = "https://sandbox-search-api.wmda.info/api/v2"
+
+# Number of keep-alive connections kept open per host
+DEFAULT_POOL_SIZE = 10
+
+# (connect, read) timeouts in seconds applied to every request
+DEFAULT_TIMEOUT = (5, 30)
+
+# Number of times a throttled or failed request is sent again
+DEFAULT_MAX_RETRIES = 4
+
+# Methods that can be sent again without creating duplicates
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# Statuses worth retrying for idempotent methods
+RETRY_STATUSES = THROTTLE_STATUSES | {502, 504}
+
+
+def api_url(path):
+    """
+    Build the full URL of an API endpoint, e.g. api_url("/patients").
+
+    The base URL is read on every call, so it can be set from .env or changed at runtime.
+    """
+    return os.getenv("WMDA_API_BASE_URL", DEFAULT_API_BASE_URL).rstrip("/") + path
+
+
+class WMDAClient:
+    """
+    Connection-pooled HTTP client for the WMDA API.
+
+    All calls share one requests.Session, so the TCP and TLS connections to the
+    API are opened once and reused instead of being set up again for every request.
+
+    When a rate limiter is given, every request waits for it before being sent.
+    Idempotent requests (GET, PUT, ...) that get a 429, 502, 503 or 504, or fail to
+    connect, are retried with jittered exponential backoff. Other requests are only
+    retried on a 429, because the API refused them before doing anything. A
+    Retry-After header pauses all requests through the limiter, not just this one.
+
+    Args:
+        pool_size (int): Maximum number of pooled connections per host.
+        timeout (float or tuple): Default timeout passed to every request.
+        user_agent (str or None): User-Agent header sent with every request.
+        headers (dict or None): Extra default headers sent with every request.
+        token_provider (object or None): Object with a get_token() method; when set,
+            an Authorization header is added to requests that do not carry one.
+        rate_limiter (RateLimiter or None): Limiter every request goes through.
+        max_retries (int): Number of retries for throttled or failed requests.
+        backoff_base (float): Delay before the first retry, doubled on every further retry.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, user_agent=None,
+                 headers=None, token_provider=None, rate_limiter=None, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_base=0.5):
+        self.timeout = timeout
+        self.token_provider = token_provider
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+
+        # Mount a pooled adapter for both schemes so that local test servers also reuse connections
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        if user_agent:
+            self.session.headers["User-Agent"] = user_agent
+        if headers:
+            self.session.headers.update(headers)
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request through the pooled session.
+
+        Args:
+            method (str): HTTP method, e.g. "GET".
+            url (str): Full URL of the endpoint.
+            **kwargs: Any other arguments accepted by requests.Session.request.
+
+        Returns:
+            requests.Response: The response from the API.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+
+        headers = kwargs.get("headers") or {}
+        if self.token_provider is not None and "Authorization" not in headers:
+            token = self.token_provider.get_token()
+            if token:
+                kwargs["headers"] = dict(headers, Authorization=f"Bearer {token}")
+
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            try:
+                response = self._send(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                time.sleep(backoff_delay(attempt, self.backoff_base))
+                attempt += 1
+                continue
+
+            status = response.status_code
+            retryable = status == 429 or (idempotent and status in RETRY_STATUSES)
+            if not retryable or attempt >= self.max_retries:
+                return response
+
+            # Wait as long as the API asked, or back off if it did not say
+            delay = retry_after_seconds(response)
+            if delay is not None and self.rate_limiter is not None:
+                self.rate_limiter.pause(delay)
+            time.sleep(delay if delay is not None else backoff_delay(attempt, self.backoff_base))
+            attempt += 1
+
+    def _send(self, method, url, **kwargs):
+        # Send one request through the limiter, reporting its status and latency back to it
+        # and recording it in the shared metrics
+        if self.rate_limiter is None:
+            with get_metrics().track_request(method, url) as outcome:
+                response = self.session.request(method, url, **kwargs)
+                outcome["status"] = response.status_code
+                return response
+
+        self.rate_limiter.acquire()
+        start = time.monotonic()
+        status = None
+        try:
+            with get_metrics().track_request(method, url) as outcome:
+                response = self.session.request(method, url, **kwargs)
+                outcome["status"] = response.status_code
+            status = response.status_code if isinstance(response.status_code, int) else None
+            return response
+        finally:
+            self.rate_limiter.release(status, time.monotonic() - start)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def close(self):
+        # Close all pooled connections
+        self.session.close()
+
+
+# Shared client used by all the scripts in this package
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return the process-wide WMDAClient, creating it on first use.
+
+    The pool size and timeout can be set with the WMDA_POOL_SIZE and WMDA_TIMEOUT
+    environment variables (WMDA_TIMEOUT is the read timeout in seconds), and the
+    number of retries with WMDA_MAX_RETRIES. Requests go through the shared rate limiter.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            timeout = DEFAULT_TIMEOUT
+            if os.getenv("WMDA_TIMEOUT"):
+                timeout = (DEFAULT_TIMEOUT[0], float(os.getenv("WMDA_TIMEOUT")))
+            _client = WMDAClient(
+                pool_size=int(os.getenv("WMDA_POOL_SIZE", DEFAULT_POOL_SIZE)),
+                timeout=timeout,
+                user_agent=os.getenv("USER_AGENT"),
+                rate_limiter=get_rate_limiter(),
+                max_retries=int(os.getenv("WMDA_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+            )
+        return _client
+
+
+def configure_client(**kwargs):
+    """
+    Replace the shared client with one built from the given WMDAClient arguments.
+
+    Returns:
+        WMDAClient: The new shared client.
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = WMDAClient(**kwargs)
+        return _client
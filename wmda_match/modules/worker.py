@@ -0,0 +1,399 @@
+import os
+import json
+import time
+import random
+import signal
+import socket
+import sqlite3
+import argparse
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    from wmda_match.modules.create_patient import (get_donor_data, create_patient, read_donor_ids, lookup_wmda_ids,
+                                                   save_wmda_ids)
+    from wmda_match.modules.update_patient import get_existing_patient_data, update_patient
+    from wmda_match.modules.create_patient_search import create_patient_search
+    from wmda_match.modules.patientsummary import get_search_id
+    from wmda_match.modules.search_poller import fetch_search_summary, is_search_complete, save_search_result, BASE_DELAY
+    from wmda_match.modules.rate_limiter import backoff_delay, get_rate_limiter
+    from wmda_match.modules.metrics import get_metrics, timed_db, export_metrics
+    from wmda_match.modules.config import load_config
+    from wmda_match.modules.db_writer import get_db_writer
+    from wmda_match.modules.auth import get_bearer_token
+except ImportError:  # Running this file directly from wmda_match/modules
+    from create_patient import get_donor_data, create_patient, read_donor_ids, lookup_wmda_ids, save_wmda_ids
+    from update_patient import get_existing_patient_data, update_patient
+    from create_patient_search import create_patient_search
+    from patientsummary import get_search_id
+    from search_poller import fetch_search_summary, is_search_complete, save_search_result, BASE_DELAY
+    from rate_limiter import backoff_delay, get_rate_limiter
+    from metrics import get_metrics, timed_db, export_metrics
+    from config import load_config
+    from db_writer import get_db_writer
+    from auth import get_bearer_token
+
+# Number of jobs run at once
+DEFAULT_CONCURRENCY = 8
+
+# Seconds to wait before looking for new jobs when the queue is empty
+DEFAULT_POLL_INTERVAL = 1.0
+
+# Failed runs after which a job is given up
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Retry delays for failed jobs: jittered backoff from RETRY_BASE_DELAY up to RETRY_MAX_DELAY seconds
+RETRY_BASE_DELAY = 5.0
+RETRY_MAX_DELAY = 300.0
+
+# A job still marked running after this many seconds belonged to a worker that died, and is run again
+LEASE_SECONDS = 600
+
+# Outcomes a job handler can report
+DONE = "done"
+FAILED = "failed"
+RETRY = "retry"
+WAIT = "wait"
+
+# A claimed job
+Job = namedtuple("Job", ["id", "kind", "donor_id", "payload", "attempts", "max_attempts"])
+
+
+def ensure_jobs_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            donor_id TEXT,
+            payload TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            not_before REAL,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            duration REAL,
+            worker TEXT,
+            result TEXT
+        )
+    ''')
+    # The worker only ever looks for runnable pending jobs
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_jobs_pending ON jobs (not_before, id)
+        WHERE status = 'pending'
+    ''')
+
+
+def _has_value(value):
+    return value is not None and str(value).strip() != ""
+
+
+# --- Job handlers: each takes a Job and the database path and returns (outcome, message) ---
+
+def run_create(job, db_path='sample_data.db'):
+    donor = get_donor_data(job.donor_id, db_path, fresh=True)
+    if not donor:
+        return FAILED, "Donor not found in database"
+    if _has_value(donor.wmdaID):
+        return DONE, f"Already created as wmdaId {donor.wmdaID}"
+    # An earlier run may have timed out or died after its POST reached the WMDA, so look the
+    # donor up before posting again; together with the check above, no donor is posted twice
+    if job.attempts > 1:
+        token = get_bearer_token()
+        if not token:
+            return RETRY, "Unable to get bearer token"
+        wmda_id = lookup_wmda_ids([donor.DONN_NUMERO], token).get(str(donor.DONN_NUMERO))
+        if wmda_id is not None:
+            save_wmda_ids([(donor.DONN_NUMERO, wmda_id)], db_path)
+            return DONE, f"Already created as wmdaId {wmda_id}"
+    return (DONE, "Created") if create_patient(donor, db_path) else (RETRY, "Create failed")
+
+
+def run_update(job, db_path='sample_data.db'):
+    # Read past the cache: another job may have stored the wmdaId since this process cached the row
+    donor = get_existing_patient_data(job.donor_id, db_path, fresh=True)
+    if not donor:
+        return FAILED, "Donor not found in database"
+    use_patch = bool((job.payload or {}).get("patch"))
+    return (DONE, "Updated") if update_patient(donor, use_patch=use_patch, db_path=db_path) else (RETRY, "Update failed")
+
+
+def run_create_search(job, db_path='sample_data.db'):
+    donor = get_donor_data(job.donor_id, db_path, fresh=True)
+    if not donor:
+        return FAILED, "Donor not found in database"
+    if not _has_value(donor.wmdaID):
+        return FAILED, "Donor has no wmdaId yet"
+    if _has_value(donor.SearchID) and not (job.payload or {}).get("force"):
+        return DONE, f"Search {donor.SearchID} already exists"
+    return (DONE, "Search created") if create_patient_search(job.donor_id, db_path) else (RETRY, "Search creation failed")
+
+
+def run_poll_summary(job, db_path='sample_data.db'):
+    search_id = (job.payload or {}).get("search_id") or get_search_id(job.donor_id, db_path)
+    if not _has_value(search_id):
+        return FAILED, "No SearchID for donor"
+    summary = fetch_search_summary(search_id)
+    if summary is None:
+        return RETRY, "Summary could not be retrieved"
+    if not is_search_complete(summary):
+        return WAIT, "Search still running"
+    save_search_result(search_id, [str(job.donor_id)], summary, db_path)
+    return DONE, "Summary stored"
+
+
+# Job kinds and their handlers
+HANDLERS = {
+    "create": run_create,
+    "update": run_update,
+    "create-search": run_create_search,
+    "poll-summary": run_poll_summary,
+}
+
+
+# --- Queue operations ---
+
+def _connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=30)
+    ensure_jobs_table(conn)
+    return conn
+
+
+def enqueue_jobs(kind, donor_ids, payload=None, max_attempts=DEFAULT_MAX_ATTEMPTS, db_path='sample_data.db'):
+    """
+    Function to add jobs to the queue, one per donor.
+
+    Other tools only need this (or a plain INSERT into jobs) to hand work to the worker.
+
+    Args:
+        kind (str): One of HANDLERS, e.g. "create".
+        donor_ids (list): Donor IDs (DONN_NUMERO) to run the job for.
+        payload (dict or None): Options for the handler, e.g. {"patch": True} for updates.
+        max_attempts (int): Failed runs after which a job is given up.
+        db_path (str): SQLite database holding the jobs table.
+
+    Returns:
+        int: The number of jobs added.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind {kind!r}; expected one of {', '.join(HANDLERS)}")
+    now = time.time()
+    encoded = json.dumps(payload) if payload else None
+    rows = [(kind, str(donor_id), encoded, max_attempts, now) for donor_id in donor_ids]
+    conn = _connect(db_path)
+    conn.executemany("INSERT INTO jobs (kind, donor_id, payload, max_attempts, created_at) VALUES (?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return len(rows)
+
+
+@timed_db("claim_jobs")
+def claim_jobs(limit, worker_id, db_path='sample_data.db', now=None):
+    """
+    Function to mark up to limit runnable jobs as running and return them.
+
+    The select and update run in one IMMEDIATE transaction, so two workers never claim the same job.
+
+    Returns:
+        list: The claimed jobs as Job tuples, oldest first.
+    """
+    now = time.time() if now is None else now
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        ensure_jobs_table(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute('''
+            SELECT id, kind, donor_id, payload, attempts, max_attempts FROM jobs
+            WHERE status = 'pending' AND (not_before IS NULL OR not_before <= ?)
+            ORDER BY id LIMIT ?
+        ''', (now, limit)).fetchall()
+        conn.executemany('''
+            UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, worker = ? WHERE id = ?
+        ''', [(now, worker_id, row[0]) for row in rows])
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    return [Job(job_id, kind, donor_id, json.loads(payload) if payload else None, attempts + 1, max_attempts)
+            for job_id, kind, donor_id, payload, attempts, max_attempts in rows]
+
+
+@timed_db("finish_job")
+def finish_job(job, outcome, message, started, db_path='sample_data.db'):
+    """
+    Function to record the outcome of one run of a job.
+
+    Done and failed jobs are final. A job that should be retried goes back to pending
+    after a backoff delay, or is marked failed once it has used max_attempts. A poll
+    that found its search still running is rescheduled without using up an attempt.
+
+    Returns:
+        str: The status the job was left in.
+    """
+    finished = time.time()
+    status, not_before, attempts = outcome, None, job.attempts
+    if outcome == RETRY:
+        if job.attempts >= job.max_attempts:
+            status = FAILED
+        else:
+            status = "pending"
+            not_before = finished + backoff_delay(job.attempts, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+    elif outcome == WAIT:
+        status = "pending"
+        attempts -= 1
+        not_before = finished + BASE_DELAY * random.uniform(0.5, 1.0)
+
+    # Every running job finishes through the one writer thread, so concurrent jobs share a commit
+    get_db_writer(db_path).execute('''
+        UPDATE jobs SET status = ?, attempts = ?, not_before = ?, finished_at = ?, duration = ?, result = ?
+        WHERE id = ?
+    ''', (status, attempts, not_before, finished, finished - started, message, job.id)).wait()
+
+    metrics = get_metrics()
+    metrics.inc("wmda_jobs_total", {"kind": job.kind, "outcome": outcome})
+    metrics.observe("wmda_job_duration_seconds", {"kind": job.kind}, finished - started)
+    return status
+
+
+@timed_db("requeue_stale_jobs")
+def requeue_stale_jobs(db_path='sample_data.db', lease=LEASE_SECONDS):
+    """
+    Function to put jobs left running by a worker that died back in the queue.
+
+    Returns:
+        int: The number of jobs requeued.
+    """
+    conn = _connect(db_path)
+    cursor = conn.execute("UPDATE jobs SET status = 'pending' WHERE status = 'running' AND started_at < ?",
+                          (time.time() - lease,))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount
+
+
+def job_counts(db_path='sample_data.db'):
+    """
+    Function to count the jobs in the queue by kind and status.
+
+    Returns:
+        dict: Counts keyed by (kind, status).
+    """
+    conn = _connect(db_path)
+    rows = conn.execute("SELECT kind, status, COUNT(*) FROM jobs GROUP BY kind, status ORDER BY kind, status").fetchall()
+    conn.close()
+    return {(kind, status): count for kind, status, count in rows}
+
+
+def run_job(job, db_path='sample_data.db'):
+    """
+    Function to run one claimed job and record its outcome.
+
+    An exception in a handler counts as a failed run to be retried.
+
+    Returns:
+        str: The status the job was left in.
+    """
+    started = time.time()
+    try:
+        outcome, message = HANDLERS[job.kind](job, db_path)
+    except Exception as error:
+        outcome, message = RETRY, f"{type(error).__name__}: {error}"
+    if outcome != DONE:
+        print(f"Job {job.id} ({job.kind} {job.donor_id}): {message}")
+    return finish_job(job, outcome, message, started, db_path)
+
+
+def run_worker(db_path='sample_data.db', concurrency=DEFAULT_CONCURRENCY, poll_interval=DEFAULT_POLL_INTERVAL,
+               once=False, stop_event=None):
+    """
+    Function to run queued jobs until stopped, keeping one session, token and rate limiter warm.
+
+    Up to `concurrency` jobs run at once. New jobs are claimed as soon as a slot is
+    free; when the queue is empty the worker checks again every poll_interval seconds.
+
+    Args:
+        db_path (str): SQLite database holding the jobs table.
+        concurrency (int): Number of jobs run at once.
+        poll_interval (float): Seconds between checks of an empty queue.
+        once (bool): Stop when no job is runnable instead of waiting for more.
+        stop_event (threading.Event or None): Set it to stop after the running jobs finish.
+
+    Returns:
+        dict: The number of runs that left a job in each status.
+    """
+    stop_event = stop_event or threading.Event()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    requeued = requeue_stale_jobs(db_path)
+    if requeued:
+        print(f"Requeued {requeued} jobs left running by a stopped worker")
+
+    counts = {}
+    running = set()
+    get_rate_limiter().start_concurrency(concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            if not stop_event.is_set() and len(running) < concurrency:
+                for job in claim_jobs(concurrency - len(running), worker_id, db_path):
+                    running.add(executor.submit(run_job, job, db_path))
+
+            if not running:
+                if once or stop_event.is_set():
+                    break
+                stop_event.wait(poll_interval)
+                continue
+
+            done, running = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                status = future.result()
+                counts[status] = counts.get(status, 0) + 1
+    return counts
+
+
+def main(argv=None):
+    """
+    Main function to run the worker, add jobs to its queue, or show the queue.
+    """
+    parser = argparse.ArgumentParser(description="Run queued WMDA jobs from the jobs table in one long-lived process.")
+    parser.add_argument("--db", default="sample_data.db", help="SQLite database holding the jobs table")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Number of jobs run at once (at most WMDA_MAX_CONCURRENCY)")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="Seconds between checks of an empty queue")
+    parser.add_argument("--once", action="store_true", help="Exit when no job is runnable")
+    parser.add_argument("--enqueue", choices=sorted(HANDLERS), help="Add jobs of this kind instead of running them")
+    parser.add_argument("--ids", nargs="+", help="Donor IDs (DONN_NUMERO) to enqueue")
+    parser.add_argument("--file", help="File with one donor ID per line to enqueue")
+    parser.add_argument("--patch", action="store_true", help="Enqueued updates send a JSON Patch")
+    parser.add_argument("--status", action="store_true", help="Show the number of jobs by kind and status")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        for (kind, status), count in job_counts(args.db).items():
+            print(f"{kind:<15}{status:<10}{count}")
+        return 0
+
+    if args.enqueue:
+        donor_ids = list(args.ids or []) + (read_donor_ids(args.file) if args.file else [])
+        if not donor_ids:
+            parser.error("--enqueue needs --ids or --file")
+        payload = {"patch": True} if args.patch else None
+        added = enqueue_jobs(args.enqueue, donor_ids, payload=payload, db_path=args.db)
+        print(f"Enqueued {added} {args.enqueue} jobs")
+        return 0
+
+    # Finish the running jobs on Ctrl-C or SIGTERM instead of abandoning them mid-request
+    stop_event = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop_event.set())
+
+    print(f"Worker running with {args.concurrency} slots; Ctrl-C to stop")
+    counts = run_worker(args.db, concurrency=args.concurrency, poll_interval=args.poll_interval, once=args.once,
+                        stop_event=stop_event)
+    print(f"Worker stopped: {', '.join(f'{count} {status}' for status, count in sorted(counts.items())) or 'no jobs run'}")
+    export_metrics()
+    return 0
+
+
+if __name__ == "__main__":
+    load_config()
+    main()